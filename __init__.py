@@ -1,6 +1,6 @@
 import os
+import atexit
 import configparser
-import logging.config
 from flask import Flask
 from flask_cors import CORS
 from OpenSSL import SSL
@@ -8,22 +8,64 @@ from api.restx import api
 from flask import Blueprint
 from api.geo3bcn import ns as geo3bcn_namespace
 from api.epos import ns as epos_namespace
+from api.shared.catalog import Catalog
+from api.shared.metadata_cache import metadata_cache
+from api.shared.compression import response_cache, compress_response
+from api.shared.invalidation import Invalidator
+from api.shared.ingest import create_worker
+from api.shared.watcher import create_watcher
+from api.shared.serialization import COMPACT_JSON
+from api.shared.spatial import SpatialIndex, DEFAULT_CELL_SIZE
+from api.shared.search import SearchIndex
+from api.shared.metrics import init_metrics
+from api.shared.tiles import TileStore, DiskTileCache, DEFAULT_CACHE_MB
+from api.shared.render import Renderer, DEFAULT_MAX_DATASETS
+from api.shared.raster import RasterPool, DEFAULT_MAX_HANDLES, statistics_cache
 
 REQUIRED_CONFIG_FIELDS = {
     'paths': ['volcano', 'type', 'incoming', 'temp', 'version', 'trash', 'crt', 'key'],
     'webserver': ['host', 'port'],
+    'asgi': ['threads', 'keepalive', 'limit_concurrency', 'max_body'],
+    'server': ['workers', 'threads', 'keepalive', 'timeout', 'graceful_timeout', 'max_requests', 'preload'],
+    'cache': ['metadata_max_entries', 'response_max_entries'],
+    'bulk': ['threads', 'max_items'],
+    'points': ['max_points', 'max_handles'],
+    'pagination': ['max_limit'],
+    'spatial': ['cell_size'],
+    'tiles': ['cache_mb', 'disk_cache_mb', 'disk_cache_path', 'max_datasets'],
+    'metrics': ['enabled'],
+    'serialization': ['compact_json'],
+    'http_cache': ['image', 'kml', 'file', 'metadata', 'summary', 'tile'],
+    'compression': ['min_size', 'gzip_level'],
+    'tiling': ['max_cores', 'processes_per_file', 'url', 'zoom', 'archive', 'cog'],
+    'ingest': ['enabled', 'interval', 'settle_seconds', 'tile'],
+    'watcher': ['enabled', 'backend', 'poll_interval', 'debounce'],
     'flask': ['SERVER_NAME', 'DEBUG', 'SWAGGER_UI_DOC_EXPANSION', 'RESTX_VALIDATE',
               'RESTX_MASK_SWAGGER', 'RESTX_ERROR_404_HELP']
 }
 
 
-def initialize_app(flask_app, log, config_file_path):
+def initialize_app(flask_app, log, config_file_path, background=True):
     """
     Initializes the Flask application with configurations, logging, and API namespaces.
 
     :param flask_app: Instance of the Flask app
+    :param background: Start the ingestion and watcher threads, False when the app is forked into workers
     """
     set_config(flask_app, log, config_file_path)
+    if str(flask_app.config['serialization'].get('compact_json', 'false')).lower() == 'true':
+        # Compact UTF-8 JSON, which orjson can encode on the hot endpoints
+        flask_app.config['RESTX_JSON'] = dict(COMPACT_JSON)
+    build_catalog(flask_app)
+    metadata_cache.configure(flask_app.config['cache'].get('metadata_max_entries', metadata_cache.max_entries))
+    response_cache.configure(flask_app.config['cache'].get('response_max_entries', response_cache.max_entries))
+    if str(flask_app.config['metrics'].get('enabled', 'false')).lower() == 'true':
+        # Registered before compression, whose after_request hook therefore runs first
+        init_metrics(flask_app, {'metadata_cache': metadata_cache, 'statistics_cache': statistics_cache,
+                                 'response_cache': response_cache})
+    flask_app.after_request(compress_response)
+    if background:
+        start_background(flask_app)
     # Registering API namespaces
     api.add_namespace(geo3bcn_namespace)
     api.add_namespace(epos_namespace)
@@ -48,27 +90,95 @@ def set_config(flask_app, log, config_file_path):
             try:
                 value = config.get(section, option)
                 flask_app.config[section][option] = value if section != 'flask' else flask_app.config[option]
-            except configparser.NoOptionError:
+            except (configparser.NoSectionError, configparser.NoOptionError):
                 log.error(f"ERROR, {section} {option} not set, check your config.ini.")
 
     flask_app.config['paths']['current'] = os.path.dirname(os.path.abspath(__file__)) + '/'
 
 
-def create_app(log, config_file_path):
+def build_catalog(flask_app):
+    """
+    Indexes the volcanoes directory once and shares the catalog with every endpoint, together with the
+    invalidator that keeps it and the other caches up to date, the spatial index of the volcanoes and maps,
+    the search index of the map metadata, the cache of the map tiles and the raster handles of the point queries.
+
+    :param flask_app: Instance of the Flask app
+    """
+    paths = flask_app.config['paths']
+    catalog = Catalog(os.path.join(paths['current'], paths['volcano']))
+    flask_app.extensions['catalog'] = catalog.rebuild()
+    flask_app.extensions['invalidator'] = invalidator = Invalidator(catalog)
+
+    cell_size = float(flask_app.config['spatial'].get('cell_size') or DEFAULT_CELL_SIZE)
+    flask_app.extensions['spatial_index'] = spatial_index = SpatialIndex(catalog, cell_size).rebuild()
+    spatial_index.subscribe(invalidator)
+
+    flask_app.extensions['search_index'] = search_index = SearchIndex(catalog).rebuild()
+    search_index.subscribe(invalidator)
+
+    tiles = flask_app.config['tiles']
+    disk_cache = None
+    disk_cache_mb = float(tiles.get('disk_cache_mb') or 0)
+    if disk_cache_mb > 0 and tiles.get('disk_cache_path'):
+        disk_cache = DiskTileCache(os.path.join(paths['current'], tiles['disk_cache_path']),
+                                   int(disk_cache_mb * 1024 * 1024))
+    cache_mb = float(tiles.get('cache_mb') or DEFAULT_CACHE_MB)
+    renderer = Renderer(max_datasets=int(tiles.get('max_datasets') or DEFAULT_MAX_DATASETS))
+    flask_app.extensions['tile_store'] = tile_store = TileStore(catalog, int(cache_mb * 1024 * 1024), renderer,
+                                                                disk_cache)
+    tile_store.subscribe(invalidator)
+
+    max_handles = int(flask_app.config['points'].get('max_handles') or DEFAULT_MAX_HANDLES)
+    flask_app.extensions['raster_pool'] = RasterPool(max_handles)
+
+
+def start_background(flask_app):
+    """
+    Starts the background threads of the application. Threads do not survive a fork, so pre-fork servers
+    call this in each worker.
+
+    :param flask_app: Instance of the Flask app
+    """
+    start_ingestion(flask_app)
+    start_watcher(flask_app)
+
+
+def start_ingestion(flask_app):
+    """
+    Starts the worker that publishes the bundles uploaded to the incoming directory, if enabled.
+
+    :param flask_app: Instance of the Flask app
+    """
+    if str(flask_app.config['ingest'].get('enabled', 'false')).lower() != 'true':
+        return
+    worker = create_worker(flask_app.config['paths']['current'], flask_app.config,
+                           flask_app.extensions['invalidator'])
+    worker.start()
+    atexit.register(worker.stop)
+    flask_app.extensions['ingestion'] = worker
+
+
+def start_watcher(flask_app):
+    """
+    Starts the watcher that invalidates the caches when the volcanoes directory changes, if enabled.
+
+    :param flask_app: Instance of the Flask app
+    """
+    if str(flask_app.config['watcher'].get('enabled', 'false')).lower() != 'true':
+        return
+    watcher = create_watcher(flask_app.config['watcher'], flask_app.extensions['invalidator'])
+    watcher.start()
+    atexit.register(watcher.stop)
+    flask_app.extensions['watcher'] = watcher
+
+
+def create_app(log, config_file_path, background=True):
     # Configurable parameters
 
     # SSL Context setup
     context = SSL.Context(SSL.SSLv23_METHOD)
     app = Flask(__name__)
     # CORS(app)
-    initialize_app(app, log, config_file_path)
+    initialize_app(app, log, config_file_path, background)
     CORS(app, resources={r"/api/*": {"origins": ["http://localhost:8080"]}})
     return app
-
-
-def create_log():
-    # Configuración de logging
-    logging_conf_path = os.path.normpath(os.path.join(os.path.dirname(__file__), './logging.conf'))
-    logging.config.fileConfig(logging_conf_path)
-    log = logging.getLogger(__name__)
-    return log
@@ -1,20 +1,29 @@
 import logging
 import os
-from flask import request, jsonify, send_from_directory, abort
+import json
+from flask import request, jsonify, abort, Response
 from flask_restx import Resource
-
-# Importing custom Excel parser utilities for processing spreadsheet data
-import api.shared.xlsx_parser as xlp
+from werkzeug.utils import safe_join
 
 from flask import current_app as app
 from api.restx import api
 
 # Importing serializers for data validation and schema definition
-from api.epos.serializers import type_summary, _type, map_parameters
-from api.geo3bcn.serializers import map_summary, metadata
+from api.epos.serializers import type_summary, _type, map_parameters, bulk_parameters, search_result, search_parser, \
+    point_parameters, point_values, point_parser
+from api.geo3bcn.serializers import map_summary, metadata, page_parser, fields_parser
 
 # Importing helper functions for retrieving map data
-from api.epos.helpers import get_map_summary, get_map
+from api.epos.helpers import get_map_summary, get_map, get_map_paths, get_maps, expand_map_items, \
+    get_bulk_executor, DEFAULT_BULK_THREADS, DEFAULT_BULK_MAX_ITEMS
+from api.shared.catalog import get_catalog
+from api.shared.compression import cached_response
+from api.shared.serialization import compile_model, json_response, select_fields
+from api.shared.query import page_arguments, paginate, page_response, fields_argument
+from api.shared.search import get_search_index, CATALOG_FACETS, FACETS, MAX_LIMIT
+from api.shared.raster import get_raster_pool, sample_points, get_statistics, DEFAULT_MAX_POINTS
+from api.shared.http_cache import send_cached_file, metadata_validators, is_not_modified, not_modified_response, \
+    validator_headers
 
 # Setting up logging for this module
 log = logging.getLogger(__name__)
@@ -27,6 +36,9 @@ description = 'This namespace houses all the endpoints that support Volcanbox Se
 
 ns = api.namespace('epos', description=description)
 
+# Projection of the search response model, compiled once
+project_search_result = compile_model(search_result)
+
 # Endpoint for retrieving files stored in the configured directories
 @ns.route('/getfile/<path:path>', methods=['GET'])
 class getFile(Resource):
@@ -37,8 +49,10 @@ class getFile(Resource):
     def get_file(self, path):
         # Attempts to serve a file from the directory specified in the application's configuration
         try:
-            return send_from_directory(app.config['paths']['current'] + app.config['paths']['volcano'], path,
-                                       as_attachment=True)
+            filepath = safe_join(get_catalog().root, path)
+            if filepath is None:
+                raise FileNotFoundError(path)
+            return send_cached_file(filepath, None, 'file', as_attachment=True)
         except:
             # Returns an error message if file retrieval fails
             return "Oops! File not available"
@@ -46,30 +60,41 @@ class getFile(Resource):
 @api.marshal_with(type_summary)
 @ns.route('/type-summary')
 class type_summary(Resource):
+    @api.expect(page_parser)
     def post(self):
         """
         POST: Returns a summary of types based on the current configuration paths.
         Attempts to retrieve and return a summary of types. If an error occurs,
         logs the error and returns an appropriate message to the client.
         """
+        after, limit = page_arguments()
         try:
-            # Attempt to get the types summary from the configured paths
-            d = xlp.get_types_summary(app.config['paths']['current'], app.config['paths']['volcano'])
-            return jsonify(d)
+            # Serve the types summary of the catalog index, serialized and compressed once per catalog version
+            catalog = get_catalog()
+
+            def build():
+                types, headers = paginate(catalog.type_names(), after, limit)
+                response = jsonify(types)
+                response.headers.extend(headers)
+                return response
+            return cached_response(('epos-type-summary', 'POST', after, limit), catalog.version, build)
         except Exception as e:
             # Log the exception and return a 500 Internal Server Error status to the client
             log.error(f"Failed to get types summary: {e}")
             abort(500, "Failed to retrieve types summary due to an internal server error.")
 
+    @api.expect(page_parser)
     def get(self):
         """
         GET: Returns a summary of types for GET requests.
         Similar to the POST method, it retrieves and returns a summary of types,
         handling any errors that occur during the process.
         """
+        after, limit = page_arguments()
         try:
-            d = xlp.get_types_summary(app.config['paths']['current'], app.config['paths']['volcano'])
-            return d
+            catalog = get_catalog()
+            return cached_response(('epos-type-summary', 'GET', after, limit), catalog.version,
+                                   lambda: page_response(catalog.type_names(), after, limit))
         except Exception as e:
             log.error(f"Failed to get types summary: {e}")
             abort(500, "Failed to retrieve types summary due to an internal server error.")
@@ -79,21 +104,23 @@ class type_summary(Resource):
 @ns.route('/map-summary/<type>', methods=['GET'])
 @ns.route('/map-summary', methods=['POST'])
 class map_summary(Resource):
-    @api.expect(_type, validate=True)
+    @api.expect(_type, page_parser, validate=True)
     def post(self):
         """
         POST: Returns a list of volcanoes and their available map types based on a specified type.
         Validates input and handles errors gracefully, providing meaningful feedback to the client.
         """
+        after, limit = page_arguments()
         try:
             # Retrieve the type from the request
             type = str(request.json['type'])
             if not type:
                 ns.abort(400, "Type parameter is required.")
 
-            # Attempt to retrieve map summary data
-            response = get_map_summary(app.config['paths']['current'], app.config['paths']['volcano'], type)
-            return response
+            # Retrieve the map summary data, serialized and compressed once per catalog version
+            catalog = get_catalog()
+            return cached_response(('epos-map-summary', type, after, limit), catalog.version,
+                                   lambda: page_response(get_map_summary(catalog, type), after, limit))
         except KeyError:
             # Handle case where type is not found
             ns.abort(404, f"Type '{type}' not found.")
@@ -102,17 +129,20 @@ class map_summary(Resource):
             log.error(f"Error retrieving map summaries for type '{type}': {e}")
             ns.abort(500, "Internal server error while retrieving map summaries.")
 
+    @api.expect(page_parser)
     def get(self, type):
         """
         GET: Serves a list of available map types for a given volcano, specified by the 'type' URL parameter.
         Performs similar error handling as the POST method to ensure consistent behavior.
         """
+        after, limit = page_arguments()
         try:
             if not type:
                 ns.abort(400, "Type parameter is required in the URL.")
 
-            response = get_map_summary(app.config['paths']['current'], app.config['paths']['volcano'], type)
-            return response
+            catalog = get_catalog()
+            return cached_response(('epos-map-summary', type, after, limit), catalog.version,
+                                   lambda: page_response(get_map_summary(catalog, type), after, limit))
         except KeyError:
             ns.abort(404, f"Type '{type}' not found.")
         except Exception as e:
@@ -124,12 +154,13 @@ class map_summary(Resource):
 @ns.route('/map-metadata/<_type>/<volcano>', methods=['GET'])
 @ns.route('/map-metadata', methods=['POST'])
 class map_metadata(Resource):
-    @api.expect(map_parameters, validate=True)
+    @api.expect(map_parameters, fields_parser, validate=True)
     def post(self):
         """
         POST: Returns metadata for a given map and volcano based on provided parameters.
         Includes error handling to manage missing parameters, data retrieval issues, and other exceptions.
         """
+        mask = fields_argument()
         try:
             volcano = str(request.json.get('volcano'))
             map_type = str(request.json.get('type'))
@@ -137,31 +168,165 @@ class map_metadata(Resource):
             if not volcano or not map_type:
                 ns.abort(400, "Both 'volcano' and 'type' parameters are required.")
 
-            response = get_map(app.config['paths']['current'], app.config['paths']['volcano'], volcano, map_type)
+            catalog = get_catalog()
+            etag, last_modified = metadata_validators(get_map_paths(catalog, volcano, map_type))
+            response = get_map(catalog, volcano, map_type)
             if not response:
                 ns.abort(404, f"Metadata for map '{map_type}' and volcano '{volcano}' not found.")
-            return response
+            if 'error' not in response:
+                response['statistics'] = get_statistics(catalog, volcano, map_type)
+                response = select_fields(response, mask)
+            return json_response(response, 200, validator_headers(etag, last_modified, 'metadata'))
         except KeyError:
             ns.abort(404, "Specified map type or volcano does not exist.")
         except Exception as e:
             log.error(f"Error retrieving metadata for map '{map_type}' and volcano '{volcano}': {e}")
             ns.abort(500, "Internal server error while retrieving map metadata.")
 
+    @api.expect(fields_parser)
     def get(self, _type, volcano):
         """
         GET: Similar to POST, it returns metadata for a specified map and volcano.
         Handles errors gracefully and ensures meaningful feedback is provided to the client.
         """
+        mask = fields_argument()
         try:
             if not _type or not volcano:
                 ns.abort(400, "URL must include both map type and volcano name.")
 
-            response = get_map(app.config['paths']['current'], app.config['paths']['volcano'], volcano, _type)
+            # Answer revalidations from the workbook versions, before parsing anything
+            catalog = get_catalog()
+            etag, last_modified = metadata_validators(get_map_paths(catalog, volcano, _type))
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, last_modified, 'metadata')
+
+            response = get_map(catalog, volcano, _type)
             if not response:
                 ns.abort(404, f"Metadata for map '{_type}' and volcano '{volcano}' not found.")
-            return response
+            if 'error' not in response:
+                response['statistics'] = get_statistics(catalog, volcano, _type)
+                response = select_fields(response, mask)
+            return json_response(response, 200, validator_headers(etag, last_modified, 'metadata'))
         except KeyError:
             ns.abort(404, "Specified map type or volcano does not exist.")
         except Exception as e:
             log.error(f"Error retrieving metadata for map '{_type}' and volcano '{volcano}': {e}")
             ns.abort(500, "Internal server error while retrieving map metadata.")
+
+
+@ns.route('/map-metadata/bulk', methods=['POST'])
+class map_metadata_bulk(Resource):
+    @api.expect(bulk_parameters, validate=True)
+    def post(self):
+        """
+        POST: Returns the metadata of many (volcano, type) pairs in one response, resolved in parallel.
+        Items that fail carry their own 'error' and 'status' instead of failing the whole request.
+        With 'stream' set, results are sent as NDJSON, one line per item, as soon as they are available.
+        """
+        options = app.config.get('bulk', {})
+        catalog = get_catalog()
+        pairs = expand_map_items(catalog, request.json.get('items') or [])
+        if not pairs:
+            ns.abort(400, "At least one item is required.")
+        max_items = int(options.get('max_items') or DEFAULT_BULK_MAX_ITEMS)
+        if len(pairs) > max_items:
+            ns.abort(413, f"At most {max_items} maps can be requested at once.")
+
+        results = get_maps(catalog, pairs, get_bulk_executor(int(options.get('threads') or DEFAULT_BULK_THREADS)))
+        if request.json.get('stream'):
+            lines = (json.dumps(result, ensure_ascii=False) + '\n' for result in results)
+            return Response(lines, mimetype='application/x-ndjson')
+        results = list(results)
+        return json_response({'results': results, 'errors': sum(1 for result in results if 'error' in result)})
+
+
+@ns.route('/search', methods=['GET'])
+class search(Resource):
+    @api.expect(search_parser)
+    @api.response(200, 'Success', search_result)
+    def get(self):
+        """
+        GET: Returns the maps matching facet filters and keywords, one page at a time, with facet counts.
+        Repeated values of a facet are alternatives, while different facets and keywords must all match.
+        """
+        args = search_parser.parse_args()
+        if args['offset'] < 0 or not 1 <= args['limit'] <= MAX_LIMIT:
+            ns.abort(400, f"'offset' must be positive and 'limit' between 1 and {MAX_LIMIT}.")
+        filters = {facet: args[facet] for facet in CATALOG_FACETS + tuple(FACETS) if args[facet]}
+        result = get_search_index().search(filters, args['q'], args['offset'], args['limit'])
+        return json_response(project_search_result(result), 200)
+
+
+def read_point_values(map_type, volcano, lons, lats, band):
+    """
+    Reads the raster of a map at WGS84 points, for both point value endpoints.
+
+    Args:
+        map_type (str): Type of map.
+        volcano (str): Name of the volcano.
+        lons (list): Longitudes of the points.
+        lats (list): Latitudes of the points.
+        band (int): Band of the raster, from 1.
+
+    Returns:
+        Response: The values at each point, in request order, null where the map has no value.
+    """
+    if not map_type or not volcano:
+        ns.abort(400, "Both 'volcano' and 'type' parameters are required.")
+    if not lons or len(lons) != len(lats):
+        ns.abort(400, "At least one point is required, each with a longitude and a latitude.")
+    max_points = int(app.config.get('points', {}).get('max_points') or DEFAULT_MAX_POINTS)
+    if len(lons) > max_points:
+        ns.abort(413, f"At most {max_points} points can be requested at once.")
+    path = get_catalog().raster_path(volcano, map_type)
+    if path is None:
+        ns.abort(404, f"Raster for map '{map_type}' and volcano '{volcano}' not found.")
+
+    try:
+        with get_raster_pool().dataset(path) as handle:
+            values = sample_points(handle, lons, lats, band)
+    except ValueError as e:
+        ns.abort(400, str(e))
+    except Exception as e:
+        log.error(f"Error reading raster {path} at {len(lons)} points: {e}")
+        ns.abort(500, "Internal server error while reading the raster.")
+    return json_response({'type': map_type, 'volcano': volcano, 'band': band,
+                          'values': [None if value != value else value for value in values.tolist()]})
+
+
+@ns.route('/point-values/<_type>/<volcano>', methods=['GET'])
+@ns.route('/point-values', methods=['POST'])
+class map_point_values(Resource):
+    # Checked below rather than by the JSON schema, which takes longer than the reads on large batches
+    @api.expect(point_parameters)
+    @api.response(200, 'Success', point_values)
+    def post(self):
+        """
+        POST: Returns the values of the raster of a map at many [longitude, latitude] points, in WGS84.
+        Points outside the map or where it has no data get null values.
+        """
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            ns.abort(400, "A JSON object is required.")
+        map_type, volcano, band = payload.get('type'), payload.get('volcano'), payload.get('band', 1)
+        if not isinstance(map_type, str) or not isinstance(volcano, str):
+            ns.abort(400, "Both 'volcano' and 'type' parameters are required.")
+        if not isinstance(band, int) or isinstance(band, bool):
+            ns.abort(400, "'band' must be an integer.")
+        points = payload.get('points')
+        if not isinstance(points, list) or any(
+                not isinstance(point, list) or len(point) != 2 or not all(
+                    isinstance(coordinate, (int, float)) and not isinstance(coordinate, bool) for coordinate in point)
+                for point in points):
+            ns.abort(400, "Points must be [longitude, latitude] pairs.")
+        return read_point_values(map_type, volcano, [point[0] for point in points], [point[1] for point in points],
+                                 band)
+
+    @api.expect(point_parser)
+    @api.response(200, 'Success', point_values)
+    def get(self, _type, volcano):
+        """
+        GET: Similar to POST, with the points given as repeated 'lon' and 'lat' query parameters.
+        """
+        args = point_parser.parse_args()
+        return read_point_values(_type, volcano, args['lon'], args['lat'], args['band'])
@@ -1,30 +1,36 @@
-import os
-import api.shared.xlsx_parser as xlp
-
-import os
-import api.shared.xlsx_parser as xlp
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from api.shared.metadata_cache import metadata_cache
+from api.shared.raster import get_statistics
 import logging
 
 # Initialize logging
 log = logging.getLogger(__name__)
 
-def get_map(current_folder, volcanoes_path, volcano, map_type):
+WILDCARD = '*'
+DEFAULT_BULK_THREADS = 8
+DEFAULT_BULK_MAX_ITEMS = 1000
+
+# Pool shared by the bulk requests of the process, created on first use
+_bulk_executor = None
+_bulk_executor_lock = threading.Lock()
+
+def get_map(catalog, volcano, map_type):
     """
     Fetches map metadata from an Excel file based on the specified volcano and map type.
 
     Args:
-        current_folder (str): The base directory where volcano data is stored.
-        volcanoes_path (str): The subdirectory within current_folder that contains volcano data.
+        catalog (Catalog): Index of the volcanoes directory.
         volcano (str): The name of the volcano for which metadata is being requested.
         map_type (str): The type of map for which metadata is being requested.
 
     Returns:
         dict: Parsed data from the Excel file if available, else an error message.
     """
-    path = os.path.join(current_folder, volcanoes_path, volcano, 'metadata', map_type + ".xlsx")
+    path = catalog.metadata_path(volcano, map_type)
     try:
-        # Attempt to parse the Excel file and return its content
-        return xlp.parse_xlsx(path)
+        # Return the parsed Excel file, parsing it only if it is not cached or has changed
+        return metadata_cache.get(path)
     except FileNotFoundError:
         # Log and return a meaningful error message if the file doesn't exist
         log.error(f"File not found: {path}")
@@ -35,25 +41,123 @@ def get_map(current_folder, volcanoes_path, volcano, map_type):
         return {"error": "Oops! File not available"}
 
 
-def get_map_summary(current_path, volcanoes_path, map_type):
+def get_map_paths(catalog, volcano, map_type):
+    """
+    Resolves the files a map metadata response is built from, to validate it.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        volcano (str): The name of the volcano.
+        map_type (str): The type of map.
+
+    Returns:
+        list: Paths to the metadata workbook and to the statistics of the map raster.
+    """
+    return [catalog.metadata_path(volcano, map_type), catalog.statistics_path(volcano, map_type)]
+
+
+def get_map_summary(catalog, map_type):
     """
     Lists all available maps of a specified type across all volcanoes.
 
     Args:
-        current_path (str): The base directory where volcano data is stored.
-        volcanoes_path (str): The subdirectory within current_path that contains volcano data.
+        catalog (Catalog): Index of the volcanoes directory.
         map_type (str): The type of map for which a summary list is being requested.
 
     Returns:
         list: A list of map names available for the specified map type.
     """
-    # Construct the path to the directory containing the maps
-    path = os.path.join(current_path, volcanoes_path)
-
     try:
-        # Return the list of available map names
-        return xlp.map_name_list(path, map_type)
+        # Return the list of volcanoes that provide the map type
+        return catalog.volcanoes_for_type(map_type)
     except Exception as e:
         # Log the error and return an empty list or error message
-        log.error(f"An error occurred while listing maps for type '{map_type}' at path '{path}': {e}")
+        log.error(f"An error occurred while listing maps for type '{map_type}': {e}")
         return {"error": "Unable to fetch map summary"}
+
+
+def get_bulk_executor(threads=DEFAULT_BULK_THREADS):
+    """
+    Args:
+        threads (int): Size of the pool, only used when the pool is created.
+
+    Returns:
+        ThreadPoolExecutor: The pool resolving the items of bulk metadata requests.
+    """
+    global _bulk_executor
+    with _bulk_executor_lock:
+        if _bulk_executor is None:
+            _bulk_executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='bulk-metadata')
+        return _bulk_executor
+
+
+def expand_map_items(catalog, items):
+    """
+    Expands the (volcano, type) pairs of a bulk request, a '*' volcano standing for every volcano of the type.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        items (list): Dictionaries with 'volcano' and 'type' keys.
+
+    Returns:
+        list: (volcano, type) tuples, a wildcard of an unknown type is kept as is and reported as not found.
+    """
+    pairs = []
+    for item in items:
+        volcano, map_type = str(item.get('volcano') or ''), str(item.get('type') or '')
+        if volcano == WILDCARD:
+            pairs.extend((name, map_type) for name in catalog.volcanoes_for_type(map_type) or [WILDCARD])
+        else:
+            pairs.append((volcano, map_type))
+    return pairs
+
+
+def resolve_map(catalog, volcano, map_type):
+    """
+    Fetches the metadata of one item of a bulk request.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        volcano (str): The name of the volcano.
+        map_type (str): The type of map.
+
+    Returns:
+        dict: The volcano and type, with either their 'metadata' and raster 'statistics' or an 'error'
+            message and HTTP 'status'.
+    """
+    result = {'volcano': volcano, 'type': map_type}
+    try:
+        if not volcano or not map_type:
+            return dict(result, error="Both 'volcano' and 'type' are required.", status=400)
+        if map_type not in catalog.maps_for_volcano(volcano):
+            return dict(result, error='Map not found.', status=404)
+        result['metadata'] = metadata_cache.get(catalog.metadata_path(volcano, map_type))
+        result['statistics'] = get_statistics(catalog, volcano, map_type)
+        return result
+    except (KeyError, FileNotFoundError):
+        return dict(result, error='Map not found.', status=404)
+    except Exception as e:
+        log.error(f"An error occurred while fetching the metadata of {map_type} for {volcano}: {e}")
+        return dict(result, error='Internal server error while retrieving map metadata.', status=500)
+
+
+def get_maps(catalog, pairs, executor):
+    """
+    Fetches the metadata of many maps in parallel.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        pairs (list): (volcano, type) tuples.
+        executor (Executor): Pool resolving the items.
+
+    Returns:
+        iterator: One resolve_map result per pair, in the order of the pairs, yielded as soon as available.
+    """
+    futures = [executor.submit(resolve_map, catalog, volcano, map_type) for volcano, map_type in pairs]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # Drop the pending items when a streamed response is abandoned by the client
+        for future in futures:
+            future.cancel()
@@ -1,5 +1,6 @@
 from flask_restx import fields
 from api.restx import api
+from api.shared.search import FACETS, DEFAULT_LIMIT
 
 # Define the basic fields for the API models with descriptions.
 # These fields represent common attributes for epos related models.
@@ -33,6 +34,37 @@ map_parameters = api.model('Needed parameters to get map metadata',
                                'volcano': epos_fields['volcano'],
                            })
 
+# Define the 'bulk_parameters' model for requesting the metadata of many maps at once.
+# A '*' volcano stands for every volcano that provides the type.
+bulk_parameters = api.model('Needed parameters to get the metadata of many maps',
+                            {
+                                'items': fields.List(fields.Nested(map_parameters), required=True,
+                                                     description="Maps to fetch, use '*' as volcano for all the "
+                                                                 "volcanoes of a type"),
+                                'stream': fields.Boolean(default=False,
+                                                         description='Stream one JSON result per line (NDJSON)'),
+                            })
+
+# Define the 'point_parameters' model for reading the raster of a map at many points at once.
+point_parameters = api.model('Needed parameters to read the raster of a map at points',
+                             {
+                                 'type': epos_fields['type'],
+                                 'volcano': epos_fields['volcano'],
+                                 'points': fields.List(fields.List(fields.Float), required=True,
+                                                       description='[longitude, latitude] pairs, in WGS84'),
+                                 'band': fields.Integer(default=1, description='Band of the raster, from 1'),
+                             })
+
+# Define the 'point_values' model for the values read at each point, null outside the map or without data.
+point_values = api.model('Values of the raster of a map at points',
+                         {
+                             'type': epos_fields['type'],
+                             'volcano': epos_fields['volcano'],
+                             'band': fields.Integer(description='Band of the raster, from 1'),
+                             'values': fields.List(fields.Float,
+                                                   description='Value at each point, in request order, or null'),
+                         })
+
 # Define the 'type_summary' model.
 # This model is used to return a summary of available types, structured as a list of '_type' models.
 type_summary = api.model(
@@ -40,3 +72,43 @@ type_summary = api.model(
     {
         'available_types': fields.List(fields.Nested(_type)),
     })
+
+# Define the 'search_hit' model for a map found by the search endpoint.
+search_hit = api.model('Map found by a search',
+                       {
+                           'volcano': epos_fields['volcano'],
+                           'type': epos_fields['type'],
+                           'name': fields.String(readOnly=True, description='Name of the map'),
+                       })
+
+# Define the 'search_result' model for a page of search results.
+# Facets map each facet to its values and the number of maps that would match each of them.
+search_result = api.model('Page of maps matching a search',
+                          {
+                              'total': fields.Integer(description='Number of matching maps'),
+                              'offset': fields.Integer(description='Number of skipped maps'),
+                              'limit': fields.Integer(description='Maximum number of maps in the page'),
+                              'results': fields.List(fields.Nested(search_hit)),
+                              'facets': fields.Raw(description="Values of each facet as {'value', 'count'} "
+                                                               "objects, by decreasing count"),
+                          })
+
+# Define the query parameters of the search endpoint.
+# Every facet can be repeated to accept several values, e.g. ?category=Hazard&category=Risk.
+search_parser = api.parser()
+search_parser.add_argument('q', type=str, location='args', help='Keywords searched in the map names and tag keywords')
+search_parser.add_argument('volcano', type=str, action='append', location='args', help='Accepted volcano')
+search_parser.add_argument('type', type=str, action='append', location='args', help='Accepted type of map')
+for facet, (row, multiple) in FACETS.items():
+    search_parser.add_argument(facet, type=str, action='append', location='args', help=f"Accepted value of '{row}'")
+search_parser.add_argument('offset', type=int, default=0, location='args', help='Number of maps to skip')
+search_parser.add_argument('limit', type=int, default=DEFAULT_LIMIT, location='args', help='Maximum number of maps')
+
+# Define the query parameters of the point values endpoint.
+# Points are given as repeated coordinates, e.g. ?lon=14.4&lat=40.8&lon=14.5&lat=40.9.
+point_parser = api.parser()
+point_parser.add_argument('lon', type=float, action='append', required=True, location='args',
+                          help='Longitude of a point, in WGS84')
+point_parser.add_argument('lat', type=float, action='append', required=True, location='args',
+                          help='Latitude of a point, in WGS84')
+point_parser.add_argument('band', type=int, default=1, location='args', help='Band of the raster, from 1')
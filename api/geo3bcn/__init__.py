@@ -1,17 +1,24 @@
 import logging
 import os
-from flask import request, abort
+from flask import request, abort, Response
 from flask_restx import Resource
 
-from flask import current_app as app
-
 # Import serializers for data validation and response marshalling
-from api.geo3bcn.serializers import map_summary, file_name, target, metadata, volcano
+from api.geo3bcn.serializers import map_summary, file_name, target, metadata, volcano, bbox_result, \
+    volcano_distance, map_extent, point_parser, nearest_parser, bbox_parser, summary_parser, fields_parser
 from api.restx import api
 
 # Import helper functions for data retrieval and file serving
-from geo3bcn.helpers import get_volcanoes_summary, get_event_tree_metadata, get_map_metadata, get_metadata, \
-    get_maps_summary, get_file
+from api.geo3bcn.helpers import get_volcanoes_summary, get_event_tree_metadata, get_map_metadata, get_metadata, \
+    get_maps_summary, get_file, get_metadata_paths
+from api.shared.catalog import get_catalog
+from api.shared.compression import cached_response
+from api.shared.serialization import compile_model, json_response
+from api.shared.spatial import get_spatial_index
+from api.shared.tiles import get_tile_store
+from api.shared.query import page_arguments, paginate, fields_argument, model_projection
+from api.shared.http_cache import metadata_validators, is_not_modified, not_modified_response, validator_headers, \
+    apply_validators
 
 # Configure logging for this module
 log = logging.getLogger(__name__)
@@ -23,19 +30,51 @@ description = (
 )
 ns = api.namespace('geo3bcn', description=description)
 
+# Content types of the files gdal2tiles writes into a pyramid
+PYRAMID_MIMETYPES = {'.png': 'image/png', '.kml': 'application/vnd.google-earth.kml+xml',
+                     '.xml': 'application/xml', '.html': 'text/html'}
+
+# Projections of the response models, compiled once
+project_map_summary = compile_model(map_summary)
+project_bbox = compile_model(bbox_result)
+project_volcano_distances = compile_model(volcano_distance)
+project_map_extents = compile_model(map_extent)
+
+MAX_NEAREST = 100
+
 # Endpoint for retrieving summaries of volcanoes
 @ns.route('/volcano-summary')
 class VolcanoSummaryResource(Resource):
-    @ns.marshal_list_with(volcano)
+    @api.expect(summary_parser)
+    @api.response(200, 'Success', [volcano])
     def post(self):
         """
         Handles POST request to return a list of volcano summaries.
         """
+        return self.get_summary()
+
+    @api.expect(summary_parser)
+    @api.response(200, 'Success', [volcano])
+    def get(self):
+        """
+        Handles GET request to return a list of volcano summaries, cacheable by browsers and CDNs.
+        """
+        return self.get_summary()
+
+    @staticmethod
+    def get_summary():
+        after, limit = page_arguments()
+        project = model_projection(volcano)
         try:
-            # Retrieve volcano summaries using the configured paths
-            response = get_volcanoes_summary(
-                os.path.join(app.config['paths']['current'], app.config['paths']['volcano']))
-            return response, 200
+            # Retrieve volcano summaries, marshalled, serialized and compressed only when a volcano JSON changes.
+            # Only the JSON files of the requested page are read, in the order of their names
+            catalog = get_catalog()
+
+            def build():
+                file_paths, headers = paginate(catalog.volcano_files(), after, limit, key=os.path.basename)
+                return json_response(project(get_volcanoes_summary(catalog, file_paths)), 200, headers)
+            return cached_response(('geo3bcn-volcano-summary', after, limit, request.args.get('fields')),
+                                   catalog.volcano_files_version, build)
         except Exception as e:
             # Log and return an error if the operation fails
             log.error(f"Error getting volcano summaries: {str(e)}")
@@ -45,7 +84,7 @@ class VolcanoSummaryResource(Resource):
 @ns.route('/map-summary')
 class MapSummaryResource(Resource):
     @api.expect(file_name, validate=True)
-    @api.marshal_with(map_summary)
+    @api.response(201, 'Success', map_summary)
     def post(self):
         """
         Handles POST request to return a list of map names for a given volcano.
@@ -56,10 +95,10 @@ class MapSummaryResource(Resource):
                 # Validate input
                 abort(400, "The 'file_name' parameter is required.")
 
-            # Retrieve map summaries
-            response = get_maps_summary(app.config['paths']['current'], app.config['paths']['volcano'], _file_name)
-            log.debug(f"Map summary response: {response}")
-            return response, 201
+            # Retrieve map summaries, marshalled, serialized and compressed once per catalog version
+            catalog = get_catalog()
+            return cached_response(('geo3bcn-map-summary', _file_name), catalog.version,
+                                   lambda: json_response(project_map_summary(get_maps_summary(catalog, _file_name)), 201))
         except Exception as e:
             # Log and return an error if the operation fails
             log.error(f"Error getting map summaries: {str(e)}")
@@ -72,7 +111,7 @@ class EventTreeImage(Resource):
         """
         Serves the event tree image for a given volcano.
         """
-        return get_file(file_name_no_ext, 'event-tree-img')
+        return get_file(get_catalog(), file_name_no_ext, 'event-tree-img')
 
 # Endpoint for serving preview images
 @ns.route('/preview-img/<string:file_name_no_ext>')
@@ -81,7 +120,7 @@ class PreviewImage(Resource):
         """
         Serves the preview image for a given volcano.
         """
-        return get_file(file_name_no_ext, 'preview-img')
+        return get_file(get_catalog(), file_name_no_ext, 'preview-img')
 
 # Endpoint for serving KML files
 @ns.route('/kml/<string:file_name_no_ext>')
@@ -90,16 +129,63 @@ class Kml(Resource):
         """
         Serves the KML file for a given volcano.
         """
-        return get_file(file_name_no_ext, 'kml')
+        return get_file(get_catalog(), file_name_no_ext, 'kml')
+
+# Endpoint for serving the tiles of the map pyramids
+@ns.route('/tiles/<string:volcano>/<string:map>/<int:z>/<int:x>/<int:y>.png')
+class Tile(Resource):
+    def get(self, volcano, map, z, x, y):
+        """
+        Serves a tile of the pyramid of a map, or renders it from the COG of the map, addressed in the XYZ
+        scheme of web maps. Tiles missing from the pyramid are served as transparent tiles.
+        """
+        try:
+            tile = get_tile_store().get(volcano, map, z, x, y)
+        except ValueError as e:
+            abort(404, str(e))
+        except Exception as e:
+            # Log and return an error if reading or rendering the tile fails
+            log.error(f"Error getting tile {z}/{x}/{y} of {volcano} {map}: {str(e)}")
+            abort(500, "Internal server error.")
+        if tile is None:
+            abort(404, f"No tiles for map {map} of {volcano}.")
+        if is_not_modified(tile['etag'], None):
+            return not_modified_response(tile['etag'], None, 'tile')
+        # WSGI servers only write bytes, so the slice of an archive is copied here, once
+        return apply_validators(Response(bytes(tile['data']), mimetype='image/png'), tile['etag'], None, 'tile')
+
+# Endpoint for serving the files of the pyramids packed into archives, the URL their KML is written with
+@ns.route('/pyramids/<string:volcano>/<string:map>/<path:name>')
+class PyramidFile(Resource):
+    def get(self, volcano, map, name):
+        """
+        Serves a file of the pyramid of a map packed into an archive (doc.kml, the KML and PNG of each tile,
+        tilemapresource.xml or the viewers), with the paths gdal2tiles wrote them with.
+        """
+        try:
+            found = get_tile_store().archive_file(volcano, map, name)
+        except Exception as e:
+            log.error(f"Error reading {name} from the archive of {volcano} {map}: {str(e)}")
+            abort(500, "Internal server error.")
+        if found is None:
+            abort(404, f"File {name} not found in the archive of map {map} of {volcano}.")
+        extension = os.path.splitext(name)[1]
+        resource_type = 'tile' if extension == '.png' else 'kml'
+        if is_not_modified(found['etag'], None):
+            return not_modified_response(found['etag'], None, resource_type)
+        mimetype = PYRAMID_MIMETYPES.get(extension, 'application/octet-stream')
+        return apply_validators(Response(bytes(found['data']), mimetype=mimetype), found['etag'], None, resource_type)
 
 # Endpoint for retrieving map metadata
-@ns.route('/map-metadata')
+@ns.route('/map-metadata/<string:volcan>/<string:map>', methods=['GET'])
+@ns.route('/map-metadata', methods=['POST'])
 class MapMetadataResource(Resource):
-    @api.expect(target, validate=True)
+    @api.expect(target, fields_parser, validate=True)
     def post(self):
         """
         Handles POST request to return the metadata of a given map and event tree.
         """
+        mask = fields_argument()
         try:
             _volcano, _ = os.path.splitext(str(request.json['volcan']))
             map = request.json['map']
@@ -108,8 +194,36 @@ class MapMetadataResource(Resource):
                 abort(400, "Both 'volcan' and 'map' parameters are required.")
 
             # Retrieve and return metadata
-            response = get_metadata(app.config['paths']['current'], app.config['paths']['volcano'], _volcano, map)
-            return response, 201
+            catalog = get_catalog()
+            etag, last_modified = metadata_validators(get_metadata_paths(catalog, _volcano, map))
+            response = get_metadata(catalog, _volcano, map, mask)
+            return json_response(response, 201, validator_headers(etag, last_modified, 'metadata'))
+        except FileNotFoundError:
+            # Handle file not found error
+            abort(404, f"Metadata for {_volcano} or map {map} not found.")
+        except Exception as e:
+            # Log and return an error if the operation fails
+            log.error(f"Error getting map metadata: {str(e)}")
+            abort(500, "Internal server error.")
+
+    @api.expect(fields_parser)
+    def get(self, volcan, map):
+        """
+        Handles GET request to return the metadata of a given map and event tree, answering 304 when
+        the client copy is still valid.
+        """
+        mask = fields_argument()
+        try:
+            _volcano, _ = os.path.splitext(volcan)
+            catalog = get_catalog()
+            etag, last_modified = metadata_validators(get_metadata_paths(catalog, _volcano, map))
+            if etag is None:
+                raise FileNotFoundError(f'{_volcano}/{map}')  # Neither the map nor the event tree metadata exist
+            if is_not_modified(etag, last_modified):
+                return not_modified_response(etag, last_modified, 'metadata')
+
+            response = get_metadata(catalog, _volcano, map, mask)
+            return json_response(response, 200, validator_headers(etag, last_modified, 'metadata'))
         except FileNotFoundError:
             # Handle file not found error
             abort(404, f"Metadata for {_volcano} or map {map} not found.")
@@ -117,3 +231,55 @@ class MapMetadataResource(Resource):
             # Log and return an error if the operation fails
             log.error(f"Error getting map metadata: {str(e)}")
             abort(500, "Internal server error.")
+
+
+def check_point(lat, lng):
+    # Rejects coordinates outside the WGS84 ranges
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        abort(400, "Latitudes must be within [-90, 90] and longitudes within [-180, 180].")
+
+# Endpoint for finding the volcanoes and maps within a bounding box
+@ns.route('/spatial/bbox')
+class BoundingBoxResource(Resource):
+    @api.expect(bbox_parser)
+    @api.response(200, 'Success', bbox_result)
+    def get(self):
+        """
+        Handles GET request to return the volcanoes located in a bounding box and the maps intersecting it.
+        """
+        args = bbox_parser.parse_args()
+        check_point(args['min_lat'], args['min_lng'])
+        check_point(args['max_lat'], args['max_lng'])
+        if args['min_lat'] > args['max_lat']:
+            abort(400, "'min_lat' must not be greater than 'max_lat'.")
+        result = get_spatial_index().bbox(args['min_lat'], args['min_lng'], args['max_lat'], args['max_lng'])
+        return json_response(project_bbox(result), 200)
+
+# Endpoint for finding the volcanoes nearest to a point
+@ns.route('/spatial/nearest')
+class NearestVolcanoesResource(Resource):
+    @api.expect(nearest_parser)
+    @api.response(200, 'Success', [volcano_distance])
+    def get(self):
+        """
+        Handles GET request to return the k volcanoes nearest to a point, nearest first.
+        """
+        args = nearest_parser.parse_args()
+        check_point(args['lat'], args['lng'])
+        if not 1 <= args['k'] <= MAX_NEAREST:
+            abort(400, f"'k' must be between 1 and {MAX_NEAREST}.")
+        result = get_spatial_index().nearest(args['lat'], args['lng'], args['k'])
+        return json_response(project_volcano_distances(result), 200)
+
+# Endpoint for finding the maps covering a point
+@ns.route('/spatial/maps-at')
+class MapsAtPointResource(Resource):
+    @api.expect(point_parser)
+    @api.response(200, 'Success', [map_extent])
+    def get(self):
+        """
+        Handles GET request to return the maps whose grid covers a point.
+        """
+        args = point_parser.parse_args()
+        check_point(args['lat'], args['lng'])
+        return json_response(project_map_extents(get_spatial_index().maps_at(args['lat'], args['lng'])), 200)
@@ -1,27 +1,34 @@
 import json
 import os
-from flask import send_file, abort, make_response
-from shared.tools import dir_files_list  # Utility functions shared across the project
-from shared.xlsx_parser import parse_xlsx, map_name_list  # Functions to parse Excel files and list map names
+from flask import abort
+from api.shared.http_cache import send_cached_file  # File serving with conditional request handling
+from api.shared.compression import send_precompressed_file  # Serving of precompressed siblings
+from api.shared.metadata_cache import metadata_cache  # Cache of parsed Excel files
+from api.shared.serialization import select_fields  # Projection of the requested fields
+from api.shared.metrics import span  # Timing of the expensive steps
+from api.shared.raster import get_statistics  # Precomputed statistics of the map rasters
 import logging
 
 log = logging.getLogger(__name__)  # Setup logging for this module
 
 
-def get_volcanoes_summary(volcano_path):
+def get_volcanoes_summary(catalog, file_paths=None):
     """
-    Loads and returns summaries from JSON files located in a specified directory.
+    Loads and returns summaries from the JSON files located in the volcanoes directory.
 
     Args:
-        volcano_path (str): Path to the directory containing JSON files for volcanoes.
+        catalog (Catalog): Index of the volcanoes directory.
+        file_paths (list, optional): Files to read, e.g. a page of them, every indexed file by default.
 
     Returns:
         list: A list of dictionaries where each dictionary contains data from one JSON file.
     """
     summaries = []
-    for file_path in dir_files_list(volcano_path):  # Loop through all files in the directory
+    if file_paths is None:
+        file_paths = catalog.volcano_files()
+    for file_path in file_paths:  # Loop through all files indexed in the directory
         try:
-            with open(file_path, 'r') as file:  # Open and read the JSON file
+            with span('json_load'), open(file_path, 'r') as file:  # Open and read the JSON file
                 data = json.load(file)
             summaries.append(data)  # Append the data to the summaries list
         except json.JSONDecodeError as e:
@@ -33,36 +40,55 @@ def get_volcanoes_summary(volcano_path):
     return summaries
 
 
-def get_metadata(current_path, volcanoes_path, volcano, _map):
+def get_metadata(catalog, volcano, _map, mask=None):
     """
     Generates metadata for a given volcano and map by combining data from multiple Excel files.
 
     Args:
-        current_path (str): Base path to the data directory.
-        volcanoes_path (str): Relative path from the current path to the volcanoes directory.
+        catalog (Catalog): Index of the volcanoes directory.
         volcano (str): Name of the volcano.
         _map (str): Name of the map.
+        mask (dict, optional): Projection returned by api.shared.serialization.parse_fields. Files whose
+            part of the metadata is not requested are not read.
 
     Returns:
-        dict: A dictionary containing combined metadata from the map and event tree.
+        dict: A dictionary containing combined metadata from the map and event tree, and the statistics of
+            the map raster.
     """
     try:
         # Construct full paths to the required metadata Excel files
-        map_metadata_path = os.path.join(current_path, volcanoes_path, volcano, "event_tree", "metadata.xlsx")
-        event_tree_metadata_path = os.path.join(current_path, volcanoes_path, volcano, 'metadata', _map + ".xlsx")
-
-        # Fetch metadata from the Excel files
-        map_metadata = get_map_metadata(map_metadata_path)
-        event_tree_metadata = get_event_tree_metadata(event_tree_metadata_path)
-
-        # Combine the metadata into a single dictionary
-        metadata = {'map_metadata': map_metadata, 'event_tree_metadata': event_tree_metadata}
-        return metadata
+        map_metadata_path, event_tree_metadata_path, _ = get_metadata_paths(catalog, volcano, _map)
+
+        # Fetch metadata from the requested Excel files and combine it into a single dictionary
+        metadata = {}
+        if mask is None or 'map_metadata' in mask:
+            metadata['map_metadata'] = get_map_metadata(map_metadata_path)
+        if mask is None or 'event_tree_metadata' in mask:
+            metadata['event_tree_metadata'] = get_event_tree_metadata(event_tree_metadata_path)
+        if mask is None or 'statistics' in mask:
+            metadata['statistics'] = get_statistics(catalog, volcano, _map)
+        return select_fields(metadata, mask)
     except Exception as e:
         log.error(f"An error occurred while generating metadata for {volcano} and map {_map}: {e}")
         return {"error": "Failed to generate metadata."}  # Return an error message if exceptions occur
 
 
+def get_metadata_paths(catalog, volcano, _map):
+    """
+    Resolves the Excel files combined by get_metadata for a given volcano and map.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        volcano (str): Name of the volcano.
+        _map (str): Name of the map.
+
+    Returns:
+        list: Paths to the files read as 'map_metadata', 'event_tree_metadata' and 'statistics', in that order.
+    """
+    return [catalog.event_tree_metadata_path(volcano), catalog.metadata_path(volcano, _map),
+            catalog.statistics_path(volcano, _map)]
+
+
 def get_map_metadata(path):
     """
     Fetches map metadata from an Excel file.
@@ -74,7 +100,7 @@ def get_map_metadata(path):
         Mixed: Parsed data from the Excel file or None if an error occurs.
     """
     try:
-        return parse_xlsx(path)  # Attempt to parse the Excel file
+        return metadata_cache.get(path)  # Parse the Excel file unless it is cached and unchanged
     except FileNotFoundError:
         log.error(f"Metadata file not found: {path}")
         return None  # Return None to indicate file not found
@@ -83,13 +109,12 @@ def get_map_metadata(path):
         return None  # Return None for any other parsing errors
 
 
-def get_maps_summary(current_path, volcanoes_path, file_name):
+def get_maps_summary(catalog, file_name):
     """
     Fetches summaries for maps associated with a specific volcano.
 
     Args:
-        current_path (str): Base path to the data directory.
-        volcanoes_path (str): Relative path from the current path to the volcanoes directory.
+        catalog (Catalog): Index of the volcanoes directory.
         file_name (str): Name of the volcano (without file extension).
 
     Returns:
@@ -97,8 +122,8 @@ def get_maps_summary(current_path, volcanoes_path, file_name):
     """
     try:
         file_name, _ = os.path.splitext(file_name)  # Remove file extension
-        path = os.path.join(current_path, volcanoes_path, file_name, "metadata")  # Construct path to metadata
-        response = {"data": map_name_list(path), "volcano_target": file_name}  # Generate response
+        maps = [{'name': map_type} for map_type in catalog.maps_for_volcano(file_name)]  # Indexed map types
+        response = {"data": maps, "volcano_target": file_name}  # Generate response
         return response
     except Exception as e:
         log.error(f"Error fetching map summaries for {file_name}: {e}")
@@ -116,7 +141,7 @@ def get_event_tree_metadata(path):
         Mixed: Parsed data from the Excel file or None if an error occurs.
     """
     try:
-        return parse_xlsx(path)  # Attempt to parse the Excel file
+        return metadata_cache.get(path)  # Parse the Excel file unless it is cached and unchanged
     except FileNotFoundError:
         log.error(f"Event tree metadata file not found: {path}")
         return None  # Return None to indicate file not found
@@ -125,11 +150,12 @@ def get_event_tree_metadata(path):
         return None  # Return None for any other parsing errors
 
 
-def get_file(file_name_no_ext, filetype, timestamp=None):
+def get_file(catalog, file_name_no_ext, filetype, timestamp=None):
     """
     Serves a file based on its type for a given identifier.
 
     Args:
+        catalog (Catalog): Index of the volcanoes directory.
         file_name_no_ext (str): Identifier of the file without extension.
         filetype (str): Type of file to serve (e.g., 'event-tree-img', 'preview-img', 'kml').
         timestamp (str, optional): Timestamp for cache busting (unused in current implementation).
@@ -137,22 +163,19 @@ def get_file(file_name_no_ext, filetype, timestamp=None):
     Returns:
         Flask Response: A Flask response object to serve the file.
     """
-    base_path = f'./volcanoes/{file_name_no_ext}'
+    if filetype not in ['event-tree-img', 'preview-img', 'kml']:
+        abort(400, "Invalid file type requested.")
     try:
+        filepath = catalog.file_path(file_name_no_ext, filetype)  # Resolved from the catalog index
+        if filepath is None:
+            raise FileNotFoundError(file_name_no_ext)
         if filetype in ['event-tree-img', 'preview-img']:
-            filename = 'eventtree.png' if filetype == 'event-tree-img' else 'preview.png'
-            filepath = os.path.join(base_path, 'imgs', filename)
-            return send_file(filepath, mimetype='image/png')
-        elif filetype == 'kml':
-            filepath = os.path.join(base_path, 'kml', 'preview.kml')
-            with open(filepath, 'rb') as file:
-                content = file.read()
-                response = make_response(content)
-                response.headers['Content-Type'] = 'application/vnd.google-earth.kml+xml'
-                response.headers['Content-Disposition'] = f'attachment; filename="{file_name_no_ext}.kml"'
-                return response
+            return send_cached_file(filepath, 'image/png', 'image')
         else:
-            abort(400, "Invalid file type requested.")
+            # Streamed from disk with Range support, so memory use does not depend on the file size. The
+            # precompressed sibling the client accepts is sent when it is up to date
+            return send_precompressed_file(filepath, 'application/vnd.google-earth.kml+xml', 'kml',
+                                           as_attachment=True, download_name=f'{file_name_no_ext}.kml')
     except FileNotFoundError:
         abort(404, f"File {file_name_no_ext} not found.")
     except Exception as e:
@@ -153,7 +153,65 @@ event_tree_metadata_model = api.model('EventTreeMetadata', {
 
 metadata = api.model('Data', {
     'map_metadata': fields.Nested(map_metadata_model, description='Metadata of the map'),
-    'event_tree_metadata': fields.Nested(event_tree_metadata_model, description='Metadata of the event tree')
+    'event_tree_metadata': fields.Nested(event_tree_metadata_model, description='Metadata of the event tree'),
+    'statistics': fields.Raw(description="Statistics of each band of the map raster: range, mean, std, "
+                                         "histogram, percentiles and per zoom 'levels', null if not computed")
 })
 
+# Models for the spatial queries
+volcano_location = api.model('VolcanoLocation', {
+    'volcano': fields.String(readOnly=True, description='Name of the volcano directory'),
+    'name': volcano_fields['name'],
+    'lat': volcano_fields['lat'],
+    'lng': volcano_fields['lng'],
+})
+
+volcano_distance = api.inherit('VolcanoDistance', volcano_location, {
+    'distance_km': fields.Float(readOnly=True, description='Great-circle distance to the requested point'),
+})
+
+map_extent = api.model('MapExtent', {
+    'volcano': fields.String(readOnly=True, description='Name of the volcano directory'),
+    'type': map_fields['type'],
+    'min_lat': fields.Float(readOnly=True, description='South edge of the map grid'),
+    'min_lng': fields.Float(readOnly=True, description='West edge of the map grid'),
+    'max_lat': fields.Float(readOnly=True, description='North edge of the map grid'),
+    'max_lng': fields.Float(readOnly=True, description='East edge of the map grid'),
+})
+
+bbox_result = api.model('BoundingBoxResult', {
+    'volcanoes': fields.List(fields.Nested(volcano_location), description='Volcanoes located in the box'),
+    'maps': fields.List(fields.Nested(map_extent), description='Maps whose grid intersects the box'),
+})
+
+# Query parameters of the spatial queries
+point_parser = api.parser()
+point_parser.add_argument('lat', type=float, required=True, location='args', help='Latitude, in degrees')
+point_parser.add_argument('lng', type=float, required=True, location='args', help='Longitude, in degrees')
+
+nearest_parser = point_parser.copy()
+nearest_parser.add_argument('k', type=int, default=1, location='args', help='Number of volcanoes to return')
+
+bbox_parser = api.parser()
+bbox_parser.add_argument('min_lat', type=float, required=True, location='args', help='South edge, in degrees')
+bbox_parser.add_argument('min_lng', type=float, required=True, location='args',
+                         help='West edge, in degrees, greater than the east edge across the antimeridian')
+bbox_parser.add_argument('max_lat', type=float, required=True, location='args', help='North edge, in degrees')
+bbox_parser.add_argument('max_lng', type=float, required=True, location='args', help='East edge, in degrees')
+
+# Query parameters of the list endpoints, paginated in the order of the catalog
+page_parser = api.parser()
+page_parser.add_argument('limit', type=int, location='args', help='Maximum number of items, all by default')
+page_parser.add_argument('cursor', type=str, location='args',
+                         help="Position after the previous page, taken from the 'Link' header of its response")
+
+# Query parameter of the endpoints that can return a subset of the fields of their model
+fields_parser = api.parser()
+fields_parser.add_argument('fields', type=str, location='args',
+                           help="Comma separated fields to return, nested ones between braces, "
+                                "e.g. 'map_metadata{Name,Category}'")
+
+summary_parser = page_parser.copy()
+summary_parser.add_argument(fields_parser.args[0])
+
 api.model('MapSummary', map_summary)
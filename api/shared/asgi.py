@@ -0,0 +1,144 @@
+import io
+import sys
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.wsgi import FileWrapper
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'POST', 'OPTIONS')  # POST endpoints only read parameters from the body
+DEFAULT_THREADS = 32
+DEFAULT_MAX_BODY = 64 * 1024
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class AsgiAdapter:
+    """
+    ASGI application serving the Flask application from an event loop.
+
+    The event loop owns the connections, so idle keep-alive connections and slow clients cost no thread.
+    Every blocking step of a request (the Flask handler, with its catalog lookups, workbook parsing and
+    JSON loading, and each chunk read of a file being sent) runs on a bounded thread pool. Responses are
+    produced by the same resources and marshalling models as under WSGI, so they are byte for byte
+    identical.
+    """
+
+    def __init__(self, flask_app, threads=DEFAULT_THREADS, max_body=DEFAULT_MAX_BODY):
+        """
+        Args:
+            flask_app (Flask): The application to serve.
+            threads (int): Size of the thread pool running the blocking work.
+            max_body (int): Largest request body accepted, in bytes.
+        """
+        self.flask_app = flask_app
+        self.threads = threads
+        self.max_body = max_body
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                    self.executor = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+        return self.executor
+
+    async def _http(self, scope, receive, send):
+        if scope['method'] not in READ_ONLY_METHODS:
+            await _send_error(send, 405, b'Method not allowed')
+            return
+        body = io.BytesIO()
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+            if body.tell() > self.max_body:
+                await _send_error(send, 413, b'Request body too large')
+                return
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: None  # The legacy write() callable is not used by Flask
+
+        environ = _environ(scope, body)
+        iterable = await loop.run_in_executor(executor, self.flask_app, environ, start_response)
+        iterator = iter(iterable)
+        try:
+            # The first chunk may still be produced lazily, after start_response
+            chunk = await loop.run_in_executor(executor, next, iterator, None)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                if chunk and scope['method'] != 'HEAD':
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(executor, next, iterator, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                await loop.run_in_executor(executor, iterable.close)
+
+
+def _environ(scope, body):
+    # WSGI environ of an ASGI HTTP scope, see PEP 3333
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': lambda file, buffer_size=FILE_CHUNK_SIZE: FileWrapper(file, buffer_size),
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _send_error(send, status, message):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(message)).encode())]})
+    await send({'type': 'http.response.body', 'body': message})
@@ -0,0 +1,281 @@
+import os
+import time
+import logging
+import threading
+
+from flask import current_app
+from werkzeug.utils import safe_join
+
+from api.shared.metrics import span
+from api.shared.render import COG_EXTENSION
+from api.shared.constants import STATISTICS_EXTENSION
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Files served per volcano, relative to the volcano directory
+VOLCANO_FILES = {
+    'event-tree-img': os.path.join('imgs', 'eventtree.png'),
+    'preview-img': os.path.join('imgs', 'preview.png'),
+    'kml': os.path.join('kml', 'preview.kml'),
+}
+
+METADATA_DIR = 'metadata'
+EVENT_TREE_METADATA = os.path.join('event_tree', 'metadata.xlsx')
+METADATA_EXTENSION = '.xlsx'
+SIDECAR_EXTENSION = '.json'
+
+# Rasters of the maps: the published GeoTIFF, or else the COG written instead of its tile pyramid
+RASTER_DIR = 'tifs'
+RASTER_EXTENSIONS = ('.tif', '.tiff')
+COG_DIR = 'kml'
+
+
+class Catalog:
+    """
+    In-memory index of the volcanoes directory.
+
+    The tree is walked once and every endpoint answers from dictionary lookups afterwards. The
+    index maps each volcano to its map types and file paths, and each map type to the volcanoes
+    that provide it. Lookups always read the latest published snapshot, so a rebuild never blocks
+    readers.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (str): Absolute path to the 'volcanoes' directory.
+        """
+        self.root = root
+        self._lock = threading.Lock()
+        self._volcanoes = {}
+        self._types = {}
+        self._volcano_files = []
+        self.built_at = None
+        self.version = 0
+        self.volcano_files_version = 0
+
+    def rebuild(self):
+        """
+        Walks the whole volcanoes directory and replaces the index.
+
+        Returns:
+            Catalog: The catalog itself, to allow chaining after construction.
+        """
+        start = time.perf_counter()
+        with self._lock, span('catalog_walk'):
+            volcanoes = {}
+            volcano_files = []
+            if os.path.isdir(self.root):
+                for entry in os.scandir(self.root):
+                    if entry.is_dir():
+                        volcanoes[entry.name] = self._scan_volcano(entry.path)
+                    elif entry.is_file():
+                        volcano_files.append(entry.path)
+            else:
+                log.error(f"Volcanoes directory not found: {self.root}")
+            self._publish(volcanoes, sorted(volcano_files))
+            self.volcano_files_version += 1
+        elapsed = (time.perf_counter() - start) * 1000
+        log.info(f"Catalog built in {elapsed:.1f} ms: {len(self._volcanoes)} volcanoes, "
+                 f"{len(self._types)} map types")
+        return self
+
+    def refresh_volcano(self, volcano):
+        """
+        Rescans a single volcano directory and updates its entries in the index.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+        """
+        path = os.path.join(self.root, volcano)
+        with self._lock, span('catalog_walk'):
+            volcanoes = dict(self._volcanoes)
+            if os.path.isdir(path):
+                volcanoes[volcano] = self._scan_volcano(path)
+            else:
+                volcanoes.pop(volcano, None)
+            self._publish(volcanoes, self._volcano_files)
+        log.debug(f"Catalog refreshed for volcano {volcano}")
+
+    def refresh_volcano_files(self):
+        """
+        Rescans the volcano JSON files located at the top level of the volcanoes directory.
+        """
+        with self._lock:
+            volcano_files = sorted(entry.path for entry in os.scandir(self.root) if entry.is_file())
+            self._publish(self._volcanoes, volcano_files)
+            # The files may have kept their names but changed their content
+            self.volcano_files_version += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of indexed volcanoes, map types and volcano files, and the index versions.
+        """
+        return {'volcanoes': len(self._volcanoes), 'map_types': len(self._types),
+                'volcano_files': len(self._volcano_files), 'version': self.version,
+                'volcano_files_version': self.volcano_files_version}
+
+    def _publish(self, volcanoes, volcano_files):
+        # Build the reverse index and swap every reference at once so readers see a consistent snapshot
+        types = {}
+        for name in sorted(volcanoes):
+            for map_type in volcanoes[name]['maps']:
+                types.setdefault(map_type, []).append(name)
+        self._volcanoes = volcanoes
+        self._types = types
+        self._volcano_files = volcano_files
+        self.built_at = time.time()
+        self.version += 1  # Lets derived caches detect that the index changed
+
+    @staticmethod
+    def _scan_volcano(path):
+        """
+        Indexes the map types and served files of one volcano directory.
+
+        Args:
+            path (str): Path to the volcano directory.
+
+        Returns:
+            dict: Entry with the volcano path, its maps, event tree metadata and served files.
+        """
+        maps = {}
+        metadata_dir = os.path.join(path, METADATA_DIR)
+        if os.path.isdir(metadata_dir):
+            for entry in os.scandir(metadata_dir):
+                map_type, extension = os.path.splitext(entry.name)
+                # A map is published either as a workbook or only as its precompiled sidecar
+                if extension in (METADATA_EXTENSION, SIDECAR_EXTENSION) and entry.is_file():
+                    maps[map_type] = {'metadata': os.path.join(metadata_dir, map_type + METADATA_EXTENSION)}
+
+        event_tree_metadata = os.path.join(path, EVENT_TREE_METADATA)
+        event_tree_sidecar = os.path.splitext(event_tree_metadata)[0] + SIDECAR_EXTENSION
+        if not os.path.isfile(event_tree_metadata) and not os.path.isfile(event_tree_sidecar):
+            event_tree_metadata = None
+
+        files = {}
+        for filetype, relative_path in VOLCANO_FILES.items():
+            file_path = os.path.join(path, relative_path)
+            if os.path.isfile(file_path):
+                files[filetype] = file_path
+
+        return {
+            'path': path,
+            'maps': dict(sorted(maps.items())),
+            'event_tree_metadata': event_tree_metadata,
+            'files': files,
+        }
+
+    def volcano_names(self):
+        """
+        Returns:
+            list: Sorted names of the indexed volcano directories.
+        """
+        return sorted(self._volcanoes)
+
+    def volcano_files(self):
+        """
+        Returns:
+            list: Sorted paths of the files at the top level of the volcanoes directory.
+        """
+        return list(self._volcano_files)
+
+    def type_names(self):
+        """
+        Returns:
+            list: Sorted names of every map type found in any volcano.
+        """
+        return sorted(self._types)
+
+    def volcanoes_for_type(self, map_type):
+        """
+        Args:
+            map_type (str): Type of map.
+
+        Returns:
+            list: Sorted names of the volcanoes that provide the map type.
+        """
+        return list(self._types.get(map_type, []))
+
+    def maps_for_volcano(self, volcano):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+
+        Returns:
+            list: Sorted map types available for the volcano.
+
+        Raises:
+            KeyError: If the volcano is not indexed.
+        """
+        return list(self._volcanoes[volcano]['maps'])
+
+    def metadata_path(self, volcano, map_type):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+            map_type (str): Type of map.
+
+        Returns:
+            str: Path to the metadata workbook, whether or not it exists.
+        """
+        entry = self._volcanoes.get(volcano, {}).get('maps', {}).get(map_type)
+        if entry:
+            return entry['metadata']
+        return os.path.join(self.root, volcano, METADATA_DIR, map_type + METADATA_EXTENSION)
+
+    def raster_path(self, volcano, map_type):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+            map_type (str): Type of map.
+
+        Returns:
+            str: Path to the raster of the map, or None if the volcano has none for this map type.
+        """
+        # Names come from the request, safe_join keeps them inside the volcanoes directory
+        candidates = [safe_join(self.root, volcano, RASTER_DIR, map_type + extension)
+                      for extension in RASTER_EXTENSIONS]
+        candidates.append(safe_join(self.root, volcano, COG_DIR, map_type + COG_EXTENSION))
+        return next((candidate for candidate in candidates if candidate and os.path.isfile(candidate)), None)
+
+    def statistics_path(self, volcano, map_type):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+            map_type (str): Type of map.
+
+        Returns:
+            str: Path to the statistics sidecar of the map GeoTIFF, whether or not it exists, or None if the
+                names leave the volcanoes directory.
+        """
+        return safe_join(self.root, volcano, RASTER_DIR, map_type + STATISTICS_EXTENSION)
+
+    def event_tree_metadata_path(self, volcano):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+
+        Returns:
+            str: Path to the event tree metadata workbook, whether or not it exists.
+        """
+        return os.path.join(self.root, volcano, EVENT_TREE_METADATA)
+
+    def file_path(self, volcano, filetype):
+        """
+        Args:
+            volcano (str): Name of the volcano.
+            filetype (str): One of the keys of VOLCANO_FILES.
+
+        Returns:
+            str: Path to the served file, or None if the volcano does not provide it.
+        """
+        return self._volcanoes.get(volcano, {}).get('files', {}).get(filetype)
+
+
+def get_catalog():
+    """
+    Returns:
+        Catalog: The catalog built for the current Flask application.
+    """
+    return current_app.extensions['catalog']
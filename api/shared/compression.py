@@ -0,0 +1,303 @@
+import os
+import glob
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request, Response
+
+from api.shared.http_cache import send_cached_file, is_not_modified, not_modified_response, apply_validators
+
+try:
+    import brotli  # Optional, only gzip variants are produced without it
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Precompressed siblings written next to a file, by Content-Encoding
+VARIANT_EXTENSIONS = OrderedDict([('br', '.br'), ('gzip', '.gz')])
+
+# Files precompressed offline, relative to the volcanoes directory
+PRECOMPRESSED_PATTERNS = [
+    os.path.join('*', 'kml', 'preview.kml'),
+]
+
+# Content types worth compressing on the fly
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/vnd.google-earth.kml+xml', 'application/xml',
+                          'text/xml', 'text/plain', 'text/html'}
+
+# Headers describing the uncompressed body, set again for each representation of a cached response
+ENTITY_HEADERS = {'Content-Type', 'Content-Length'}
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_RESPONSE_MAX_ENTRIES = 1024
+
+
+def available_encodings():
+    """
+    Returns:
+        list: Content-Encodings that can be produced, in order of preference.
+    """
+    return [encoding for encoding in VARIANT_EXTENSIONS if encoding != 'br' or brotli is not None]
+
+
+def compress(data, encoding, level=None):
+    """
+    Compress bytes with the given Content-Encoding.
+
+    Args:
+        data (bytes): Data to compress.
+        encoding (str): 'gzip' or 'br'.
+        level (int, optional): Compression level, the maximum one by default.
+
+    Returns:
+        bytes: Compressed data.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if level is None else level)
+    # mtime=0 keeps the output, and therefore its ETag, identical for identical input
+    return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+
+
+def negotiate(encodings):
+    """
+    Choose the best Content-Encoding the client accepts among the given ones.
+
+    Args:
+        encodings (list): Available encodings, in order of preference.
+
+    Returns:
+        str: The chosen encoding, or None for the identity encoding.
+    """
+    best = request.accept_encodings.best_match(list(encodings) + ['identity'], default='identity')
+    return None if best == 'identity' else best
+
+
+def write_variants(path, force=False):
+    """
+    Write the precompressed siblings of a file (e.g. preview.kml.gz) unless they are up to date.
+
+    Args:
+        path (str): Path to the file.
+        force (bool): Rewrite the siblings even if they are newer than the file.
+
+    Returns:
+        int: Number of siblings written.
+    """
+    source_mtime = os.stat(path).st_mtime_ns
+    data = None
+    written = 0
+    for encoding in available_encodings():
+        variant_path = path + VARIANT_EXTENSIONS[encoding]
+        if not force and os.path.isfile(variant_path) and os.stat(variant_path).st_mtime_ns >= source_mtime:
+            continue
+        if data is None:
+            with open(path, 'rb') as file:
+                data = file.read()
+        temp_path = f'{variant_path}.tmp{os.getpid()}'
+        with open(temp_path, 'wb') as file:
+            file.write(compress(data, encoding))
+        os.replace(temp_path, variant_path)
+        written += 1
+    return written
+
+
+def precompress_files(volcanoes_path, force=False):
+    """
+    Write the precompressed siblings of every KML served by the volcanoes directory.
+
+    Args:
+        volcanoes_path (str): Path to the 'volcanoes' directory.
+        force (bool): Rewrite the siblings that are up to date.
+
+    Returns:
+        dict: Number of files 'compressed', 'skipped' as up to date and 'failed'.
+    """
+    summary = {'compressed': 0, 'skipped': 0, 'failed': 0}
+    for pattern in PRECOMPRESSED_PATTERNS:
+        for path in sorted(glob.glob(os.path.join(volcanoes_path, pattern))):
+            try:
+                summary['compressed' if write_variants(path, force) else 'skipped'] += 1
+            except Exception as e:
+                log.error(f"Error precompressing {path}: {e}")
+                summary['failed'] += 1
+    return summary
+
+
+def send_precompressed_file(path, mimetype, resource_type, **kwargs):
+    """
+    Serve the best precompressed sibling of a file the client accepts, or the file itself.
+
+    Siblings older than the file are ignored, so a stale variant is never served.
+
+    Args:
+        path (str): Path to the file.
+        mimetype (str): Content type of the uncompressed file.
+        resource_type (str): Cache-Control policy, see api.shared.http_cache.
+        **kwargs: Extra arguments for flask.send_file, e.g. as_attachment and download_name.
+
+    Returns:
+        Response: A Flask response serving the chosen representation.
+    """
+    source_mtime = os.stat(path).st_mtime_ns
+    variants = {}
+    for encoding, extension in VARIANT_EXTENSIONS.items():
+        try:
+            if os.stat(path + extension).st_mtime_ns >= source_mtime:
+                variants[encoding] = path + extension
+        except FileNotFoundError:
+            pass
+
+    encoding = negotiate(variants)
+    response = send_cached_file(variants.get(encoding, path), mimetype, resource_type, **kwargs)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized responses built from the catalog, together with their ETag and
+    precompressed variants.
+
+    Entries remember the catalog version they were built from and are rebuilt once it changes, so
+    nothing is serialized or compressed on the request path while the catalog is unchanged.
+    """
+
+    def __init__(self, max_entries=DEFAULT_RESPONSE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_entries):
+        """
+        Args:
+            max_entries (int): Maximum number of responses kept in memory.
+        """
+        with self._lock:
+            self.max_entries = max(int(max_entries), 0)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, version, build):
+        """
+        Returns the cached representations of a response, building them if missing or outdated.
+
+        Args:
+            key (hashable): Identifies the response, e.g. the endpoint and its parameters.
+            version (int): Version of the data the response is built from.
+            build (callable): Returns the uncompressed Flask response.
+
+        Returns:
+            dict: Status, mimetype, extra headers, ETag and body by Content-Encoding (None for identity).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        response = build()
+        body = response.get_data()
+        headers = [(name, value) for name, value in response.headers if name not in ENTITY_HEADERS]
+        entry = {'version': version, 'status': response.status_code, 'mimetype': response.mimetype,
+                 'headers': headers, 'etag': hashlib.sha1(body).hexdigest(), 'bodies': {None: body}}
+        for encoding in available_encodings():
+            entry['bodies'][encoding] = compress(body, encoding)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current size, capacity and hit/miss counters.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def invalidate(self, key=None):
+        """
+        Drops one response, or every response if no key is given.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+# Cache shared by every endpoint of the process
+response_cache = ResponseCache()
+
+
+def cached_response(key, version, build, resource_type='summary'):
+    """
+    Serve a response from the response cache, negotiating its Content-Encoding and answering 304
+    when the client copy is still valid.
+
+    Args:
+        key (hashable): Identifies the response, e.g. the endpoint and its parameters.
+        version (int): Version of the data the response is built from, e.g. the catalog version.
+        build (callable): Returns the uncompressed Flask response.
+        resource_type (str): Cache-Control policy, see api.shared.http_cache.
+
+    Returns:
+        Response: A Flask response with the precompressed body.
+    """
+    entry = response_cache.get(key, version, build)
+    encoding = negotiate([encoding for encoding in entry['bodies'] if encoding])
+    # Each representation gets its own strong ETag
+    etag = entry['etag'] if encoding is None else f"{entry['etag']}-{encoding}"
+    if is_not_modified(etag, None):
+        response = not_modified_response(etag, None, resource_type)
+    else:
+        response = Response(entry['bodies'][encoding], status=entry['status'], mimetype=entry['mimetype'],
+                            headers=entry['headers'])
+        apply_validators(response, etag, None, resource_type)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compress_response(response):
+    """
+    Compress in-memory responses that lack a precomputed variant, as an after_request hook.
+
+    Only responses of a compressible type larger than the configured threshold are compressed, and
+    streamed files and generated bodies are left untouched.
+
+    Args:
+        response (Response): Response about to be sent.
+
+    Returns:
+        Response: The same response, gzip encoded if applicable.
+    """
+    config = current_app.config.get('compression', {})
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < int(config.get('min_size') or DEFAULT_MIN_SIZE) or negotiate(['gzip']) != 'gzip':
+        return response
+    response.set_data(compress(body, 'gzip', int(config.get('gzip_level') or DEFAULT_GZIP_LEVEL)))
+    response.headers['Content-Encoding'] = 'gzip'
+    if response.headers.get('ETag'):
+        # The encoded body is a different representation and needs its own strong ETag
+        response.headers['ETag'] = response.headers['ETag'][:-1] + '-gzip"'
+    return response
@@ -0,0 +1,23 @@
+import os
+
+# Shared by the serving modules and the offline tools (api.shared.tools, compile_metadata.py), so this module
+# must not import Flask, GDAL nor NumPy
+
+# Web mercator tile grid
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+DEFAULT_TILE_SIZE = 256
+
+# Statistics of a published GeoTIFF, written next to it by api.shared.tools.write_raster_statistics:
+# <volcano>/tifs/<map>.stats.json
+STATISTICS_EXTENSION = '.stats.json'
+
+
+def statistics_path(raster_path):
+    """
+    Args:
+        raster_path (str): Path to a GeoTIFF.
+
+    Returns:
+        str: Path of its statistics sidecar.
+    """
+    return os.path.splitext(raster_path)[0] + STATISTICS_EXTENSION
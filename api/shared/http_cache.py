@@ -0,0 +1,178 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+from flask import current_app, request, send_file, Response
+
+from api.shared.xlsx_parser import metadata_signature
+from api.shared.metrics import span
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Cache-Control policies used when config.ini does not define one for a resource type
+DEFAULT_CACHE_CONTROL = {
+    'image': 'public, max-age=86400',
+    'kml': 'public, max-age=3600',
+    'file': 'public, max-age=3600',
+    'metadata': 'public, max-age=300, must-revalidate',
+    'summary': 'public, max-age=60, must-revalidate',
+    'tile': 'public, max-age=86400',
+}
+
+# Suffixes appended to the ETag of compressed representations, see api.shared.compression
+ENCODING_ETAG_SUFFIXES = ('-gzip', '-br')
+
+
+def cache_control(resource_type):
+    """
+    Get the Cache-Control policy configured for a type of resource.
+
+    Args:
+        resource_type (str): One of the keys of DEFAULT_CACHE_CONTROL.
+
+    Returns:
+        str: Value of the Cache-Control header.
+    """
+    policies = current_app.config.get('http_cache', {})
+    return policies.get(resource_type) or DEFAULT_CACHE_CONTROL[resource_type]
+
+
+def file_validators(path):
+    """
+    Build a strong ETag from the identity of a file (inode, mtime and size) and get its mtime.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        tuple: The ETag and the last modification datetime of the file.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    stat = os.stat(path)
+    etag = f'{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    return etag, datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+
+
+def metadata_validators(paths):
+    """
+    Build a strong ETag from the versions of the workbooks and sidecars a metadata response is built from.
+
+    Args:
+        paths (list): Paths to the XLSX files or other sidecars, None for a file that cannot exist.
+
+    Returns:
+        tuple: The ETag and the newest modification datetime, or (None, None) if no file exists.
+    """
+    signatures = []
+    for path in paths:
+        try:
+            signatures.append(metadata_signature(path) if path else None)
+        except FileNotFoundError:
+            signatures.append(None)
+    mtimes = [part[0] for signature in signatures if signature for part in signature if part]
+    if not mtimes:
+        return None, None
+    etag = hashlib.sha1(repr((paths, signatures)).encode()).hexdigest()
+    return etag, datetime.fromtimestamp(max(mtimes) // 10 ** 9, timezone.utc)
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Evaluate the conditional headers of the current GET or HEAD request.
+
+    If-None-Match takes precedence over If-Modified-Since, as required by RFC 7232.
+
+    Args:
+        etag (str): Current ETag of the resource.
+        last_modified (datetime): Current last modification time of the resource.
+
+    Returns:
+        bool: True if the client copy is still valid and a 304 can be sent.
+    """
+    if request.method not in ('GET', 'HEAD') or etag is None:
+        return False
+    if request.if_none_match:
+        return any(request.if_none_match.contains(etag + suffix) for suffix in ('',) + ENCODING_ETAG_SUFFIXES)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def apply_validators(response, etag, last_modified, resource_type):
+    """
+    Set the ETag, Last-Modified and Cache-Control headers of a response.
+
+    Args:
+        response (Response): Response to update.
+        etag (str): ETag of the resource.
+        last_modified (datetime): Last modification time of the resource.
+        resource_type (str): One of the keys of DEFAULT_CACHE_CONTROL.
+
+    Returns:
+        Response: The same response.
+    """
+    response.headers.update(validator_headers(etag, last_modified, resource_type))
+    response.headers.pop('Expires', None)
+    return response
+
+
+def validator_headers(etag, last_modified, resource_type):
+    """
+    Build the ETag, Last-Modified and Cache-Control headers of a resource.
+
+    Args:
+        etag (str): ETag of the resource, or None to only send the Cache-Control policy.
+        last_modified (datetime): Last modification time of the resource, or None.
+        resource_type (str): One of the keys of DEFAULT_CACHE_CONTROL.
+
+    Returns:
+        dict: Headers to add to the response.
+    """
+    headers = {'Cache-Control': cache_control(resource_type)}
+    if etag is not None:
+        headers['ETag'] = f'"{etag}"'
+    if last_modified is not None:
+        headers['Last-Modified'] = last_modified.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    return headers
+
+
+def not_modified_response(etag, last_modified, resource_type):
+    """
+    Build an empty 304 response carrying the validators of the resource.
+
+    Returns:
+        Response: A 304 Not Modified response.
+    """
+    return apply_validators(Response(status=304), etag, last_modified, resource_type)
+
+
+def send_cached_file(path, mimetype, resource_type, **kwargs):
+    """
+    Serve a file with strong validators and the configured Cache-Control policy, answering 304 when
+    the client copy is still valid.
+
+    The file is streamed through the WSGI file wrapper (sendfile where the server supports it), and
+    Range / If-Range requests are answered with 206 partial content, so downloads can be resumed.
+
+    Args:
+        path (str): Path to the file.
+        mimetype (str): Content type of the file.
+        resource_type (str): One of the keys of DEFAULT_CACHE_CONTROL.
+        **kwargs: Extra arguments for flask.send_file, e.g. as_attachment.
+
+    Returns:
+        Response: A Flask response serving the file or a 304.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    with span('file_send'):
+        etag, last_modified = file_validators(path)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified, resource_type)
+        response = send_file(path, mimetype=mimetype, etag=etag, last_modified=last_modified, conditional=True,
+                             **kwargs)
+        return apply_validators(response, etag, last_modified, resource_type)
@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import logging
+import threading
+from functools import partial
+import xml.etree.ElementTree as ElementTree
+
+from api.shared.constants import statistics_path
+from api.shared.xlsx_parser import read_xlsx, sidecar_path
+from api.shared.sidecars import compile_sidecar
+from api.shared.compression import write_variants, VARIANT_EXTENSIONS
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+
+# Bundle files checked before publishing, by directory relative to the bundle root
+BUNDLE_LAYOUT = {
+    'metadata': ('.xlsx',),
+    'event_tree': ('.xlsx',),
+    'imgs': ('.png',),
+    'kml': ('.kml',),
+    'tifs': ('.tif', '.tiff'),
+}
+
+LOCK_FILE = '.ingest.lock'
+DEFAULT_SETTLE_SECONDS = 30
+
+
+def validate_file(path):
+    """
+    Checks that a bundle file can be served, based on its extension.
+
+    Args:
+        path (str): Path to the file.
+
+    Raises:
+        ValueError: If the file is not valid.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        if not read_xlsx(path):
+            raise ValueError('empty metadata workbook')
+    elif extension == '.json':
+        with open(path, 'r') as file:
+            if not isinstance(json.load(file), dict):
+                raise ValueError('volcano JSON is not an object')
+    elif extension == '.png':
+        with open(path, 'rb') as file:
+            if file.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                raise ValueError('not a PNG image')
+    elif extension in ('.tif', '.tiff'):
+        with open(path, 'rb') as file:
+            if file.read(4) not in TIFF_SIGNATURES:
+                raise ValueError('not a TIFF file')
+    elif extension == '.kml':
+        # Streamed parse, so large KML files are not loaded at once
+        for _, element in ElementTree.iterparse(path):
+            element.clear()
+
+
+def validate_bundle(bundle_dir):
+    """
+    Validates an uploaded bundle laid out like a volcano directory, plus an optional '<volcano>.json'.
+
+    Args:
+        bundle_dir (str): Path to the bundle, named after the volcano.
+
+    Returns:
+        list: Error messages, empty if the bundle can be published.
+    """
+    volcano = os.path.basename(os.path.normpath(bundle_dir))
+    errors = []
+    files = 0
+    for root, _, names in os.walk(bundle_dir):
+        relative_root = os.path.relpath(root, bundle_dir)
+        for name in names:
+            path = os.path.join(root, name)
+            relative_path = os.path.normpath(os.path.join(relative_root, name))
+            allowed = BUNDLE_LAYOUT.get(relative_root.split(os.sep)[0], ())
+            if relative_path == volcano + '.json' or os.path.splitext(name)[1].lower() in allowed:
+                try:
+                    validate_file(path)
+                    files += 1
+                except Exception as e:
+                    errors.append(f'{relative_path}: {e}')
+            else:
+                errors.append(f'{relative_path}: unexpected file')
+    if not files and not errors:
+        errors.append('empty bundle')
+    return errors
+
+
+def build_staging(bundle_dir, current_dir, staging_dir, tile=None):
+    """
+    Builds the next version of a volcano directory: the published files, overlaid with the bundle,
+    plus the derived artifacts (metadata sidecars, raster statistics, precompressed KML and tile pyramids).
+
+    Args:
+        bundle_dir (str): Path to the validated bundle.
+        current_dir (str): Published volcano directory, which may not exist yet.
+        staging_dir (str): Directory to build, on the same filesystem as the temp path.
+        tile (callable, optional): Called with (volcano, map, source, destination) for every bundled GeoTIFF.
+    """
+    # GDAL, only imported by the processes that ingest bundles
+    from api.shared.tools import link_or_copy, write_raster_statistics
+
+    if os.path.isdir(current_dir):
+        # Hard links are cheap; files replaced below are unlinked first, never written through
+        shutil.copytree(current_dir, staging_dir, symlinks=True, copy_function=link_or_copy)
+    else:
+        os.makedirs(staging_dir)
+
+    volcano = os.path.basename(os.path.normpath(bundle_dir))
+    for root, _, names in os.walk(bundle_dir):
+        relative_root = os.path.relpath(root, bundle_dir)
+        for name in names:
+            if relative_root == '.' and name == volcano + '.json':
+                continue  # Published next to the volcano directory, see IngestionWorker._publish
+            destination = os.path.normpath(os.path.join(staging_dir, relative_root, name))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            # Drop the published file and the artifacts derived from it, they are rebuilt below
+            derived = [destination + extension for extension in VARIANT_EXTENSIONS.values()]
+            if name.endswith('.xlsx'):
+                derived.append(sidecar_path(destination))
+            elif name.endswith(('.tif', '.tiff')):
+                derived.append(statistics_path(destination))
+            for path in [destination] + derived:
+                if os.path.lexists(path):
+                    os.unlink(path)
+            shutil.copy2(os.path.join(root, name), destination)
+
+    for root, _, names in os.walk(staging_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            if name.endswith('.xlsx'):
+                compile_sidecar(path)
+            elif name.endswith('.kml') and os.path.basename(root) == 'kml':
+                write_variants(path)
+            elif name.endswith(('.tif', '.tiff')) and os.path.basename(root) == 'tifs':
+                write_raster_statistics(path)
+    if tile is not None:
+        tifs_dir = os.path.join(bundle_dir, 'tifs')
+        for name in sorted(os.listdir(tifs_dir)) if os.path.isdir(tifs_dir) else []:
+            map_name = os.path.splitext(name)[0]
+            tile(volcano, map_name, os.path.join(staging_dir, 'tifs', name),
+                 os.path.join(staging_dir, 'kml', map_name))
+
+
+def unique_path(path):
+    """
+    Args:
+        path (str): Preferred path.
+
+    Returns:
+        str: The path, suffixed with a counter if it already exists.
+    """
+    candidate, counter = path, 1
+    while os.path.lexists(candidate):
+        candidate, counter = f'{path}.{counter}', counter + 1
+    return candidate
+
+
+class IngestionWorker:
+    """
+    Publishes the bundles uploaded to the 'incoming' directory into the volcanoes directory.
+
+    Each bundle is a '<volcano>/' directory laid out like a published volcano (metadata/, event_tree/,
+    imgs/, kml/, tifs/) with an optional '<volcano>.json' summary. A bundle is picked up once nothing in
+    it changed for settle_seconds. Valid bundles are merged with the published volcano in the temp
+    directory, their derived artifacts are built, the previous version is moved to the 'version'
+    directory and the new one is published with an atomic rename. Invalid bundles, or bundles whose new
+    version cannot be built, are moved to 'trash' with the list of errors. Bundles that fail to be
+    published are left in 'incoming' and retried at the next scan.
+    """
+
+    def __init__(self, paths, invalidator=None, interval=10, settle_seconds=DEFAULT_SETTLE_SECONDS, tile=None):
+        """
+        Args:
+            paths (dict): Absolute 'volcano', 'incoming', 'temp', 'version' and 'trash' directories.
+            invalidator (Invalidator, optional): Caches to invalidate after each publication.
+            interval (float): Seconds between two scans of the incoming directory.
+            settle_seconds (float): Seconds a bundle must stay unchanged before being ingested.
+            tile (callable, optional): Called with (volcano, map, source, destination) for each bundled GeoTIFF.
+        """
+        self.paths = paths
+        self.invalidator = invalidator
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.tile = tile
+        self._stop = threading.Event()
+        self._thread = None
+        self.published = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Starts scanning the incoming directory in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self._run, name='ingestion-worker', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the scanning thread after the bundle being processed, if any.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error(f"Error scanning {self.paths['incoming']}: {e}")
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """
+        Ingests every settled bundle of the incoming directory. Only one process at a time ingests.
+
+        Returns:
+            dict: Names of the 'published', 'rejected' and 'failed' volcanoes.
+        """
+        result = {'published': [], 'rejected': [], 'failed': []}
+        incoming = self.paths['incoming']
+        if not os.path.isdir(incoming):
+            return result
+        with open(os.path.join(incoming, LOCK_FILE), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return result  # Another worker is ingesting
+            for entry in sorted(os.scandir(incoming), key=lambda entry: entry.name):
+                if entry.is_dir() and not entry.name.startswith('.') and self._is_settled(entry.path):
+                    published = self.ingest(entry.path)
+                    result['failed' if published is None else 'published' if published else 'rejected'].append(
+                        entry.name)
+        return result
+
+    def _is_settled(self, bundle_dir):
+        newest = os.stat(bundle_dir).st_mtime
+        for root, dirs, names in os.walk(bundle_dir):
+            for name in dirs + names:
+                newest = max(newest, os.lstat(os.path.join(root, name)).st_mtime)
+        return time.time() - newest >= self.settle_seconds
+
+    def ingest(self, bundle_dir):
+        """
+        Validates, builds and publishes one bundle, or moves it to the trash directory if it is invalid or
+        cannot be built.
+
+        Args:
+            bundle_dir (str): Path to the bundle, named after the volcano.
+
+        Returns:
+            bool: True if the bundle was published, False if it was rejected, or None if publishing failed and
+                the bundle was left in the incoming directory to be retried.
+        """
+        volcano = os.path.basename(os.path.normpath(bundle_dir))
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        errors = validate_bundle(bundle_dir)
+        if errors:
+            self._reject(bundle_dir, volcano, stamp, errors)
+            return False
+        staging_dir = os.path.join(self.paths['temp'], 'ingest', f'{volcano}-{stamp}')
+        try:
+            try:
+                build_staging(bundle_dir, os.path.join(self.paths['volcano'], volcano), staging_dir, self.tile)
+            except Exception as e:
+                log.error(f"Error building {volcano}: {e}")
+                self._reject(bundle_dir, volcano, stamp, [f'build: {e}'])
+                return False
+            try:
+                self._publish(bundle_dir, volcano, staging_dir, stamp)
+            except Exception as e:
+                # The bundle is valid, and the new version may already be published
+                self.failed += 1
+                log.error(f"Error publishing {volcano}, the bundle is kept to be retried: {e}")
+                return None
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        shutil.rmtree(bundle_dir)
+        self.published += 1
+        log.info(f"Published volcano {volcano}")
+        return True
+
+    def _publish(self, bundle_dir, volcano, staging_dir, stamp):
+        from api.shared.tools import replace_dir
+
+        version_dir = unique_path(os.path.join(self.paths['version'], f'{volcano}-{stamp}'))
+        replace_dir(staging_dir, os.path.join(self.paths['volcano'], volcano), os.path.join(version_dir, volcano))
+
+        # The volcano JSON lives at the top of the volcanoes directory and is replaced atomically too
+        summary_path = os.path.join(bundle_dir, volcano + '.json')
+        try:
+            if os.path.isfile(summary_path):
+                published_path = os.path.join(self.paths['volcano'], volcano + '.json')
+                if os.path.isfile(published_path):
+                    os.makedirs(version_dir, exist_ok=True)
+                    shutil.copy2(published_path, version_dir)
+                temp_path = f'{published_path}.tmp{os.getpid()}'
+                shutil.copy2(summary_path, temp_path)
+                os.replace(temp_path, published_path)
+        finally:
+            # The volcano directory was replaced whether or not its summary could be
+            if self.invalidator is not None:
+                self.invalidator.volcano(volcano)
+                if os.path.isfile(summary_path):
+                    self.invalidator.volcano_files(os.path.join(self.paths['volcano'], volcano + '.json'))
+
+    def _reject(self, bundle_dir, volcano, stamp, errors):
+        trash_dir = unique_path(os.path.join(self.paths['trash'], f'{volcano}-{stamp}'))
+        os.makedirs(self.paths['trash'], exist_ok=True)
+        shutil.move(bundle_dir, trash_dir)
+        with open(os.path.join(trash_dir, 'errors.json'), 'w') as file:
+            json.dump(errors, file, indent=2)
+        self.rejected += 1
+        log.error(f"Rejected volcano bundle {volcano}: {'; '.join(errors)}")
+
+
+def create_worker(current_path, config, invalidator=None):
+    """
+    Builds an ingestion worker from the configuration.
+
+    Args:
+        current_path (str): Directory the configured paths are relative to.
+        config (Mapping): Configuration sections, either the Flask config or a ConfigParser.
+        invalidator (Invalidator, optional): Caches to invalidate after each publication.
+
+    Returns:
+        IngestionWorker: A worker that has not been started.
+    """
+    def section(name):
+        return config[name] if name in config else {}
+
+    paths = {key: os.path.join(current_path, config['paths'][key])
+             for key in ('volcano', 'incoming', 'temp', 'version', 'trash')}
+    ingest, tiling = section('ingest'), section('tiling')
+
+    tile = None
+    if str(ingest.get('tile', 'true')).lower() == 'true':
+        from api.shared.tiling import tile_source, DEFAULT_URL
+        tile = partial(tile_source, nb_processes=int(tiling.get('processes_per_file') or 1),
+                       url=tiling.get('url') or DEFAULT_URL, staging_root=os.path.join(paths['temp'], 'tiling'),
+                       zoom=tiling.get('zoom') or None,
+                       archive=str(tiling.get('archive', 'false')).lower() == 'true',
+                       cog=str(tiling.get('cog', 'false')).lower() == 'true')
+    return IngestionWorker(paths, invalidator, interval=float(ingest.get('interval') or 10),
+                           settle_seconds=float(ingest.get('settle_seconds') or DEFAULT_SETTLE_SECONDS), tile=tile)
@@ -0,0 +1,151 @@
+import os
+import logging
+import threading
+
+from flask import current_app
+
+from api.shared.catalog import VOLCANO_FILES as SERVED_FILES, METADATA_DIR
+from api.shared.metadata_cache import metadata_cache
+from api.shared.raster import statistics_cache
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Kinds of invalidation, see Invalidator
+VOLCANO = 'volcano'
+VOLCANO_FILES = 'volcano_files'
+METADATA = 'metadata'
+FILE = 'file'
+
+
+class Invalidator:
+    """
+    Translates changes of the volcanoes directory into targeted invalidations of the in-process caches.
+
+    The catalog and metadata cache are updated directly; other caches subscribe a callback to the kinds
+    of change they depend on:
+
+    - VOLCANO: a volcano directory was published, changed or removed, callback(volcano).
+    - VOLCANO_FILES: a volcano JSON at the top of the volcanoes directory changed, callback(path).
+    - METADATA: one metadata workbook or sidecar changed, callback(volcano, path).
+    - FILE: an image, KML or tile file changed, callback(volcano, path).
+    """
+
+    def __init__(self, catalog):
+        """
+        Args:
+            catalog (Catalog): Index of the volcanoes directory.
+        """
+        self.catalog = catalog
+        self._subscribers = {VOLCANO: [], VOLCANO_FILES: [], METADATA: [], FILE: []}
+        self._lock = threading.Lock()
+        self.issued = {VOLCANO: 0, VOLCANO_FILES: 0, METADATA: 0, FILE: 0}
+
+    def subscribe(self, kind, callback):
+        """
+        Registers a callback for one kind of invalidation.
+
+        Args:
+            kind (str): VOLCANO, VOLCANO_FILES, METADATA or FILE.
+            callback (callable): Called with the arguments documented for the kind.
+        """
+        self._subscribers[kind].append(callback)
+
+    def _notify(self, kind, *args):
+        with self._lock:
+            self.issued[kind] += 1
+        for callback in self._subscribers[kind]:
+            try:
+                callback(*args)
+            except Exception as e:
+                log.error(f"Error invalidating {kind} {args}: {e}")
+
+    def volcano(self, volcano):
+        """
+        Rescans one volcano and drops everything cached from its files.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+        """
+        self.catalog.refresh_volcano(volcano)
+        metadata_cache.invalidate_prefix(os.path.join(self.catalog.root, volcano) + os.sep)
+        statistics_cache.invalidate_prefix(os.path.join(self.catalog.root, volcano) + os.sep)
+        self._notify(VOLCANO, volcano)
+
+    def volcano_files(self, path=None):
+        """
+        Rescans the volcano JSON files.
+
+        Args:
+            path (str, optional): The JSON file that changed.
+        """
+        self.catalog.refresh_volcano_files()
+        self._notify(VOLCANO_FILES, path)
+
+    def metadata(self, volcano, path):
+        """
+        Drops one metadata workbook from the caches, rescanning the volcano if a map appeared or vanished.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            path (str): Path to the workbook or its sidecar.
+        """
+        stem = os.path.splitext(path)[0]
+        workbook_path = stem + '.xlsx'
+        metadata_cache.invalidate(workbook_path)
+        if os.path.basename(os.path.dirname(path)) == METADATA_DIR:
+            try:
+                indexed = os.path.basename(stem) in self.catalog.maps_for_volcano(volcano)
+            except KeyError:
+                indexed = False
+            if indexed != (os.path.isfile(workbook_path) or os.path.isfile(stem + '.json')):
+                self.catalog.refresh_volcano(volcano)
+        self._notify(METADATA, volcano, workbook_path)
+
+    def file(self, volcano, path):
+        """
+        Signals that a served file changed, rescanning the volcano if it appeared or vanished.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            path (str): Path to the file.
+        """
+        filetype = _served_filetype(path)
+        if filetype and (self.catalog.file_path(volcano, filetype) is None) == os.path.isfile(path):
+            self.catalog.refresh_volcano(volcano)
+        self._notify(FILE, volcano, path)
+
+    def rebuild(self):
+        """
+        Rescans the whole volcanoes directory and drops every cached entry, when changes may have been missed.
+        """
+        previous = set(self.catalog.volcano_names())
+        self.catalog.rebuild()
+        metadata_cache.clear()
+        statistics_cache.clear()
+        self._notify(VOLCANO_FILES, None)
+        for volcano in sorted(previous | set(self.catalog.volcano_names())):
+            self._notify(VOLCANO, volcano)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of invalidations issued by kind.
+        """
+        with self._lock:
+            return dict(self.issued)
+
+
+def _served_filetype(path):
+    # Inverse lookup of catalog.VOLCANO_FILES for a changed path
+    for filetype, relative_path in SERVED_FILES.items():
+        if path.endswith(os.sep + relative_path):
+            return filetype
+    return None
+
+
+def get_invalidator():
+    """
+    Returns:
+        Invalidator: The invalidator of the current Flask application.
+    """
+    return current_app.extensions['invalidator']
@@ -0,0 +1,16 @@
+import os
+import logging.config
+
+# Logging configuration at the root of the repository
+LOGGING_CONF_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'logging.conf'))
+
+
+def create_log():
+    """
+    Configures logging from logging.conf, for the server and the offline tools alike.
+
+    Returns:
+        logging.Logger: Logger of the application.
+    """
+    logging.config.fileConfig(LOGGING_CONF_PATH)
+    return logging.getLogger(__name__)
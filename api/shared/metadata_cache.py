@@ -0,0 +1,121 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from api.shared.xlsx_parser import parse_xlsx, metadata_signature
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+class MetadataCache:
+    """
+    Bounded LRU cache of parsed metadata dictionaries, keyed by file path.
+
+    Every entry remembers the mtime and size of the files it was parsed from, and a lookup whose
+    files no longer match is treated as a miss and parsed again.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, loader=parse_xlsx, signature=metadata_signature):
+        """
+        Args:
+            max_entries (int): Maximum number of parsed files kept in memory.
+            loader (callable): Function that parses a file path into a dictionary.
+            signature (callable): Function that identifies the current version of a file path.
+        """
+        self.max_entries = max_entries
+        self.loader = loader
+        self.signature = signature
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, max_entries):
+        """
+        Changes the maximum number of entries, evicting the least recently used ones if needed.
+
+        Args:
+            max_entries (int): Maximum number of parsed files kept in memory.
+        """
+        with self._lock:
+            self.max_entries = max(int(max_entries), 0)
+            self._evict()
+
+    def get(self, path):
+        """
+        Returns the parsed content of a file, parsing it only if it is not cached or has changed.
+
+        Args:
+            path (str): Path to the metadata file.
+
+        Returns:
+            dict: A copy of the parsed metadata.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        signature = self.signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return dict(entry[1])
+            self.misses += 1
+
+        # Parse outside the lock so a slow workbook does not block other lookups
+        data = self.loader(path)
+        with self._lock:
+            self._entries[path] = (signature, data)
+            self._entries.move_to_end(path)
+            self._evict()
+        return dict(data)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, path):
+        """
+        Drops the entry of a single file.
+
+        Args:
+            path (str): Path to the metadata file.
+        """
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_prefix(self, prefix):
+        """
+        Drops every entry whose path starts with the given prefix, e.g. a volcano directory.
+
+        Args:
+            prefix (str): Path prefix to invalidate.
+        """
+        with self._lock:
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                del self._entries[path]
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current size, capacity and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+# Cache shared by every endpoint of the process
+metadata_cache = MetadataCache()
@@ -0,0 +1,312 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+from flask import request, g, Response
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNMATCHED_ENDPOINT = 'unmatched'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    A metric with a value per combination of label values, updated under its own lock.
+    """
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        """
+        Args:
+            name (str): Name of the metric, e.g. 'http_requests_total'.
+            description (str): Help text of the metric.
+            labels (tuple): Names of the labels.
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """
+        Returns:
+            list: (name suffix, label names, label values, value) of every sample.
+        """
+        with self._lock:
+            return [('', self.labels, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self, constant=()):
+        """
+        Args:
+            constant (tuple): (name, value) labels added to every sample, e.g. the process id.
+
+        Returns:
+            list: Lines of the metric in the Prometheus text format.
+        """
+        constant_names, constant_values = tuple(name for name, _ in constant), tuple(value for _, value in constant)
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        for suffix, names, values, value in self.samples():
+            labels = _format_labels(constant_names + names, constant_values + values)
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """
+        Args:
+            *labels: Label values, in the order of the label names.
+            amount (int): Increment.
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Sorted upper bounds of the buckets, +Inf is implied.
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """
+        Args:
+            value (float): Observed value, e.g. a duration in seconds.
+            *labels: Label values, in the order of the label names.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket and +Inf, then the sum of the observations
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in sorted(self._values.items())]
+        names = self.labels + ('le',)
+        samples = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append(('_bucket', names, key + (bound,), cumulative))
+            samples.append(('_sum', self.labels, key, counts[-1]))
+            samples.append(('_count', self.labels, key, cumulative))
+        return samples
+
+
+class Registry:
+    """
+    Metrics of the process, rendered in the Prometheus text format.
+
+    Metrics updated on the request path only take a lock and update a dictionary, while the state of the
+    caches and indexes is read from collectors when the metrics are scraped. Every sample is labelled with
+    the pid of the process, so that the series of the workers of a server never mix.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        """
+        Args:
+            metric (Metric): Metric to render.
+
+        Returns:
+            Metric: The metric, to allow defining and registering it at once.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        Args:
+            collector (callable): Returns a list of (name, kind, description, labels dict, value) samples
+                read when the metrics are scraped.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Returns:
+            str: Every metric and collected sample in the Prometheus text format.
+        """
+        # Read at every scrape, as the registry is created before the workers are forked
+        constant = (('pid', os.getpid()),)
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(constant))
+        described = set()
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                log.error(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, description, labels, value in samples:
+                if name not in described:
+                    lines.extend([f'# HELP {name} {description}', f'# TYPE {name} {kind}'])
+                    described.add(name)
+                labels = {**dict(constant), **labels}
+                lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics shared by every part of the process
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'http_requests_total', 'Requests handled, by endpoint, method and status.', ('endpoint', 'method', 'status')))
+request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to build the responses, by endpoint and method.', ('endpoint', 'method')))
+response_size = registry.register(Histogram(
+    'http_response_size_bytes', 'Size of the response bodies, when known, by endpoint.', ('endpoint',),
+    SIZE_BUCKETS))
+requests_in_flight = registry.register(Gauge(
+    'http_requests_in_flight', 'Requests being handled.'))
+span_duration = registry.register(Histogram(
+    'span_duration_seconds', 'Duration of the expensive steps of the requests and background tasks.', ('span',)))
+
+
+@contextmanager
+def span(name):
+    """
+    Times a step, e.g. `with span('xlsx_parse'):`, into span_duration_seconds.
+
+    Args:
+        name (str): Name of the step.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span_duration.observe(time.perf_counter() - start, name)
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    requests_in_flight.inc()
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else UNMATCHED_ENDPOINT
+    request_duration.observe(time.perf_counter() - start, endpoint, request.method)
+    requests_total.inc(endpoint, request.method, str(response.status_code))
+    if response.content_length is not None:
+        response_size.observe(response.content_length, endpoint)
+    return response
+
+
+def _teardown_request(exception):
+    requests_in_flight.dec()
+
+
+def metrics_view():
+    """
+    Returns:
+        Response: The metrics of this process in the Prometheus text format.
+    """
+    return Response(registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+def _flatten(stats, prefix=''):
+    # Numeric values of a stats() dictionary, nested keys joined with dots
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f'{prefix}{key}', value
+
+
+def component_samples(components):
+    """
+    Reads the stats() of the caches and indexes of the process.
+
+    Args:
+        components (dict): Objects with a stats() method returning a dictionary, by name.
+
+    Returns:
+        list: Samples of the component_stat gauge, one per numeric statistic.
+    """
+    samples = []
+    for component, instance in components.items():
+        for stat, value in _flatten(instance.stats()):
+            samples.append(('component_stat', 'gauge', 'Statistics of the caches, indexes and background workers.',
+                            {'component': component, 'stat': stat}, value))
+    return samples
+
+
+def init_metrics(flask_app, components):
+    """
+    Records the latency, size and status of every request of an application, and serves the metrics on
+    /metrics together with the statistics of its caches and indexes. The after_request hook must be
+    registered before the hooks that change the response body, such as compression, so that it sees the
+    body actually sent.
+
+    :param flask_app: Instance of the Flask app
+    :param components: Objects with a stats() method, by name, in addition to the extensions of the app that
+        have one
+    """
+    flask_app.before_request(_before_request)
+    flask_app.after_request(_after_request)
+    flask_app.teardown_request(_teardown_request)
+    flask_app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    def collect():
+        extensions = {name: extension for name, extension in flask_app.extensions.items()
+                      if callable(getattr(extension, 'stats', None))}
+        return component_samples({**components, **extensions})
+    registry.add_collector(collect)
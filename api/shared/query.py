@@ -0,0 +1,133 @@
+import base64
+import bisect
+import logging
+from urllib.parse import urlencode
+
+from flask import current_app, request, abort
+
+from api.shared.serialization import parse_fields, projection, json_response
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+DEFAULT_MAX_LIMIT = 1000
+
+
+def encode_cursor(key):
+    """
+    Args:
+        key (str): Sort key of the last item of a page.
+
+    Returns:
+        str: Opaque, URL safe cursor designating the items after it.
+    """
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Args:
+        cursor (str): Cursor returned by encode_cursor.
+
+    Returns:
+        str: Sort key of the last item of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    return base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode('utf-8')
+
+
+def page_arguments():
+    """
+    Reads the cursor and limit query parameters of the current request, aborting with 400 if they are invalid.
+
+    Returns:
+        tuple: Sort key after which the page starts, or None for the first page, and the maximum number of
+        items, or None for every remaining item.
+    """
+    max_limit = int(current_app.config.get('pagination', {}).get('max_limit') or DEFAULT_MAX_LIMIT)
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit')
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        abort(400, "Invalid 'cursor'.")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= max_limit:
+            abort(400, f"'limit' must be between 1 and {max_limit}.")
+    return after, limit
+
+
+def paginate(items, after=None, limit=None, key=str):
+    """
+    Selects a page of items sorted by key. Pages start after the key of the last item already returned, so
+    items added or removed between two requests neither shift nor repeat the following pages.
+
+    Args:
+        items (list): Items sorted by key, e.g. a list of the catalog.
+        after (str, optional): Sort key after which the page starts.
+        limit (int, optional): Maximum number of items, every remaining item by default.
+        key (callable): Returns the sort key of an item.
+
+    Returns:
+        tuple: The page and the response headers, with a Link to the next page if there is one, as an absolute
+        path without the host.
+    """
+    start = 0 if after is None else bisect.bisect_right([key(item) for item in items], after)
+    end = len(items) if limit is None else min(start + limit, len(items))
+    page = items[start:end]
+    if end >= len(items) or not page:
+        return page, {}
+    args = request.args.copy()
+    args['cursor'] = encode_cursor(key(page[-1]))
+    # Relative to the host, as the responses are cached regardless of the host and scheme they were requested on
+    path = request.script_root + request.path
+    return page, {'Link': f'<{path}?{urlencode(list(args.items(multi=True)))}>; rel="next"'}
+
+
+def page_response(items, after=None, limit=None, key=str, code=200):
+    """
+    Builds the JSON response of a page of items, see paginate. Anything but a list, such as an error, is
+    sent as is.
+
+    Returns:
+        Response: The JSON list of the page, with a Link header to the next page if there is one.
+    """
+    if not isinstance(items, list):
+        return json_response(items, code)
+    page, headers = paginate(items, after, limit, key)
+    return json_response(page, code, headers)
+
+
+def fields_argument():
+    """
+    Reads the fields query parameter of the current request, aborting with 400 if it is malformed.
+
+    Returns:
+        dict: Projection returned by api.shared.serialization.parse_fields, or None for every field.
+    """
+    try:
+        return parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        abort(400, f"Invalid 'fields': {e}")
+
+
+def model_projection(model):
+    """
+    Returns the projection of a model restricted to the fields query parameter of the current request,
+    aborting with 400 if it is malformed or names unknown fields.
+
+    Args:
+        model (Model): A restx model.
+
+    Returns:
+        callable: See api.shared.serialization.compile_model.
+    """
+    try:
+        return projection(model, request.args.get('fields'))
+    except ValueError as e:
+        abort(400, f"Invalid 'fields': {e}")
@@ -0,0 +1,253 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import current_app
+
+from api.shared.metrics import span
+from api.shared.metadata_cache import MetadataCache
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+DEFAULT_MAX_HANDLES = 32
+DEFAULT_MAX_POINTS = 10000
+
+
+class RasterPool:
+    """
+    GDAL datasets of the rasters queried by the point endpoints, kept open by each worker.
+
+    GDAL datasets must not be used by two threads at once, so a handle is checked out for the duration of
+    a query and returned to the pool afterwards. At most max_handles idle handles are kept, the least
+    recently used rasters are closed first, and handles of a replaced file are discarded.
+    """
+
+    def __init__(self, max_handles=DEFAULT_MAX_HANDLES):
+        """
+        Args:
+            max_handles (int): Maximum number of idle handles kept open.
+        """
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()  # Path -> idle handles, least recently used path first
+        self.idle = 0
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def _open(path, signature):
+        # Handle of a raster, with what the queries need to know about it
+        from osgeo import gdal, osr
+
+        gdal.UseExceptions()
+        dataset = gdal.Open(path)
+        wgs84 = osr.SpatialReference()
+        wgs84.ImportFromEPSG(4326)
+        wgs84.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)  # Longitude first
+        transform = None
+        srs = dataset.GetSpatialRef()
+        if srs is not None and not srs.IsSame(wgs84):
+            srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(wgs84, srs)
+        geotransform = dataset.GetGeoTransform()
+        return {
+            'signature': signature,
+            'dataset': dataset,
+            'transform': transform,
+            'inverse': gdal.InvGeoTransform(geotransform),
+            'width': dataset.RasterXSize,
+            'height': dataset.RasterYSize,
+            'bands': dataset.RasterCount,
+        }
+
+    @contextmanager
+    def dataset(self, path):
+        """
+        Checks out a handle of a raster, e.g. `with pool.dataset(path) as handle:`.
+
+        Args:
+            path (str): Path to the raster.
+
+        Yields:
+            dict: The GDAL 'dataset', the 'transform' from WGS84 to its CRS (None if it is WGS84), the
+                'inverse' geotransform, its 'width', 'height' and number of 'bands'.
+
+        Raises:
+            FileNotFoundError: If the raster does not exist.
+        """
+        stat = os.stat(path)
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        handle = None
+        with self._lock:
+            handles = self._idle.get(path, [])
+            while handles and handle is None:
+                candidate = handles.pop()
+                self.idle -= 1
+                if candidate['signature'] == signature:
+                    handle = candidate
+            if not handles:
+                self._idle.pop(path, None)
+            if handle is not None:
+                self.reused += 1
+        if handle is None:
+            handle = self._open(path, signature)
+            with self._lock:
+                self.opened += 1
+        try:
+            yield handle
+        finally:
+            with self._lock:
+                self._idle.setdefault(path, []).append(handle)
+                self._idle.move_to_end(path)
+                self.idle += 1
+                while self.idle > self.max_handles:
+                    oldest = next(iter(self._idle))
+                    self._idle[oldest].pop(0)
+                    self.idle -= 1
+                    if not self._idle[oldest]:
+                        del self._idle[oldest]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of idle handles and of rasters open, handles opened and reused.
+        """
+        with self._lock:
+            return {'idle': self.idle, 'rasters': len(self._idle), 'max_handles': self.max_handles,
+                    'opened': self.opened, 'reused': self.reused}
+
+
+def sample_points(handle, lons, lats, band_number=1):
+    """
+    Reads the values of a raster band at WGS84 points.
+
+    Points are transformed to the raster CRS and to pixel indices at once with NumPy. Only the blocks
+    holding points are read, or the window bounding the points when it is smaller than those blocks.
+
+    Args:
+        handle (dict): Handle checked out from a RasterPool.
+        lons (list): Longitudes of the points.
+        lats (list): Latitudes of the points.
+        band_number (int): Band to read, from 1.
+
+    Returns:
+        numpy.ndarray: Value at each point, NaN outside the raster, where it has no data or for invalid coordinates.
+
+    Raises:
+        ValueError: If the band does not exist.
+    """
+    import numpy as np
+
+    if not 1 <= band_number <= handle['bands']:
+        raise ValueError(f"The raster has no band {band_number}")
+    lons, lats = np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)
+    valid = np.isfinite(lons) & np.isfinite(lats) & (np.abs(lons) <= 180) & (np.abs(lats) <= 90)
+    xs, ys = np.where(valid, lons, np.nan), np.where(valid, lats, np.nan)
+    if handle['transform'] is not None and valid.any():
+        projected = np.asarray(handle['transform'].TransformPoints(np.column_stack([lons[valid], lats[valid]])),
+                               dtype=np.float64)
+        xs[valid], ys[valid] = projected[:, 0], projected[:, 1]
+
+    inverse = handle['inverse']
+    columns = inverse[0] + inverse[1] * xs + inverse[2] * ys
+    rows = inverse[3] + inverse[4] * xs + inverse[5] * ys
+    inside = (np.isfinite(columns) & np.isfinite(rows) & (columns >= 0) & (columns < handle['width'])
+              & (rows >= 0) & (rows < handle['height']))
+    values = np.full(xs.shape, np.nan)
+    points = np.flatnonzero(inside)
+    if not points.size:
+        return values
+    columns, rows = columns[points].astype(np.int64), rows[points].astype(np.int64)
+
+    band = handle['dataset'].GetRasterBand(band_number)
+    block_width, block_height = band.GetBlockSize()
+    blocks_per_row = -(-handle['width'] // block_width)
+    keys = (rows // block_height) * blocks_per_row + columns // block_width
+    blocks, block_of_point = np.unique(keys, return_inverse=True)
+    left, top = int(columns.min()), int(rows.min())
+    width, height = int(columns.max()) - left + 1, int(rows.max()) - top + 1
+    with span('raster_read'):
+        if width * height <= blocks.size * block_width * block_height:
+            window = band.ReadAsArray(left, top, width, height)
+            values[points] = window[rows - top, columns - left]
+        else:
+            # Points grouped by block, one read per block
+            order = np.argsort(block_of_point, kind='stable')
+            bounds = np.searchsorted(block_of_point[order], np.arange(blocks.size + 1))
+            for number, key in enumerate(blocks):
+                members = order[bounds[number]:bounds[number + 1]]
+                x, y = int(key % blocks_per_row) * block_width, int(key // blocks_per_row) * block_height
+                block = band.ReadAsArray(x, y, min(block_width, handle['width'] - x),
+                                         min(block_height, handle['height'] - y))
+                values[points[members]] = block[rows[members] - y, columns[members] - x]
+
+    nodata = band.GetNoDataValue()
+    if nodata is not None:
+        values[values == nodata] = np.nan
+    return values
+
+
+def statistics_signature(path):
+    """
+    Args:
+        path (str): Path to a statistics sidecar.
+
+    Returns:
+        tuple: Modification time and size of the sidecar.
+
+    Raises:
+        FileNotFoundError: If the sidecar does not exist.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_statistics(path):
+    """
+    Args:
+        path (str): Path to a statistics sidecar.
+
+    Returns:
+        dict: The statistics of the raster.
+    """
+    with span('json_load'), open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+# Statistics sidecars read by the metadata endpoints, shared by every endpoint of the process
+statistics_cache = MetadataCache(loader=load_statistics, signature=statistics_signature)
+
+
+def get_statistics(catalog, volcano, map_type):
+    """
+    Reads the precomputed statistics of the raster of a map, without opening the raster.
+
+    Args:
+        catalog (Catalog): Index of the volcanoes directory.
+        volcano (str): Name of the volcano.
+        map_type (str): Type of map.
+
+    Returns:
+        dict: The statistics of each band, or None if they were not computed.
+    """
+    path = catalog.statistics_path(volcano, map_type)
+    if path is None:
+        return None
+    try:
+        return statistics_cache.get(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.error(f"Error reading raster statistics {path}: {e}")
+        return None
+
+
+def get_raster_pool():
+    """
+    Returns:
+        RasterPool: The raster handles of the current Flask application.
+    """
+    return current_app.extensions['raster_pool']
@@ -0,0 +1,276 @@
+import os
+import math
+import zlib
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+from api.shared.constants import WEB_MERCATOR_HALF_SIZE, DEFAULT_TILE_SIZE
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Cloud-Optimized GeoTIFF written by api.shared.tools.tif_to_cog next to the pyramid directory:
+# <volcano>/kml/<map>.cog.tif, aligned on the web mercator tiles
+COG_EXTENSION = '.cog.tif'
+
+# COGs kept open by each rendering thread, see Renderer
+DEFAULT_MAX_DATASETS = 8
+
+
+# Colors of continuous rasters, from the lowest to the highest value: (position, (red, green, blue))
+DEFAULT_COLORMAP = (
+    (0.0, (255, 255, 178)),
+    (0.25, (254, 204, 92)),
+    (0.5, (253, 141, 60)),
+    (0.75, (240, 59, 32)),
+    (1.0, (189, 0, 38)),
+)
+
+
+def cog_path(pyramid_dir):
+    """
+    Args:
+        pyramid_dir (str): Output directory of a pyramid, see tiling.output_dir.
+
+    Returns:
+        str: Path of the Cloud-Optimized GeoTIFF rendered instead of the pyramid.
+    """
+    return os.path.normpath(pyramid_dir) + COG_EXTENSION
+
+
+def tile_bounds(z, x, y):
+    """
+    Args:
+        z (int): Zoom level.
+        x (int): Column, from the west.
+        y (int): Row, from the north (XYZ scheme).
+
+    Returns:
+        tuple: West, south, east and north bounds of the tile in web mercator meters (EPSG:3857).
+    """
+    size = 2 * WEB_MERCATOR_HALF_SIZE / 2 ** z
+    west = -WEB_MERCATOR_HALF_SIZE + x * size
+    north = WEB_MERCATOR_HALF_SIZE - y * size
+    return west, north - size, west + size, north
+
+
+def encode_png(raw, width, height, level=6):
+    """
+    Args:
+        raw (bytes): RGBA scanlines, each one preceded by its filter type byte.
+        width (int): Width of the image, in pixels.
+        height (int): Height of the image, in pixels.
+        level (int): zlib compression level.
+
+    Returns:
+        bytes: The PNG file.
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, level)) + chunk(b'IEND', b''))
+
+
+def encode_rgba(rgba):
+    """
+    Args:
+        rgba (numpy.ndarray): Image of shape (height, width, 4) and type uint8.
+
+    Returns:
+        bytes: The image as a PNG file.
+    """
+    import numpy as np
+
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)  # Filter type 0 (none) on every scanline
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+    return encode_png(raw.tobytes(), width, height)
+
+
+def colormap_lut(stops=DEFAULT_COLORMAP):
+    """
+    Args:
+        stops (tuple): (position, (red, green, blue)) pairs, positions increasing from 0 to 1.
+
+    Returns:
+        numpy.ndarray: 256 RGBA colors interpolated between the stops, opaque.
+    """
+    import numpy as np
+
+    positions = np.array([position for position, _ in stops]) * 255
+    lut = np.full((256, 4), 255, dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.interp(np.arange(256), positions, [color[channel] for _, color in stops])
+    return lut
+
+
+class Renderer:
+    """
+    Renders web map tiles from Cloud-Optimized GeoTIFFs aligned on the web mercator tiles.
+
+    Each tile is one windowed read of the raster, decimated by GDAL from the closest overview, then
+    colorized with NumPy: RGB(A) rasters are used as is, paletted rasters through their color table and
+    other single band rasters through a colormap stretched over their value range. GDAL datasets are not
+    thread-safe, so each thread keeps its own handles, reopened when a COG is replaced. At most
+    max_datasets handles are kept per thread, the least recently rendered COGs are closed first.
+    """
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE, colormap=DEFAULT_COLORMAP, max_datasets=DEFAULT_MAX_DATASETS):
+        """
+        Args:
+            tile_size (int): Width and height of the tiles, in pixels.
+            colormap (tuple): Colors of continuous rasters, see DEFAULT_COLORMAP.
+            max_datasets (int): Maximum number of COGs kept open by each thread.
+        """
+        self.tile_size = tile_size
+        self.colormap = colormap
+        self.max_datasets = max_datasets
+        self._local = threading.local()
+        self._lut = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.closed = 0
+
+    def _open(self, path, signature):
+        # Dataset of a COG and what rendering needs to know about it, per thread and COG version
+        from osgeo import gdal
+        import numpy as np
+
+        datasets = getattr(self._local, 'datasets', None)
+        if datasets is None:
+            datasets = self._local.datasets = OrderedDict()  # Path -> info, least recently used first
+        cached = datasets.get(path)
+        if cached is not None and cached['signature'] == signature:
+            datasets.move_to_end(path)
+            return cached
+
+        dataset = gdal.OpenEx(path, gdal.OF_RASTER | gdal.OF_READONLY)
+        band = dataset.GetRasterBand(1)
+        info = {'signature': signature, 'dataset': dataset, 'geotransform': dataset.GetGeoTransform(),
+                'width': dataset.RasterXSize, 'height': dataset.RasterYSize, 'bands': dataset.RasterCount,
+                'nodata': band.GetNoDataValue(), 'palette': None, 'range': None}
+        # Zoom levels of the full resolution and of the smallest overview, tif_to_cog makes one per level
+        pixel_size = abs(info['geotransform'][1])
+        native = max(round(math.log2(2 * WEB_MERCATOR_HALF_SIZE / (self.tile_size * pixel_size))), 0)
+        info['zoom'] = (max(native - band.GetOverviewCount(), 0), native)
+        color_table = band.GetColorTable()
+        if dataset.RasterCount < 3 and color_table is not None:
+            palette = np.zeros((256, 4), dtype=np.uint8)
+            for index in range(min(color_table.GetCount(), 256)):
+                palette[index] = color_table.GetColorEntry(index)
+            info['palette'] = palette
+        elif dataset.RasterCount < 3:
+            info['range'] = band.ComputeRasterMinMax(True)  # Approximate, from the overviews
+        closed = 1 if datasets.pop(path, None) is not None else 0  # Replaced COG
+        datasets[path] = info
+        while len(datasets) > self.max_datasets:
+            datasets.popitem(last=False)  # Closed once its last reference is dropped
+            closed += 1
+        with self._lock:
+            self.opened += 1
+            self.closed += closed
+        return info
+
+    def stats(self):
+        """
+        Returns:
+            dict: Maximum number of COGs open per thread, and number of datasets opened and closed.
+        """
+        with self._lock:
+            return {'max_datasets': self.max_datasets, 'opened': self.opened, 'closed': self.closed}
+
+    def _window(self, info, z, x, y):
+        # Pixel window of the raster covering a tile, and where it lands in the tile, or None outside
+        west, south, east, north = tile_bounds(z, x, y)
+        origin_x, pixel_width, _, origin_y, _, pixel_height = info['geotransform']
+        left, right = (west - origin_x) / pixel_width, (east - origin_x) / pixel_width
+        top, bottom = (north - origin_y) / pixel_height, (south - origin_y) / pixel_height
+        clip_left, clip_right = max(left, 0), min(right, info['width'])
+        clip_top, clip_bottom = max(top, 0), min(bottom, info['height'])
+        if clip_left >= clip_right or clip_top >= clip_bottom:
+            return None
+        scale_x, scale_y = self.tile_size / (right - left), self.tile_size / (bottom - top)
+        tile_left, tile_right = round((clip_left - left) * scale_x), round((clip_right - left) * scale_x)
+        tile_top, tile_bottom = round((clip_top - top) * scale_y), round((clip_bottom - top) * scale_y)
+        if tile_left >= tile_right or tile_top >= tile_bottom:
+            return None
+        read_x, read_y = int(math.floor(clip_left)), int(math.floor(clip_top))
+        read_width = max(int(math.ceil(clip_right)) - read_x, 1)
+        read_height = max(int(math.ceil(clip_bottom)) - read_y, 1)
+        return (read_x, read_y, read_width, read_height), (tile_left, tile_top, tile_right, tile_bottom)
+
+    def covers(self, path, signature, z, x, y):
+        """
+        Tells whether a tile is worth rendering and caching.
+
+        Args:
+            path (str): Path to the COG.
+            signature (tuple): Version of the COG, e.g. its inode and mtime, to reopen replaced files.
+            z (int): Zoom level.
+            x (int): Column, from the west.
+            y (int): Row, from the north (XYZ scheme).
+
+        Returns:
+            bool: False if the tile is outside of the raster or of the zoom levels of its overviews.
+        """
+        info = self._open(path, signature)
+        return info['zoom'][0] <= z <= info['zoom'][1] and self._window(info, z, x, y) is not None
+
+    def _colorize(self, info, data):
+        # RGBA pixels of the values read, (bands, height, width) to (height, width, 4)
+        import numpy as np
+
+        nodata = info['nodata']
+        mask = np.zeros(data.shape[1:], dtype=bool) if nodata is None else np.all(data == nodata, axis=0)
+        if info['bands'] >= 3:
+            rgba = np.empty(data.shape[1:] + (4,), dtype=np.uint8)
+            rgba[..., :3] = np.moveaxis(data[:3], 0, -1)
+            rgba[..., 3] = data[3] if info['bands'] >= 4 else 255
+        elif info['palette'] is not None:
+            rgba = info['palette'][np.clip(data[0], 0, 255).astype(np.uint8)]
+        else:
+            values = data[0].astype(np.float64)
+            mask |= np.isnan(values)
+            low, high = info['range']
+            scaled = np.clip((values - low) * (255.0 / (high - low) if high > low else 0.0), 0, 255)
+            if self._lut is None:
+                self._lut = colormap_lut(self.colormap)
+            rgba = self._lut[np.nan_to_num(scaled).astype(np.uint8)]
+        rgba[mask, 3] = 0
+        return rgba
+
+    def render(self, path, signature, z, x, y):
+        """
+        Renders one tile of a COG.
+
+        Args:
+            path (str): Path to the COG.
+            signature (tuple): Version of the COG, e.g. its inode and mtime, to reopen replaced files.
+            z (int): Zoom level.
+            x (int): Column, from the west.
+            y (int): Row, from the north (XYZ scheme).
+
+        Returns:
+            bytes: The tile as a PNG, or None if the raster has no data in the tile.
+        """
+        from osgeo import gdal
+        import numpy as np
+
+        info = self._open(path, signature)
+        window = self._window(info, z, x, y)
+        if window is None:
+            return None
+        (read_x, read_y, read_width, read_height), (left, top, right, bottom) = window
+        resampling = gdal.GRIORA_NearestNeighbour if info['palette'] is not None else gdal.GRIORA_Average
+        data = info['dataset'].ReadAsArray(read_x, read_y, read_width, read_height, buf_xsize=right - left,
+                                           buf_ysize=bottom - top, resample_alg=resampling)
+        if data.ndim == 2:
+            data = data[np.newaxis]
+        rgba = self._colorize(info, data)
+        if not rgba[..., 3].any():
+            return None
+        tile = np.zeros((self.tile_size, self.tile_size, 4), dtype=np.uint8)
+        tile[top:bottom, left:right] = rgba
+        return encode_rgba(tile)
@@ -0,0 +1,259 @@
+import os
+import re
+import logging
+import threading
+
+from flask import current_app
+
+from api.shared.metadata_cache import metadata_cache
+from api.shared.invalidation import VOLCANO, METADATA
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Facets by query parameter: metadata row, and whether the row holds a list of values
+FACETS = {
+    'category': ('Category', False),
+    'functionality': ('Functionality', False),
+    'item_type': ('Item type', False),
+    'hazard': ('Hazard type:', False),
+    'model': ('Hazard type- Model name', False),
+    'product_type': ('Hazard type-Product type', False),
+    'parameter': ('Hazard type- Parameter', False),
+    'country': ('Geographical location-  Country', False),
+    'volcano_name': ('Geographical location- Volcano name', False),
+    'authors': ('Authors', True),
+    'tag': ('Tag-keywords', True),
+}
+CATALOG_FACETS = ('volcano', 'type')  # Facets taken from the catalog rather than from the metadata
+TEXT_FIELDS = ('Name', 'Tag-keywords')  # Metadata rows searched by keywords
+
+LIST_SEPARATOR = re.compile(r'[,;\n]')
+WORD = re.compile(r'\w+')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+
+
+def _normalize(value):
+    return ' '.join(str(value).split()).casefold()
+
+
+def facet_values(metadata, row, multiple):
+    """
+    Reads the values of a facet from map metadata.
+
+    Args:
+        metadata (dict): Parsed map metadata.
+        row (str): Metadata row of the facet.
+        multiple (bool): Whether the row holds a comma or semicolon separated list.
+
+    Returns:
+        list: Distinct non-empty values, as written in the metadata.
+    """
+    value = metadata.get(row)
+    if value is None or str(value).strip() == '':
+        return []
+    values = LIST_SEPARATOR.split(str(value)) if multiple else [str(value)]
+    return list(dict.fromkeys(' '.join(value.split()) for value in values if value.strip()))
+
+
+def keywords(text):
+    """
+    Returns:
+        set: Lowercase words of a text.
+    """
+    return set(WORD.findall(str(text or '').casefold()))
+
+
+class SearchIndex:
+    """
+    Inverted index of the map metadata, for faceted and keyword search.
+
+    Every map is a document identified by (volcano, type). Postings map each facet value and each
+    keyword of the TEXT_FIELDS to the set of documents that contain it, so a search intersects a few
+    sets instead of reading any workbook. Documents are updated one at a time when their workbook or
+    volcano changes.
+    """
+
+    def __init__(self, catalog):
+        """
+        Args:
+            catalog (Catalog): Index of the volcanoes directory.
+        """
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._documents = {}  # (volcano, type) -> {'name', 'facets': {facet: [values]}, 'keywords': set}
+        self._postings = {facet: {} for facet in CATALOG_FACETS + tuple(FACETS)}  # facet -> value -> keys
+        self._labels = {facet: {} for facet in self._postings}  # facet -> value -> value as first written
+        self._keywords = {}  # keyword -> keys
+
+    def subscribe(self, invalidator):
+        """
+        Keeps the index up to date with the changes signalled by an invalidator.
+
+        Args:
+            invalidator (Invalidator): Source of the changes.
+        """
+        invalidator.subscribe(VOLCANO, self.index_volcano)
+        invalidator.subscribe(METADATA, self._metadata_changed)
+
+    def rebuild(self):
+        """
+        Indexes the metadata of every map of the catalog.
+
+        Returns:
+            SearchIndex: The index itself, to allow chaining after construction.
+        """
+        for volcano in self.catalog.volcano_names():
+            self.index_volcano(volcano)
+        log.info(f"Search index built: {len(self._documents)} maps, {len(self._keywords)} keywords")
+        return self
+
+    def index_volcano(self, volcano):
+        """
+        Indexes the maps of one volcano, dropping those that no longer exist.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+        """
+        try:
+            map_types = self.catalog.maps_for_volcano(volcano)
+        except KeyError:
+            map_types = []
+        with self._lock:
+            stale = [key for key in self._documents if key[0] == volcano and key[1] not in map_types]
+            for key in stale:
+                self._remove(key)
+        for map_type in map_types:
+            self.index_map(volcano, map_type)
+
+    def _metadata_changed(self, volcano, path):
+        if os.path.basename(os.path.dirname(path)) == 'metadata':
+            self.index_map(volcano, os.path.splitext(os.path.basename(path))[0])
+
+    def index_map(self, volcano, map_type):
+        """
+        Indexes, reindexes or removes one map, according to its metadata workbook.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            map_type (str): Type of map.
+        """
+        key = (volcano, map_type)
+        try:
+            metadata = metadata_cache.get(self.catalog.metadata_path(volcano, map_type))
+        except FileNotFoundError:
+            metadata = None
+        except Exception as e:
+            log.error(f"Error indexing the metadata of {map_type} for {volcano}: {e}")
+            metadata = None
+
+        document = None
+        if metadata is not None:
+            facets = {'volcano': [volcano], 'type': [map_type]}
+            for facet, (row, multiple) in FACETS.items():
+                facets[facet] = facet_values(metadata, row, multiple)
+            document = {'name': metadata.get('Name'), 'facets': facets,
+                        'keywords': set().union(*(keywords(metadata.get(row)) for row in TEXT_FIELDS))}
+        with self._lock:
+            self._remove(key)
+            if document is not None:
+                self._add(key, document)
+
+    def _add(self, key, document):
+        self._documents[key] = document
+        for facet, values in document['facets'].items():
+            for value in values:
+                normalized = _normalize(value)
+                self._postings[facet].setdefault(normalized, set()).add(key)
+                self._labels[facet].setdefault(normalized, value)
+        for keyword in document['keywords']:
+            self._keywords.setdefault(keyword, set()).add(key)
+
+    def _remove(self, key):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        for facet, values in document['facets'].items():
+            for value in values:
+                normalized = _normalize(value)
+                keys = self._postings[facet].get(normalized)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._postings[facet][normalized]
+                        del self._labels[facet][normalized]
+        for keyword in document['keywords']:
+            keys = self._keywords.get(keyword)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keywords[keyword]
+
+    def search(self, filters=None, query=None, offset=0, limit=DEFAULT_LIMIT):
+        """
+        Searches the maps matching facet filters and keywords.
+
+        Values of one facet are alternatives, while different facets and keywords must all match. Facet
+        counts are computed over the maps matching every other filter, so that each facet lists the
+        alternatives still available.
+
+        Args:
+            filters (dict, optional): Accepted values by facet, e.g. {'category': ['Hazard']}.
+            query (str, optional): Keywords that must all appear in the name or tag keywords of a map.
+            offset (int): Number of results to skip.
+            limit (int): Maximum number of results.
+
+        Returns:
+            dict: 'total' number of matches, the page of 'results' sorted by volcano and type, and the
+            'facets' counts, sorted by decreasing count.
+
+        Raises:
+            KeyError: If a filter names an unknown facet.
+        """
+        filters = {facet: values for facet, values in (filters or {}).items() if values}
+        with self._lock:
+            facet_matches = {}
+            for facet, values in filters.items():
+                postings = self._postings[facet]
+                facet_matches[facet] = set().union(*(postings.get(_normalize(value), ()) for value in values))
+            keyword_matches = None
+            for keyword in keywords(query):
+                keys = self._keywords.get(keyword, set())
+                keyword_matches = set(keys) if keyword_matches is None else keyword_matches & keys
+
+            def matching(excluded=None):
+                keys = set(self._documents) if keyword_matches is None else set(keyword_matches)
+                for facet, facet_keys in facet_matches.items():
+                    if facet != excluded:
+                        keys &= facet_keys
+                return keys
+
+            matches = sorted(matching())
+            facets = {}
+            for facet, postings in self._postings.items():
+                base = matching(facet) if facet in facet_matches else set(matches)
+                counts = [(len(keys & base), self._labels[facet][value]) for value, keys in postings.items()]
+                facets[facet] = [{'value': label, 'count': count}
+                                 for count, label in sorted(counts, key=lambda item: (-item[0], item[1])) if count]
+
+            results = [{'volcano': key[0], 'type': key[1], 'name': self._documents[key]['name']}
+                       for key in matches[offset:offset + limit]]
+        return {'total': len(matches), 'offset': offset, 'limit': limit, 'results': results, 'facets': facets}
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of indexed maps, keywords and values by facet.
+        """
+        with self._lock:
+            return {'maps': len(self._documents), 'keywords': len(self._keywords),
+                    'facets': {facet: len(postings) for facet, postings in self._postings.items()}}
+
+
+def get_search_index():
+    """
+    Returns:
+        SearchIndex: The search index of the current Flask application.
+    """
+    return current_app.extensions['search_index']
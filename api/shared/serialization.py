@@ -0,0 +1,253 @@
+import re
+import json
+import logging
+
+from flask import current_app, Response
+from flask_restx import fields, marshal
+from flask_restx.mask import Mask
+
+try:
+    import orjson  # Optional, only used when its output is identical to json.dumps
+except ImportError:
+    orjson = None
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# RESTX_JSON settings written by orjson, see dumps
+COMPACT_JSON = {'separators': (',', ':'), 'ensure_ascii': False, 'allow_nan': False}
+
+# orjson writes large and small floats as 1e16 or 1e-5 where json.dumps writes 1e+16 or 1e-05
+ORJSON_EXPONENT = re.compile(rb'[0-9]e[-+]?[0-9]')
+
+# Field classes whose output is format(value), or None for a missing value, when used without options
+SIMPLE_FIELDS = (fields.String, fields.Float, fields.Integer, fields.Boolean, fields.Raw)
+
+# Tokens of a fields= projection: braces, commas and names, which may contain spaces
+FIELDS_TOKEN = re.compile(r'[{},]|[^{},]+')
+
+MAX_PROJECTIONS = 256
+
+# Projections compiled for the fields= parameters seen so far, by model name and parameter
+_projections = {}
+
+
+def parse_fields(text):
+    """
+    Parses a fields= projection, written like a restx mask: comma separated names, with the fields of a
+    nested object between braces, e.g. 'volcano_target,data{name}'. Unlike restx masks, names may contain
+    spaces, as the rows of the metadata workbooks do.
+
+    Args:
+        text (str): The projection, or None.
+
+    Returns:
+        dict: True or the nested projection by field name, or None if no projection is given.
+
+    Raises:
+        ValueError: If the braces are unbalanced or do not follow a field name.
+    """
+    if text is None or not text.strip():
+        return None
+    root = {}
+    stack = [root]
+    name = None
+    for token in FIELDS_TOKEN.findall(text):
+        if token == '{':
+            if name is None:
+                raise ValueError("'{' must follow a field name")
+            stack[-1][name] = {}
+            stack.append(stack[-1][name])
+            name = None
+        elif token == '}':
+            if len(stack) == 1 or not stack[-1]:
+                raise ValueError("'}' must close a non-empty '{'")
+            stack.pop()
+            name = None
+        elif token == ',':
+            name = None
+        elif token.strip():
+            name = token.strip()
+            stack[-1][name] = True
+    if len(stack) > 1:
+        raise ValueError("Unbalanced '{'")
+    return root
+
+
+def select_fields(data, mask):
+    """
+    Restricts data without a model, such as a parsed workbook, to a projection. Requested fields the data
+    does not have are left out.
+
+    Args:
+        data: A document, a list of documents or any other value, returned as is.
+        mask (dict): Projection returned by parse_fields, or None or True to keep every field.
+
+    Returns:
+        The projected data.
+    """
+    if mask is None or mask is True:
+        return data
+    if isinstance(data, (list, tuple)):
+        return [select_fields(item, mask) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {key: select_fields(data[key], nested) for key, nested in mask.items() if key in data}
+
+
+def projection(model, fields_parameter=None):
+    """
+    Returns the projection of a model restricted to a fields= parameter, compiling it once per parameter.
+
+    Args:
+        model (Model): A restx model.
+        fields_parameter (str, optional): The fields= parameter, every field of the model by default.
+
+    Returns:
+        callable: See compile_model.
+
+    Raises:
+        ValueError: If the parameter is malformed or names a field the model does not have.
+    """
+    key = (model.name, fields_parameter)
+    project = _projections.get(key)
+    if project is None:
+        project = compile_model(model, parse_fields(fields_parameter))
+        if len(_projections) >= MAX_PROJECTIONS:
+            _projections.clear()
+        _projections[key] = project
+    return project
+
+
+def compile_model(model, mask=None):
+    """
+    Turns a restx model into a projection function equivalent to flask_restx.marshal(data, model).
+
+    Dictionary lookups and formatting are bound once per field, so projecting a document no longer
+    goes through the generic field machinery. Fields with options the projection does not reproduce
+    (attributes, defaults, masks, wildcards, dotted keys...) keep using their own output method.
+    Fields left out of the mask are never looked up.
+
+    Args:
+        model (Model): A restx model, which stays the source of truth for the Swagger documentation.
+        mask (dict, optional): Projection returned by parse_fields, every field by default.
+
+    Returns:
+        callable: Takes a document or a list of documents and returns the marshalled data.
+
+    Raises:
+        ValueError: If the mask names a field the model does not have, or nests fields under a field
+            that is not an object.
+    """
+    resolved = getattr(model, 'resolved', model)
+    unknown = [key for key in mask or {} if key not in resolved]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if getattr(model, '__mask__', None) or any(isinstance(field, (dict, fields.Wildcard))
+                                               for field in resolved.values()):
+        return lambda data: marshal(data, model, mask=Mask(mask) if mask else None)
+
+    getters = [(key, _compile_field(key, field, True if mask is None else mask[key]))
+               for key, field in resolved.items() if mask is None or key in mask]
+
+    def project(data):
+        if isinstance(data, (list, tuple)):
+            return [project(item) for item in data]
+        return {key: getter(data) for key, getter in getters}
+
+    return project
+
+
+def _compile_field(key, field, mask=True):
+    # Returns a function computing field.output(key, obj), restricted to a nested mask
+    field = field() if isinstance(field, type) else field
+    generic = field.output
+    if mask is not True:
+        return _compile_nested(key, field, mask)
+    if '.' in key or field.attribute is not None or field.default is not None or getattr(field, 'mask', None):
+        return lambda obj: generic(key, obj)
+
+    if type(field) in SIMPLE_FIELDS and not getattr(field, 'discriminator', False):
+        format_value = field.format
+
+        def output(obj):
+            value = obj.get(key) if type(obj) is dict else fields.get_value(key, obj)
+            return None if value is None else format_value(value)
+        return output
+
+    if type(field) is fields.Nested and not field.skip_none:
+        project_nested = compile_model(field.nested)
+        allow_null = field.allow_null
+
+        def output(obj):
+            value = obj.get(key) if type(obj) is dict else fields.get_value(key, obj)
+            if value is None and allow_null:
+                return None
+            return project_nested(value)
+        return output
+
+    return lambda obj: generic(key, obj)
+
+
+def _compile_nested(key, field, mask):
+    # Projects an object, or a list of objects, on the nested fields requested by the mask
+    container = field.container if isinstance(field, fields.List) else field
+    container = container() if isinstance(container, type) else container
+    if not isinstance(container, fields.Nested):
+        raise ValueError(f"Field '{key}' has no nested fields")
+    project_nested = compile_model(container.nested, mask)
+
+    def output(obj):
+        value = fields.get_value(key if field.attribute is None else field.attribute, obj)
+        return None if value is None else project_nested(value)
+    return output
+
+
+def _settings():
+    # Same settings as flask_restx.representations.output_json, without modifying the configuration
+    settings = dict(current_app.config.get('RESTX_JSON', {}))
+    if current_app.debug:
+        settings.setdefault('indent', 4)
+    return settings
+
+
+def dumps(data):
+    """
+    Encodes data exactly as the JSON representation of flask-restx does.
+
+    orjson is used when it is installed and the RESTX_JSON settings are COMPACT_JSON, the only settings it
+    can reproduce; documents it would write differently (floats in exponent notation, non-string keys)
+    are encoded by json.dumps. The only difference left is NaN, written as null where json.dumps fails.
+
+    Args:
+        data: Data to encode.
+
+    Returns:
+        bytes: The UTF-8 JSON document, ending with a newline.
+    """
+    settings = _settings()
+    if orjson is not None and settings == COMPACT_JSON:
+        try:
+            dumped = orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+            if not ORJSON_EXPONENT.search(dumped):
+                return dumped
+        except TypeError:
+            pass
+    return (json.dumps(data, **settings) + '\n').encode('utf-8')
+
+
+def json_response(data, code=200, headers=None):
+    """
+    Builds the response flask-restx would make for data, without going through its representation layer.
+
+    Args:
+        data: Data to encode, already marshalled.
+        code (int): HTTP status code.
+        headers (dict, optional): Extra headers.
+
+    Returns:
+        Response: The JSON response.
+    """
+    response = Response(dumps(data), status=code)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers.extend(headers or {})
+    return response
@@ -0,0 +1,69 @@
+import os
+import glob
+import json
+import logging
+
+from api.shared.xlsx_parser import read_xlsx, sidecar_path
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Metadata workbooks compiled to sidecars, relative to the volcanoes directory
+WORKBOOK_PATTERNS = [
+    os.path.join('*', 'metadata', '*.xlsx'),
+    os.path.join('*', 'event_tree', 'metadata.xlsx'),
+]
+
+
+def write_json_atomic(path, data):
+    """
+    Write data as compact JSON through a temporary file, so readers never see a partial file.
+
+    Args:
+        path (str): Destination path.
+        data: JSON serializable data.
+    """
+    temp_path = f'{path}.tmp{os.getpid()}'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temp_path, path)
+
+
+def compile_sidecar(workbook_path, force=False):
+    """
+    Compile a metadata workbook to its JSON sidecar, unless the sidecar is already up to date.
+
+    Args:
+        workbook_path (str): Path to the XLSX file.
+        force (bool): Compile even if the sidecar is newer than the workbook.
+
+    Returns:
+        bool: True if the sidecar was written.
+    """
+    path = sidecar_path(workbook_path)
+    if not force and os.path.isfile(path) and os.stat(path).st_mtime_ns >= os.stat(workbook_path).st_mtime_ns:
+        return False
+    write_json_atomic(path, read_xlsx(workbook_path))
+    return True
+
+
+def compile_sidecars(volcanoes_path, force=False):
+    """
+    Compile every map and event tree metadata workbook under the volcanoes directory.
+
+    Args:
+        volcanoes_path (str): Path to the 'volcanoes' directory.
+        force (bool): Compile even the workbooks whose sidecar is up to date.
+
+    Returns:
+        dict: Number of sidecars 'compiled', 'skipped' as up to date and 'failed'.
+    """
+    summary = {'compiled': 0, 'skipped': 0, 'failed': 0}
+    for pattern in WORKBOOK_PATTERNS:
+        for workbook_path in sorted(glob.glob(os.path.join(volcanoes_path, pattern))):
+            try:
+                compiled = compile_sidecar(workbook_path, force)
+                summary['compiled' if compiled else 'skipped'] += 1
+            except Exception as e:
+                log.error(f"Error compiling sidecar for {workbook_path}: {e}")
+                summary['failed'] += 1
+    return summary
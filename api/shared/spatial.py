@@ -0,0 +1,348 @@
+import os
+import re
+import math
+import json
+import heapq
+import logging
+import threading
+
+from flask import current_app
+
+from api.shared.metadata_cache import metadata_cache
+from api.shared.invalidation import VOLCANO, VOLCANO_FILES, METADATA
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CELL_SIZE = 1.0  # Degrees
+MAX_CELLS_PER_EXTENT = 4096  # Larger extents are kept apart and checked one by one
+LAST_LNG = math.nextafter(180.0, 0.0)
+
+# Metadata rows holding the lower-left and upper-right corners of a map, as 'lat, lng'
+EXTENT_KEYS = ('Grid- Ll grid point (ll)', 'Grid- Ur grid point (ll)')
+NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+
+def parse_point(value):
+    """
+    Reads a 'lat, lng' metadata value.
+
+    Args:
+        value (str): The value, e.g. '37.5, 14.7'.
+
+    Returns:
+        tuple: (lat, lng), or None if the value is not a valid point.
+    """
+    numbers = NUMBER.findall(str(value or ''))
+    if len(numbers) < 2:
+        return None
+    lat, lng = float(numbers[0]), float(numbers[1])
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return None
+    return lat, lng
+
+
+def map_extent(metadata):
+    """
+    Args:
+        metadata (dict): Parsed map metadata.
+
+    Returns:
+        tuple: (min_lat, min_lng, max_lat, max_lng), or None if the metadata has no valid grid corners.
+    """
+    corners = [parse_point(metadata.get(key)) for key in EXTENT_KEYS]
+    if None in corners:
+        return None
+    (lat1, lng1), (lat2, lng2) = corners
+    return min(lat1, lat2), min(lng1, lng2), max(lat1, lat2), max(lng1, lng2)
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """
+    Returns:
+        float: Great-circle distance between two points, in kilometers.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    h = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+class SpatialIndex:
+    """
+    Spatial index of the volcano locations and map extents.
+
+    A uniform grid answers the bounding box and point queries: each cell lists the volcanoes located in it
+    and the maps whose extent overlaps it, so a query only looks at the cells it covers. Extents spanning
+    more than MAX_CELLS_PER_EXTENT cells are kept in a separate list. Nearest volcanoes are found with a
+    KD-tree of their positions on the unit sphere, which has no trouble with poles or the antimeridian.
+    """
+
+    def __init__(self, catalog, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Args:
+            catalog (Catalog): Index of the volcanoes directory.
+            cell_size (float): Size of the grid cells, in degrees.
+        """
+        self.catalog = catalog
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        self._volcanoes = {}  # volcano -> {'volcano', 'name', 'lat', 'lng'}
+        self._maps = {}  # (volcano, type) -> extent
+        self._volcano_cells = {}  # cell -> set of volcanoes
+        self._volcano_tree = None  # KD-tree of the volcanoes on the unit sphere, for nearest neighbours
+        self._map_cells = {}  # cell -> set of (volcano, type)
+        self._large_maps = set()
+
+    def subscribe(self, invalidator):
+        """
+        Keeps the index up to date with the changes signalled by an invalidator.
+
+        Args:
+            invalidator (Invalidator): Source of the changes.
+        """
+        invalidator.subscribe(VOLCANO_FILES, lambda path: self.index_volcanoes())
+        invalidator.subscribe(VOLCANO, self.index_maps)
+        invalidator.subscribe(METADATA, self._metadata_changed)
+
+    def rebuild(self):
+        """
+        Indexes every volcano and map of the catalog.
+
+        Returns:
+            SpatialIndex: The index itself, to allow chaining after construction.
+        """
+        self.index_volcanoes()
+        for volcano in self.catalog.volcano_names():
+            self.index_maps(volcano)
+        log.info(f"Spatial index built: {len(self._volcanoes)} volcanoes, {len(self._maps)} map extents")
+        return self
+
+    def _cell(self, lat, lng):
+        # Longitude 180 belongs to the last column, next to longitude -180
+        return int(math.floor(lat / self.cell_size)), int(math.floor(min(lng, LAST_LNG) / self.cell_size))
+
+    def _cells(self, min_lat, min_lng, max_lat, max_lng):
+        (y1, x1), (y2, x2) = self._cell(min_lat, min_lng), self._cell(max_lat, max_lng)
+        return [(y, x) for y in range(y1, y2 + 1) for x in range(x1, x2 + 1)]
+
+    def index_volcanoes(self):
+        """
+        Indexes the locations of the volcano JSON files.
+        """
+        volcanoes = {}
+        for path in self.catalog.volcano_files():
+            if not path.endswith('.json'):
+                continue
+            try:
+                with open(path, 'r') as file:
+                    data = json.load(file)
+                lat, lng = float(data['lat']), float(data['lng'])
+            except (KeyError, TypeError, ValueError, OSError) as e:
+                log.debug(f"No location indexed for {path}: {e}")
+                continue
+            volcano = os.path.splitext(os.path.basename(path))[0]
+            volcanoes[volcano] = {'volcano': volcano, 'name': data.get('name'), 'lat': lat, 'lng': lng}
+
+        cells = {}
+        for volcano, entry in volcanoes.items():
+            cells.setdefault(self._cell(entry['lat'], entry['lng']), set()).add(volcano)
+        tree = _build_tree([(_unit_vector(entry['lat'], entry['lng']), volcano)
+                            for volcano, entry in volcanoes.items()])
+        with self._lock:
+            self._volcanoes, self._volcano_cells, self._volcano_tree = volcanoes, cells, tree
+
+    def index_maps(self, volcano):
+        """
+        Indexes the extents of the maps of one volcano, replacing its previous entries.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+        """
+        try:
+            map_types = self.catalog.maps_for_volcano(volcano)
+        except KeyError:
+            map_types = []
+        extents = {}
+        for map_type in map_types:
+            extent = self._read_extent(volcano, map_type)
+            if extent is not None:
+                extents[(volcano, map_type)] = extent
+        with self._lock:
+            for key in [key for key in self._maps if key[0] == volcano]:
+                self._remove_map(key)
+            for key, extent in extents.items():
+                self._add_map(key, extent)
+
+    def _metadata_changed(self, volcano, path):
+        if os.path.basename(os.path.dirname(path)) != 'metadata':
+            return  # Event tree metadata has no extent
+        key = (volcano, os.path.splitext(os.path.basename(path))[0])
+        extent = self._read_extent(*key)
+        with self._lock:
+            self._remove_map(key)
+            if extent is not None:
+                self._add_map(key, extent)
+
+    def _read_extent(self, volcano, map_type):
+        try:
+            return map_extent(metadata_cache.get(self.catalog.metadata_path(volcano, map_type)))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.error(f"Error reading the extent of {map_type} for {volcano}: {e}")
+            return None
+
+    def _add_map(self, key, extent):
+        self._maps[key] = extent
+        cells = self._cells(*extent)
+        if len(cells) > MAX_CELLS_PER_EXTENT:
+            self._large_maps.add(key)
+            return
+        for cell in cells:
+            self._map_cells.setdefault(cell, set()).add(key)
+
+    def _remove_map(self, key):
+        extent = self._maps.pop(key, None)
+        if extent is None:
+            return
+        if key in self._large_maps:
+            self._large_maps.discard(key)
+            return
+        for cell in self._cells(*extent):
+            keys = self._map_cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._map_cells[cell]
+
+    def _map_result(self, key):
+        min_lat, min_lng, max_lat, max_lng = self._maps[key]
+        return {'volcano': key[0], 'type': key[1], 'min_lat': min_lat, 'min_lng': min_lng, 'max_lat': max_lat,
+                'max_lng': max_lng}
+
+    def bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """
+        Finds the volcanoes located in a bounding box and the maps whose extent intersects it.
+
+        Args:
+            min_lat (float): South edge.
+            min_lng (float): West edge, greater than east edge for a box crossing the antimeridian.
+            max_lat (float): North edge.
+            max_lng (float): East edge.
+
+        Returns:
+            dict: Sorted 'volcanoes' and 'maps'.
+        """
+        boxes = [(min_lat, min_lng, max_lat, max_lng)]
+        if min_lng > max_lng:
+            boxes = [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+        volcanoes, maps = set(), set()
+        with self._lock:
+            for box in boxes:
+                cells = self._cells(*box)
+                if len(cells) > len(self._volcanoes) + len(self._maps):
+                    # Cheaper to check every entry than every cell of a large box
+                    volcanoes.update(volcano for volcano, entry in self._volcanoes.items()
+                                     if box[0] <= entry['lat'] <= box[2] and box[1] <= entry['lng'] <= box[3])
+                    maps.update(key for key, extent in self._maps.items() if _intersects(extent, box))
+                    continue
+                for cell in cells:
+                    for volcano in self._volcano_cells.get(cell, ()):
+                        entry = self._volcanoes[volcano]
+                        if box[0] <= entry['lat'] <= box[2] and box[1] <= entry['lng'] <= box[3]:
+                            volcanoes.add(volcano)
+                    maps.update(key for key in self._map_cells.get(cell, ()) if _intersects(self._maps[key], box))
+                maps.update(key for key in self._large_maps if _intersects(self._maps[key], box))
+            return {'volcanoes': [dict(self._volcanoes[volcano]) for volcano in sorted(volcanoes)],
+                    'maps': [self._map_result(key) for key in sorted(maps)]}
+
+    def nearest(self, lat, lng, k=1):
+        """
+        Finds the k volcanoes nearest to a point.
+
+        Args:
+            lat (float): Latitude of the point.
+            lng (float): Longitude of the point.
+            k (int): Number of volcanoes.
+
+        Returns:
+            list: Volcanoes with their 'distance_km', nearest first.
+        """
+        with self._lock:
+            tree, volcanoes = self._volcano_tree, self._volcanoes
+        best = []  # Max-heap of (-squared chord, volcano), the k nearest found so far
+        _search(tree, _unit_vector(lat, lng), k, best)
+        return [dict(volcanoes[volcano], distance_km=round(distance_km(lat, lng, volcanoes[volcano]['lat'],
+                                                                        volcanoes[volcano]['lng']), 3))
+                for _, volcano in sorted(best, reverse=True)]
+
+    def maps_at(self, lat, lng):
+        """
+        Finds the maps whose extent covers a point.
+
+        Args:
+            lat (float): Latitude of the point.
+            lng (float): Longitude of the point.
+
+        Returns:
+            list: Sorted maps with their extent.
+        """
+        box = (lat, lng, lat, lng)
+        with self._lock:
+            keys = set(self._map_cells.get(self._cell(lat, lng), ())) | self._large_maps
+            return [self._map_result(key) for key in sorted(keys) if _intersects(self._maps[key], box)]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of indexed volcanoes, map extents and occupied cells.
+        """
+        with self._lock:
+            return {'volcanoes': len(self._volcanoes), 'maps': len(self._maps),
+                    'cells': len(self._volcano_cells) + len(self._map_cells), 'large_maps': len(self._large_maps)}
+
+
+def _intersects(extent, box):
+    return extent[0] <= box[2] and box[0] <= extent[2] and extent[1] <= box[3] and box[1] <= extent[3]
+
+
+def _unit_vector(lat, lng):
+    # Point on the unit sphere, where the chord length grows with the great-circle distance
+    phi, lam = math.radians(lat), math.radians(lng)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def _build_tree(points, depth=0):
+    # KD-tree of (vector, volcano) points as nested (axis, point, left, right) tuples
+    if not points:
+        return None
+    axis = depth % 3
+    points.sort(key=lambda point: point[0][axis])
+    middle = len(points) // 2
+    return axis, points[middle], _build_tree(points[:middle], depth + 1), _build_tree(points[middle + 1:], depth + 1)
+
+
+def _search(node, vector, k, best):
+    # Depth-first KD-tree search, skipping the far side of a split that cannot hold a closer point
+    if node is None:
+        return
+    axis, (point, volcano), left, right = node
+    chord = sum((a - b) ** 2 for a, b in zip(point, vector))
+    if len(best) < k:
+        heapq.heappush(best, (-chord, volcano))
+    elif chord < -best[0][0]:
+        heapq.heapreplace(best, (-chord, volcano))
+    gap = vector[axis] - point[axis]
+    near, far = (left, right) if gap < 0 else (right, left)
+    _search(near, vector, k, best)
+    if len(best) < k or gap * gap < -best[0][0]:
+        _search(far, vector, k, best)
+
+
+def get_spatial_index():
+    """
+    Returns:
+        SpatialIndex: The spatial index of the current Flask application.
+    """
+    return current_app.extensions['spatial_index']
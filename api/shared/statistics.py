@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+
+from api.shared.constants import WEB_MERCATOR_HALF_SIZE, DEFAULT_TILE_SIZE
+
+STATISTICS_BINS = 256
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+METERS_PER_DEGREE = 111319.49079327357  # At the equator, as the web mercator scale
+
+
+class _Moments:
+    # Count, mean, sum of squared deviations, min and max of values seen in chunks, merged as in Chan et al.
+    def __init__(self):
+        self.count, self.mean, self.m2, self.min, self.max = 0, 0.0, 0.0, None, None
+
+    def update(self, values):
+        if not values.size:
+            return
+        count, mean = values.size, float(values.mean())
+        delta, total = mean - self.mean, self.count + count
+        self.m2 += float(((values - mean) ** 2).sum()) + delta ** 2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def result(self):
+        if not self.count:
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean,
+                'std': math.sqrt(self.m2 / self.count)}
+
+
+def _halve(values, categorical):
+    # Next zoom level of a strip: mean of the valid pixels of each 2x2 square, or its first pixel for categories
+    if categorical:
+        return values[::2, ::2]
+    height, width = values.shape
+    padded = np.full((height + height % 2, width + width % 2), np.nan)
+    padded[:height, :width] = values
+    valid = ~np.isnan(padded)
+    shape = (padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    sums = np.where(valid, padded, 0.0).reshape(shape).sum(axis=(1, 3))
+    counts = valid.reshape(shape).sum(axis=(1, 3))
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _percentiles(start, end, counts, exact):
+    # Percentiles interpolated within the histogram bins, or the value of the bin when each bin is one value
+    cumulative = np.cumsum(counts)
+    total, width = int(cumulative[-1]), (end - start) / len(counts)
+    result = {}
+    for percentile in PERCENTILES:
+        target = percentile / 100 * total
+        index = min(int(np.searchsorted(cumulative, target)), len(counts) - 1)
+        if exact:
+            result[f'p{percentile}'] = float(start + (index + 0.5) * width)
+        else:
+            before = int(cumulative[index - 1]) if index else 0
+            fraction = (target - before) / counts[index] if counts[index] else 0.0
+            result[f'p{percentile}'] = float(start + (index + fraction) * width)
+    return result
+
+
+def _band_statistics(band, levels, bins):
+    # Statistics of one band, read in strips of whole blocks whose height is a multiple of every zoom factor
+    nodata = band.GetNoDataValue()
+    categorical = band.GetColorTable() is not None
+    width, height = band.XSize, band.YSize
+    try:
+        low, high = band.ComputeRasterMinMax(False)  # Exact, computed block by block by GDAL
+    except RuntimeError:
+        low = high = None  # No valid pixel
+    factor = 2 ** levels
+    strip_height = -(-max(band.GetBlockSize()[1], factor) // factor) * factor
+    moments = [_Moments() for _ in range(levels + 1)]
+    histogram = start = end = None
+    exact = False
+    for top in range(0, height, strip_height):
+        data = band.ReadAsArray(0, top, width, min(strip_height, height - top))
+        if histogram is None and low is not None:
+            exact = np.issubdtype(data.dtype, np.integer) and high - low + 1 <= bins
+            if exact or high == low:
+                start, end = low - 0.5, high + 0.5  # One bin per value
+                histogram = np.zeros(int(high - low) + 1, dtype=np.int64)
+                exact = True
+            else:
+                start, end, histogram = low, high, np.zeros(bins, dtype=np.int64)
+        values = data.astype(np.float64)
+        if nodata is not None:
+            values[values == nodata] = np.nan
+        for level in range(levels + 1):
+            if level:
+                values = _halve(values, categorical)
+            valid = values[~np.isnan(values)]
+            moments[level].update(valid)
+            if not level and histogram is not None and valid.size:
+                indexes = ((valid - start) * (len(histogram) / (end - start))).astype(np.int64)
+                histogram += np.bincount(np.clip(indexes, 0, len(histogram) - 1), minlength=len(histogram))
+
+    result = {'band': band.GetBand(), 'nodata': nodata, **moments[0].result()}
+    result['nodata_count'] = width * height - result['count']
+    if histogram is not None and result['count']:
+        result['histogram'] = {'min': start, 'max': end, 'counts': histogram.tolist()}
+        result['percentiles'] = _percentiles(start, end, histogram, exact)
+    else:
+        result['histogram'] = result['percentiles'] = None
+    result['levels'] = [dict(level=level, width=-(-width // 2 ** level), height=-(-height // 2 ** level),
+                             **moments[level].result()) for level in range(levels + 1)]
+    return result
+
+
+def _closest_zoom(dataset):
+    # Web map zoom level whose resolution is the closest to the pixels of the raster, None if unknown
+    srs = dataset.GetSpatialRef()
+    pixel_size = abs(dataset.GetGeoTransform()[1])
+    if srs is None or not pixel_size:
+        return None
+    pixel_size *= METERS_PER_DEGREE if srs.IsGeographic() else srs.GetLinearUnits()
+    return round(math.log2(2 * WEB_MERCATOR_HALF_SIZE / (DEFAULT_TILE_SIZE * pixel_size)))
+
+
+def dataset_statistics(dataset, bins=STATISTICS_BINS):
+    """
+    Compute the statistics of every band of a raster, reading it once in strips of blocks so the whole raster
+    is never in memory: count, range, mean and standard deviation of the valid pixels, a histogram and the
+    percentiles it gives, and the same moments at each zoom level of the raster, downsampled by 2, 4, ...
+    as its overviews would be, down to a single tile.
+
+    Args:
+        dataset (gdal.Dataset): Open raster.
+        bins (int): Number of bins of the histograms. Integer rasters with fewer values get one bin per value.
+
+    Returns:
+        dict: 'width' and 'height' of the raster and the statistics of its 'bands'.
+    """
+    width, height = dataset.RasterXSize, dataset.RasterYSize
+    levels = max(0, math.ceil(math.log2(max(width, height, 1) / DEFAULT_TILE_SIZE)))
+    zoom = _closest_zoom(dataset)
+    bands = []
+    for number in range(1, dataset.RasterCount + 1):
+        statistics = _band_statistics(dataset.GetRasterBand(number), levels, bins)
+        for level in statistics['levels']:
+            level['zoom'] = zoom - level['level'] if zoom is not None and zoom >= level['level'] else None
+        bands.append(statistics)
+    return {'width': width, 'height': height, 'bands': bands}
@@ -0,0 +1,284 @@
+import os
+import io
+import json
+import mmap
+import struct
+import hashlib
+import logging
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# A pyramid packed in one file, written next to the pyramid directory: <volcano>/kml/<map>.tiles
+ARCHIVE_EXTENSION = '.tiles'
+TILE_EXTENSION = '.png'
+
+# Layout: header | tile data | level table | one index per level | metadata JSON. Each level indexes the
+# rectangle of columns and rows it covers, so the record of a tile is found by arithmetic alone. Records
+# hold the offset and length of the tile (0 if missing) and the start of its SHA-1, used as ETag.
+MAGIC = b'VBXTILES'
+VERSION = 1
+HEADER = struct.Struct('<8sHHQQQ')  # magic, version, levels, level table offset, metadata offset and length
+LEVEL = struct.Struct('<BIIIIQ')  # zoom, first column, first row, columns, rows, index offset
+RECORD = struct.Struct('<QI8s')  # offset, length, digest
+DIGEST_SIZE = 8
+
+
+def archive_path(pyramid_dir):
+    """
+    Args:
+        pyramid_dir (str): Output directory of a pyramid, see tiling.output_dir.
+
+    Returns:
+        str: Path of the archive that replaces the directory.
+    """
+    return os.path.normpath(pyramid_dir) + ARCHIVE_EXTENSION
+
+
+def _scan(directory):
+    # Tiles by (zoom, column, row) and the other files of a pyramid, by path relative to the directory
+    tiles, files = {}, []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            parts = os.path.relpath(path, directory).split(os.sep)
+            if (len(parts) == 3 and name.endswith(TILE_EXTENSION) and parts[0].isdigit() and parts[1].isdigit()
+                    and name[:-len(TILE_EXTENSION)].isdigit()):
+                tiles[int(parts[0]), int(parts[1]), int(name[:-len(TILE_EXTENSION)])] = path
+            else:
+                files.append('/'.join(parts))
+    return tiles, sorted(files)
+
+
+def write_archive(directory, path, manifest=None):
+    """
+    Packs a pyramid directory into an archive. Identical tiles are stored once.
+
+    The archive is written and synced under a temporary name next to its path, then renamed into place,
+    so readers see either the previous archive or the new one.
+
+    Args:
+        directory (str): Pyramid written by gdal2tiles, <z>/<x>/<y>.png plus its root files.
+        path (str): Destination of the archive.
+        manifest (dict, optional): Manifest of the pyramid, stored in the archive metadata.
+
+    Returns:
+        dict: Number of 'tiles', of 'unique' tiles and 'bytes' written.
+    """
+    tiles, files = _scan(directory)
+    partial = os.path.join(os.path.dirname(os.path.abspath(path)), f'.{os.path.basename(path)}.partial-{os.getpid()}')
+    try:
+        with open(partial, 'wb') as archive:
+            archive.write(b'\0' * HEADER.size)
+            stored = {}  # SHA-1 -> (offset, length)
+            records = {}
+            for key in sorted(tiles):
+                with open(tiles[key], 'rb') as file:
+                    data = file.read()
+                digest = hashlib.sha1(data).digest()
+                if digest not in stored:
+                    stored[digest] = (archive.tell(), len(data))
+                    archive.write(data)
+                records[key] = stored[digest] + (digest[:DIGEST_SIZE],)
+
+            extra = {}
+            for name in files:
+                with open(os.path.join(directory, *name.split('/')), 'rb') as file:
+                    data = file.read()
+                extra[name] = [archive.tell(), len(data)]
+                archive.write(data)
+
+            levels = sorted({z for z, _, _ in records})
+            table_offset = archive.tell()
+            index_offset = table_offset + LEVEL.size * len(levels)
+            table, indexes = io.BytesIO(), io.BytesIO()
+            for z in levels:
+                columns = [x for level, x, _ in records if level == z]
+                rows = [y for level, _, y in records if level == z]
+                min_x, min_y = min(columns), min(rows)
+                width, height = max(columns) - min_x + 1, max(rows) - min_y + 1
+                table.write(LEVEL.pack(z, min_x, min_y, width, height, index_offset + indexes.tell()))
+                index = bytearray(RECORD.size * width * height)
+                for (level, x, y), record in records.items():
+                    if level == z:
+                        RECORD.pack_into(index, RECORD.size * ((x - min_x) * height + y - min_y), *record)
+                indexes.write(index)
+            archive.write(table.getvalue())
+            archive.write(indexes.getvalue())
+
+            metadata = json.dumps({'manifest': manifest, 'files': extra}).encode()
+            metadata_offset = archive.tell()
+            archive.write(metadata)
+            archive.seek(0)
+            archive.write(HEADER.pack(MAGIC, VERSION, len(levels), table_offset, metadata_offset, len(metadata)))
+            archive.flush()
+            os.fsync(archive.fileno())
+            size = metadata_offset + len(metadata)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return {'tiles': len(records), 'unique': len(stored), 'bytes': size}
+
+
+class TileArchive:
+    """
+    Read-only view of an archive, memory-mapped once and shared by every request. Tiles are returned as
+    memoryview slices of the mapping, without copying nor opening any file.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path to the archive.
+
+        Raises:
+            ValueError: If the file is not an archive of a supported version, or its level table, indexes or
+                metadata extend beyond the end of the file.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, n_levels, table_offset, metadata_offset, metadata_length = \
+            HEADER.unpack_from(self._mmap, 0) if len(self._mmap) >= HEADER.size else (None,) * 6
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a tile archive of version {VERSION}")
+        self._levels = {}
+        for number in range(n_levels):
+            z, *level = LEVEL.unpack_from(self._mmap, table_offset + LEVEL.size * number)
+            _, _, width, height, index_offset = level
+            if index_offset + RECORD.size * width * height > len(self._mmap):
+                raise ValueError(f"Index of zoom level {z} of {path} extends beyond the end of the file")
+            self._levels[z] = level
+        if metadata_offset + metadata_length > len(self._mmap):
+            raise ValueError(f"Metadata of {path} extends beyond the end of the file")
+        self.metadata = json.loads(bytes(self._view[metadata_offset:metadata_offset + metadata_length]))
+
+    def _data(self, offset, length, name):
+        # Slice of the mapping a record points to, None if it extends beyond the file of a corrupted archive
+        if offset + length > len(self._mmap):
+            log.error(f"Corrupted tile archive {self.path}: {name} extends beyond the end of the file")
+            return None
+        return self._view[offset:offset + length]
+
+    @property
+    def manifest(self):
+        """
+        Returns:
+            dict: Manifest of the pyramid, or an empty dict.
+        """
+        return self.metadata.get('manifest') or {}
+
+    def get(self, z, x, y):
+        """
+        Args:
+            z (int): Zoom level.
+            x (int): Column.
+            y (int): Row, in the scheme the pyramid was written with.
+
+        Returns:
+            tuple: The tile as a memoryview and the hex digest of its content, or None if there is no tile or
+                its record points outside of the archive.
+        """
+        level = self._levels.get(z)
+        if level is None:
+            return None
+        min_x, min_y, width, height, index_offset = level
+        if not 0 <= x - min_x < width or not 0 <= y - min_y < height:
+            return None
+        offset, length, digest = RECORD.unpack_from(
+            self._mmap, index_offset + RECORD.size * ((x - min_x) * height + y - min_y))
+        data = self._data(offset, length, f'tile {z}/{x}/{y}') if length else None
+        return None if data is None else (data, digest.hex())
+
+    def files(self):
+        """
+        Returns:
+            list: Paths of the non-tile files of the pyramid, relative to its directory.
+        """
+        return sorted(self.metadata.get('files', {}))
+
+    def read_file(self, name):
+        """
+        Args:
+            name (str): Path of a non-tile file, relative to the pyramid directory.
+
+        Returns:
+            bytes: Content of the file, or None if its record points outside of the archive.
+
+        Raises:
+            KeyError: If the archive has no such file.
+        """
+        offset, length = self.metadata['files'][name]
+        data = self._data(offset, length, name)
+        return None if data is None else bytes(data)
+
+    def levels(self):
+        """
+        Returns:
+            list: The zoom levels of the archive.
+        """
+        return sorted(self._levels)
+
+    def tiles(self, z):
+        """
+        Args:
+            z (int): Zoom level.
+
+        Yields:
+            tuple: Column, row and content of every tile of the level. Tiles whose record points outside of
+                the archive are skipped.
+        """
+        min_x, min_y, width, height, index_offset = self._levels[z]
+        for position in range(width * height):
+            offset, length, _ = RECORD.unpack_from(self._mmap, index_offset + RECORD.size * position)
+            x, y = min_x + position // height, min_y + position % height
+            data = self._data(offset, length, f'tile {z}/{x}/{y}') if length else None
+            if data is not None:
+                yield x, y, data
+
+
+def read_archive(path):
+    """
+    Args:
+        path (str): Path to an archive.
+
+    Returns:
+        TileArchive: The opened archive, or None if there is no valid archive at this path.
+    """
+    try:
+        return TileArchive(path)
+    except (FileNotFoundError, ValueError, struct.error, json.JSONDecodeError) as e:
+        # A truncated or corrupted archive has offsets outside of the file or unreadable metadata
+        if not isinstance(e, FileNotFoundError):
+            log.error(f"Error reading tile archive {path}: {e}")
+        return None
+
+
+def extract_archive(archive, directory, levels=None, files=True):
+    """
+    Writes the files of an archive back as a pyramid directory, e.g. to render more zoom levels.
+
+    Args:
+        archive (TileArchive): Archive to extract.
+        directory (str): Destination directory.
+        levels (list, optional): Only extract the tiles of these zoom levels, all by default.
+        files (bool): Also extract the non-tile files, e.g. tilemapresource.xml and the KML.
+
+    Files and tiles whose record points outside of a corrupted archive are left out.
+    """
+    for name in archive.files() if files else []:
+        data = archive.read_file(name)
+        if data is None:
+            continue
+        path = os.path.join(directory, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(data)
+    for z in archive.levels() if levels is None else levels:
+        for x, y, data in archive.tiles(z):
+            column_dir = os.path.join(directory, str(z), str(x))
+            os.makedirs(column_dir, exist_ok=True)
+            with open(os.path.join(column_dir, f'{y}{TILE_EXTENSION}'), 'wb') as file:
+                file.write(data)
@@ -0,0 +1,505 @@
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import safe_join
+
+from api.shared.invalidation import VOLCANO, FILE
+from api.shared.metrics import span
+from api.shared.tile_archive import archive_path, read_archive, ARCHIVE_EXTENSION, DIGEST_SIZE
+from api.shared.render import Renderer, cog_path, encode_png, COG_EXTENSION
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Pyramids are written by api.shared.tiling into <volcano>/kml/<map>/<z>/<x>/<y>.png, with a manifest.json,
+# or packed into <volcano>/kml/<map>.tiles, see api.shared.tile_archive. Maps converted to
+# <volcano>/kml/<map>.cog.tif are rendered on demand, see api.shared.render
+PYRAMID_DIR = 'kml'
+MANIFEST = 'manifest.json'
+TILE_EXTENSION = '.png'
+
+DEFAULT_TILE_SIZE = 256
+DEFAULT_CACHE_MB = 64
+DEFAULT_DISK_CACHE_MB = 1024
+DISK_BLOCK_SIZE = 4096
+DISK_TRIM_INTERVAL = 60.0
+DISK_TRIM_FRACTION = 16  # Trim after writing 1/16 of the budget, down to 15/16 of it
+DISK_LOCK = '.trim.lock'
+MAX_ZOOM = 30
+ENTRY_OVERHEAD = 256  # Approximate memory used by a cache entry besides the tile bytes
+
+
+@lru_cache(maxsize=8)
+def empty_tile(size=DEFAULT_TILE_SIZE):
+    """
+    Args:
+        size (int): Width and height of the tile, in pixels.
+
+    Returns:
+        bytes: A fully transparent RGBA PNG tile, served where a pyramid has no tile.
+    """
+    return encode_png((b'\x00' + b'\x00' * 4 * size) * size, size, size, level=9)
+
+
+class DiskTileCache:
+    """
+    Size-bounded directory of rendered tiles, shared by the workers of a server.
+
+    The budget is enforced against the files actually on disk: once enough bytes were written or enough
+    time passed, a worker walks the directory in a background thread, under a file lock so the workers do
+    not trim at once, and removes the least recently used tiles until the total is back under the budget.
+    Hits refresh the modification time of a file, which is the recency shared by every worker. Tiles
+    without data are kept as empty files, so cold areas are not rendered twice either.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_DISK_CACHE_MB * 1024 * 1024, trim_interval=DISK_TRIM_INTERVAL):
+        """
+        Args:
+            root (str): Directory of the cached tiles, created when the first tile is written.
+            max_bytes (int): Maximum size of the cached tiles on disk.
+            trim_interval (float): Maximum number of seconds between two checks of the size on disk.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.trim_interval = trim_interval
+        self._lock = threading.Lock()
+        self._written = 0  # Bytes written by this process since the last trim
+        self._trimmed_at = None  # None until the first write, so that a preloaded master never walks the cache
+        self._trimming = False
+        self.entries = 0  # As of the last trim
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.trims = 0
+
+    @staticmethod
+    def _size(length):
+        # Files are accounted for the blocks they occupy, so that empty markers count too
+        return max(-(-length // DISK_BLOCK_SIZE), 1) * DISK_BLOCK_SIZE
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def get(self, name):
+        """
+        Args:
+            name (str): Relative path of the tile, '/' separated.
+
+        Returns:
+            bytes: The cached tile, empty for a tile without data, or None if it is not cached.
+        """
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            os.utime(path)  # Most recently used, for every worker
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, name, data):
+        """
+        Writes a tile atomically, trimming the cache in the background when it may exceed its budget.
+
+        Args:
+            name (str): Relative path of the tile, '/' separated.
+            data (bytes): The tile, empty for a tile without data.
+        """
+        path = self._path(name)
+        partial = f'{path}.{os.getpid()}-{threading.get_ident()}.partial'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(partial, 'wb') as file:
+                file.write(data)
+            os.replace(partial, path)
+        except OSError as e:
+            log.error(f"Error caching tile {name}: {e}")
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._written += self._size(len(data))
+            due = (self._trimmed_at is None or now - self._trimmed_at >= self.trim_interval
+                   or self._written >= self.max_bytes // DISK_TRIM_FRACTION)
+            if not due or self._trimming:
+                return
+            self._trimming = True
+            self._trimmed_at = now
+            self._written = 0
+        threading.Thread(target=self.trim, name='tile-cache-trim', daemon=True).start()
+
+    def trim(self):
+        """
+        Removes the least recently used tiles until the directory fits in its budget, unless another worker
+        is already trimming it.
+
+        Returns:
+            bool: True if the directory was walked.
+        """
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, DISK_LOCK), 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return False
+                files, total = [], 0
+                directories = [self.root]
+                while directories:
+                    with os.scandir(directories.pop()) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                directories.append(entry.path)
+                            elif entry.name.endswith(TILE_EXTENSION):
+                                try:
+                                    stat = entry.stat(follow_symlinks=False)
+                                except FileNotFoundError:
+                                    continue
+                                size = self._size(stat.st_size)
+                                files.append((stat.st_mtime_ns, size, entry.path))
+                                total += size
+                evicted = 0
+                if total > self.max_bytes:
+                    # Down to a low watermark, so the next writes do not trim again at once
+                    target = self.max_bytes * (DISK_TRIM_FRACTION - 1) // DISK_TRIM_FRACTION
+                    for _, size, path in sorted(files):
+                        if total <= target:
+                            break
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                        total -= size
+                        evicted += 1
+            with self._lock:
+                self.entries, self.bytes = len(files) - evicted, total
+                self.evictions += evicted
+                self.trims += 1
+            return True
+        except OSError as e:
+            log.error(f"Error trimming the tile cache {self.root}: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._trimming = False
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number and size of the cached tiles as of the last trim, capacity and hit/miss/eviction/trim
+                counters.
+        """
+        with self._lock:
+            return {'entries': self.entries, 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'trims': self.trims}
+
+
+class TileStore:
+    """
+    Serves the tiles of the pyramids published under the volcanoes directory, with a byte-bounded LRU
+    cache of the hot tiles.
+
+    Tiles are addressed in the XYZ scheme of web maps and read from the TMS layout gdal2tiles writes,
+    unless the manifest says the pyramid was written in XYZ. Every entry remembers the identity of its
+    pyramid directory, which tiling.tile_one replaces as a whole, so a republished pyramid is never served
+    from stale entries. Tiles missing from a pyramid are cached too, and served as a transparent tile.
+
+    Pyramids packed into an archive take precedence over directories. Archives are memory-mapped once per
+    version and their tiles are served as slices of the mapping, so they bypass the LRU and leave the
+    caching to the page cache.
+
+    Maps without a pyramid but with a COG have their tiles rendered on the first request, then kept in
+    the LRU and in a disk cache shared by the workers, so that the areas viewed around the volcanoes are
+    served from the caches while the others cost nothing until someone looks at them.
+    """
+
+    def __init__(self, catalog, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024, renderer=None, disk_cache=None):
+        """
+        Args:
+            catalog (Catalog): Index of the volcanoes directory.
+            max_bytes (int): Maximum size of the cached tiles.
+            renderer (Renderer, optional): Renders the tiles of the COGs, a default renderer if not given.
+            disk_cache (DiskTileCache, optional): Keeps the rendered tiles across workers and restarts.
+        """
+        self.catalog = catalog
+        self.max_bytes = max_bytes
+        self.renderer = renderer or Renderer()
+        self.disk_cache = disk_cache
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (volcano, map, z, x, y) -> entry
+        self._pyramids = {}  # (volcano, map) -> layout read from the manifest
+        self._archives = {}  # (volcano, map) -> (signature, TileArchive)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.empty = 0
+        self.archive_reads = 0
+        self.renders = 0
+
+    def subscribe(self, invalidator):
+        """
+        Drops the cached tiles of the pyramids signalled as changed by an invalidator.
+
+        Args:
+            invalidator (Invalidator): Source of the changes.
+        """
+        invalidator.subscribe(VOLCANO, self.invalidate)
+        invalidator.subscribe(FILE, self._file_changed)
+
+    def _file_changed(self, volcano, path):
+        parts = os.path.relpath(path, os.path.join(self.catalog.root, volcano)).split(os.sep)
+        if len(parts) >= 2 and parts[0] == PYRAMID_DIR:
+            self.invalidate(volcano, parts[1].removesuffix(ARCHIVE_EXTENSION).removesuffix(COG_EXTENSION))
+
+    def invalidate(self, volcano, map_name=None):
+        """
+        Drops the cached tiles of one pyramid, or of every pyramid of a volcano.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            map_name (str, optional): Name of the map.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == volcano and map_name in (None, key[1])]:
+                self.bytes -= self._entries.pop(key)['size']
+            for pyramids in (self._pyramids, self._archives):
+                for key in [key for key in pyramids if key[0] == volcano and map_name in (None, key[1])]:
+                    del pyramids[key]
+
+    def pyramid_dir(self, volcano, map_name):
+        """
+        Returns:
+            str: Directory of the pyramid of a map, or None if the names would escape the volcanoes directory.
+        """
+        if volcano.startswith('.') or map_name.startswith('.'):
+            return None
+        return safe_join(self.catalog.root, volcano, PYRAMID_DIR, map_name)
+
+    def _layout(self, key, directory, signature, archive=None, rendered=False):
+        # Tile size, scheme and zoom range of a pyramid, read from its manifest once per version
+        layout = self._pyramids.get(key)
+        if layout is not None and layout['signature'] == signature:
+            return layout
+        if rendered:
+            layout = {'signature': signature, 'xyz': True, 'tile_size': self.renderer.tile_size, 'zoom': None}
+            self._pyramids[key] = layout
+            return layout
+        if archive is not None:
+            manifest = archive.manifest
+        else:
+            try:
+                with open(os.path.join(directory, MANIFEST), 'r') as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                manifest = {}
+        options = manifest.get('options') or {}
+        layout = {'signature': signature, 'xyz': bool(options.get('xyz')),
+                  'tile_size': int(options.get('tile_size') or DEFAULT_TILE_SIZE),
+                  'zoom': tuple(manifest['zoom']) if manifest.get('zoom') else None}
+        self._pyramids[key] = layout
+        return layout
+
+    def _archive(self, key, path):
+        # The mapped archive of a pyramid, or None if the pyramid is not packed
+        try:
+            stat = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None, None
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._archives.get(key)
+            if cached is not None and cached[0] == signature:
+                return signature, cached[1]
+            # A replaced archive stays mapped until the last slice served from it is released
+            archive = read_archive(path)
+            if archive is None:
+                self._archives.pop(key, None)
+                return None, None
+            self._archives[key] = (signature, archive)
+            return signature, archive
+
+    def _row(self, layout, z, y):
+        # Row of a tile in the pyramid, from the north in XYZ pyramids and from the south in TMS ones
+        return y if layout['xyz'] else 2 ** z - 1 - y
+
+    def _empty_entry(self, signature, layout):
+        return {'signature': signature, 'data': empty_tile(layout['tile_size']),
+                'etag': f"empty-{layout['tile_size']}", 'empty': True, 'size': ENTRY_OVERHEAD}
+
+    def _render(self, volcano, map_name, path, signature, z, x, y):
+        # Tile of the COG that covers it, through the disk cache, or None if the COG has no data in the tile
+        name = f'{volcano}/{map_name}/{signature[0]:x}-{signature[1]:x}/{z}/{x}/{y}{TILE_EXTENSION}'
+        if self.disk_cache is not None:
+            data = self.disk_cache.get(name)
+            if data is not None:
+                return data or None
+        with span('tile_render'):
+            data = self.renderer.render(path, signature, z, x, y)
+        with self._lock:
+            self.renders += 1
+        if self.disk_cache is not None:
+            self.disk_cache.put(name, data or b'')
+        return data
+
+    def get(self, volcano, map_name, z, x, y):
+        """
+        Returns a tile of a pyramid, reading or rendering it only if it is not cached.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            map_name (str): Name of the map.
+            z (int): Zoom level.
+            x (int): Column, from the west.
+            y (int): Row, from the north (XYZ scheme).
+
+        Returns:
+            dict: PNG 'data' (bytes, or a memoryview of an archive), its 'etag' and whether the tile is
+                'empty', or None if the map has neither a pyramid nor a COG.
+
+        Raises:
+            ValueError: If the coordinates are outside of the tile grid.
+        """
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValueError(f"Tile {z}/{x}/{y} is outside of the tile grid")
+        directory = self.pyramid_dir(volcano, map_name)
+        if directory is None:
+            return None
+
+        signature, archive = self._archive((volcano, map_name), archive_path(directory))
+        if archive is not None:
+            with self._lock:
+                layout = self._layout((volcano, map_name), directory, signature, archive)
+                self.archive_reads += 1
+            found = None
+            if layout['zoom'] is None or layout['zoom'][0] <= z <= layout['zoom'][1]:
+                found = archive.get(z, x, self._row(layout, z, y))
+            if found is None:
+                with self._lock:
+                    self.empty += 1
+                return self._empty_entry(signature, layout)
+            return {'signature': signature, 'data': found[0], 'etag': found[1], 'empty': False,
+                    'size': len(found[0])}
+
+        cog = None
+        try:
+            stat = os.stat(directory)
+        except (FileNotFoundError, NotADirectoryError):
+            cog = cog_path(directory)
+            try:
+                stat = os.stat(cog)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+        signature = (stat.st_ino, stat.st_mtime_ns)
+
+        key = (volcano, map_name, z, x, y)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['signature'] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            layout = self._layout(key[:2], directory, signature, rendered=cog is not None)
+
+        if cog is not None and not self.renderer.covers(cog, signature, z, x, y):
+            # Not cached, so that requests all over the grid cannot flush the tiles of the volcanoes
+            with self._lock:
+                self.empty += 1
+            return self._empty_entry(signature, layout)
+        data = None
+        if cog is not None:
+            data = self._render(volcano, map_name, cog, signature, z, x, y)
+        elif layout['zoom'] is None or layout['zoom'][0] <= z <= layout['zoom'][1]:
+            path = os.path.join(directory, str(z), str(x), f'{self._row(layout, z, y)}{TILE_EXTENSION}')
+            try:
+                with span('tile_read'), open(path, 'rb') as file:
+                    data = file.read()
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+        if data is None:
+            entry = self._empty_entry(signature, layout)
+        else:
+            # Same ETag as the tile would have once packed into an archive
+            entry = {'signature': signature, 'data': data, 'etag': hashlib.sha1(data).hexdigest()[:2 * DIGEST_SIZE],
+                     'empty': False, 'size': len(data) + ENTRY_OVERHEAD}
+        with self._lock:
+            self.empty += entry['empty']
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous['size']
+            self._entries[key] = entry
+            self.bytes += entry['size']
+            while self.bytes > self.max_bytes and self._entries:
+                self.bytes -= self._entries.popitem(last=False)[1]['size']
+        return entry
+
+    def archive_file(self, volcano, map_name, name):
+        """
+        Reads a file of a packed pyramid as gdal2tiles wrote it, for the KML and viewers whose URL points to
+        the pyramid endpoint since the directory was replaced by the archive.
+
+        Args:
+            volcano (str): Name of the volcano directory.
+            map_name (str): Name of the map.
+            name (str): Path of the file relative to the pyramid directory, e.g. 'doc.kml' or '5/16/20.png'
+                (a tile, in the scheme the pyramid was written with).
+
+        Returns:
+            dict: Content of the file ('data', bytes or a memoryview of the archive) and its 'etag', or None
+                if the map has no archive, the archive no such file or a corrupted record of it.
+        """
+        directory = self.pyramid_dir(volcano, map_name)
+        if directory is None:
+            return None
+        _, archive = self._archive((volcano, map_name), archive_path(directory))
+        if archive is None:
+            return None
+        with self._lock:
+            self.archive_reads += 1
+        parts = name.split('/')
+        if len(parts) == 3 and parts[2].endswith(TILE_EXTENSION) \
+                and all(part.isdigit() for part in (parts[0], parts[1], parts[2][:-len(TILE_EXTENSION)])):
+            found = archive.get(int(parts[0]), int(parts[1]), int(parts[2][:-len(TILE_EXTENSION)]))
+            return None if found is None else {'data': found[0], 'etag': found[1]}
+        try:
+            data = archive.read_file(name)
+        except KeyError:
+            return None
+        if data is None:
+            return None
+        return {'data': data, 'etag': hashlib.sha1(data).hexdigest()[:2 * DIGEST_SIZE]}
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number and size of the cached tiles, capacity, mapped archives, hit/miss/empty/render
+                counters and the statistics of the renderer and of the disk cache.
+        """
+        with self._lock:
+            stats = {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes,
+                     'archives': len(self._archives), 'archive_reads': self.archive_reads,
+                     'hits': self.hits, 'misses': self.misses, 'empty': self.empty, 'renders': self.renders}
+        stats['renderer'] = self.renderer.stats()
+        if self.disk_cache is not None:
+            stats['disk'] = self.disk_cache.stats()
+        return stats
+
+
+def get_tile_store():
+    """
+    Returns:
+        TileStore: The tile store of the current Flask application.
+    """
+    return current_app.extensions['tile_store']
@@ -0,0 +1,392 @@
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from api.shared.tools import tif_to_kml, tif_to_cog, read_cog_metadata, tiling_options, link_or_copy, replace_dir
+from api.shared.tile_archive import archive_path, read_archive, write_archive, extract_archive
+from api.shared.render import cog_path
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# GeoTIFF sources of a bundle, relative to its root: <volcano>/tifs/<map>.tif
+SOURCE_PATTERNS = [
+    os.path.join('*', 'tifs', '*.tif'),
+    os.path.join('*', 'tifs', '*.tiff'),
+]
+
+DEFAULT_URL = 'https://volcanboxws.obsea.es/volcanoes/{volcano}/kml/{map}/'
+
+MANIFEST = 'manifest.json'
+TILE_EXTENSION = '.png'
+COG_MANIFEST_KEY = 'VOLCANBOX_MANIFEST'  # Metadata item of the COGs holding their manifest
+
+# gdal2tiles options that do not change the generated tiles
+RUNTIME_OPTIONS = ('verbose', 'nb_processes')
+
+
+def find_sources(root, volcanoes=None):
+    """
+    Lists the GeoTIFFs to tile under a bundle root, e.g. the configured 'incoming' path.
+
+    Args:
+        root (str): Directory containing one '<volcano>/tifs/<map>.tif' tree per volcano.
+        volcanoes (list, optional): Only include these volcanoes.
+
+    Returns:
+        list: Dictionaries with the 'volcano', 'map' and 'source' path of each GeoTIFF.
+    """
+    jobs = []
+    for pattern in SOURCE_PATTERNS:
+        for source in glob.glob(os.path.join(root, pattern)):
+            volcano = os.path.basename(os.path.dirname(os.path.dirname(source)))
+            if volcanoes and volcano not in volcanoes:
+                continue
+            jobs.append({'volcano': volcano, 'map': os.path.splitext(os.path.basename(source))[0],
+                         'source': source})
+    return sorted(jobs, key=lambda job: (job['volcano'], job['map']))
+
+
+def output_dir(volcanoes_path, volcano, map_name):
+    """
+    Args:
+        volcanoes_path (str): Path to the 'volcanoes' directory.
+        volcano (str): Name of the volcano.
+        map_name (str): Name of the map.
+
+    Returns:
+        str: Directory that holds the tile pyramid and KML of a map, under the volcano 'kml' directory.
+    """
+    return os.path.join(volcanoes_path, volcano, 'kml', map_name)
+
+
+def plan_processes(n_files, max_cores, processes_per_file):
+    """
+    Splits the core budget between concurrent files and gdal2tiles processes per file.
+
+    Args:
+        n_files (int): Number of files to tile.
+        max_cores (int): Maximum number of cores used by the whole batch.
+        processes_per_file (int): Number of gdal2tiles processes per file.
+
+    Returns:
+        tuple: Number of files tiled concurrently and of gdal2tiles processes for each of them.
+    """
+    max_cores = max(int(max_cores), 1)
+    processes_per_file = min(max(int(processes_per_file), 1), max_cores)
+    concurrent_files = max(min(max_cores // processes_per_file, n_files), 1)
+    return concurrent_files, processes_per_file
+
+
+def file_sha256(path):
+    """
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex SHA-256 of the file content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(directory):
+    """
+    Args:
+        directory (str): Output directory of a pyramid.
+
+    Returns:
+        dict: The manifest written with the pyramid, or None if there is none.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def parse_zoom(zoom):
+    """
+    Args:
+        zoom (str): Zoom levels in gdal2tiles format, e.g. '5-12' or '8'.
+
+    Returns:
+        tuple: First and last zoom levels, or None if gdal2tiles chooses them.
+    """
+    if zoom in (None, ''):
+        return None
+    first, _, last = str(zoom).partition('-')
+    return int(first), int(last or first)
+
+
+def scan_pyramid(directory):
+    """
+    Args:
+        directory (str): Output directory of a pyramid.
+
+    Returns:
+        tuple: The (first, last) zoom levels found, or None, and the number of tiles.
+    """
+    levels = sorted(int(entry.name) for entry in os.scandir(directory) if entry.is_dir() and entry.name.isdigit())
+    tile_count = 0
+    for level in levels:
+        for _, _, files in os.walk(os.path.join(directory, str(level))):
+            tile_count += sum(1 for file in files if file.endswith(TILE_EXTENSION))
+    return ((levels[0], levels[-1]) if levels else None), tile_count
+
+
+def source_identity(source, manifest):
+    """
+    Identify a GeoTIFF by its content hash, reusing the one of the manifest while size and mtime match.
+
+    Returns:
+        dict: Size, mtime and SHA-256 of the source.
+    """
+    stat = os.stat(source)
+    identity = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+    if manifest and all(manifest.get(key) == value for key, value in identity.items()):
+        identity['source_sha256'] = manifest['source_sha256']
+    else:
+        identity['source_sha256'] = file_sha256(source)
+    return identity
+
+
+def plan_levels(manifest, identity, options):
+    """
+    Decide which zoom levels of a pyramid have to be rendered again.
+
+    Args:
+        manifest (dict): Manifest of the published pyramid, or None.
+        identity (dict): Returned by source_identity.
+        options (dict): gdal2tiles options of this run.
+
+    Returns:
+        tuple: The levels to keep from the published pyramid and the list of (first, last) runs of
+            levels to render. None as runs means the whole pyramid must be rendered.
+    """
+    stable_options = {key: value for key, value in options.items() if key not in RUNTIME_OPTIONS + ('zoom',)}
+    if (manifest is None or manifest.get('source_sha256') != identity['source_sha256']
+            or manifest.get('options') != stable_options or not manifest.get('zoom')):
+        return [], None
+
+    published = set(range(manifest['zoom'][0], manifest['zoom'][1] + 1))
+    requested_range = parse_zoom(options.get('zoom'))
+    if requested_range is None:
+        # Levels chosen by gdal2tiles, unchanged as long as the source and options are
+        return sorted(published), [] if manifest.get('requested_zoom') is None else None
+    requested = set(range(requested_range[0], requested_range[1] + 1))
+    missing = sorted(requested - published)
+    if missing and missing[-1] > max(published) and max(published) in requested:
+        # The previous last level becomes an overview level: its tiles are rendered again from the new
+        # children and, when gdal2tiles writes KML (sources in EPSG:4326), their KML gets links to them
+        missing = sorted(set(missing) | {max(published)})
+
+    # Contiguous runs of missing levels
+    runs = []
+    for level in missing:
+        if runs and runs[-1][1] == level - 1:
+            runs[-1][1] = level
+        else:
+            runs.append([level, level])
+    return sorted(requested & published - set(missing)), [tuple(run) for run in runs]
+
+
+def convert_one(job, destination):
+    """
+    Converts a single GeoTIFF to a Cloud-Optimized GeoTIFF, which the tile endpoint renders on demand
+    instead of serving a pyramid rendered in advance.
+
+    The COG is left untouched if its manifest matches the source. Otherwise it is written next to its
+    path and renamed into place. Pyramids of the map are removed, since the tile endpoint serves them first.
+
+    Args:
+        job (dict): Entry returned by find_sources.
+        destination (str): Output directory of the pyramid, the COG is written next to it.
+
+    Returns:
+        dict: Wall time in 'seconds', the 'levels' rendered ('cog', or [] if skipped) and the manifest.
+    """
+    start = time.perf_counter()
+    path = cog_path(destination)
+    metadata = read_cog_metadata(path)
+    manifest = json.loads(metadata[COG_MANIFEST_KEY]) if metadata and COG_MANIFEST_KEY in metadata else None
+    identity = source_identity(job['source'], manifest)
+    levels_rendered = []
+    if manifest is None or manifest.get('source_sha256') != identity['source_sha256']:
+        manifest = dict(identity, source=os.path.basename(job['source']), format='cog',
+                        created=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.partial-{os.getpid()}')
+        try:
+            tif_to_cog(job['source'], partial, {COG_MANIFEST_KEY: json.dumps(manifest)})
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        levels_rendered = 'cog'
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    if os.path.isfile(archive_path(destination)):
+        os.remove(archive_path(destination))
+    return {'seconds': time.perf_counter() - start, 'levels': levels_rendered, 'manifest': manifest}
+
+
+def tile_one(job, destination, nb_processes, url=DEFAULT_URL, staging_root=None, zoom=None, archive=False,
+             cog=False):
+    """
+    Tiles a single GeoTIFF, meant to run in a worker process.
+
+    The published pyramid is left untouched if its manifest matches the source and options. Otherwise
+    the missing zoom levels (or the whole pyramid) are rendered in a staging directory, next to hard
+    links to the levels that can be kept, and the result is swapped into place at once.
+
+    With archive, the pyramid is published as a single file next to the destination directory (see
+    api.shared.tile_archive) by an atomic rename, and the directory of a previous version is removed: its
+    KML, viewers and tiles are then served from the archive by the pyramid endpoint, which url must point
+    to, e.g. https://<host>/api/geo3bcn/pyramids/{volcano}/{map}/.
+    With cog, the GeoTIFF is converted for on-demand rendering instead, see convert_one.
+
+    Args:
+        job (dict): Entry returned by find_sources.
+        destination (str): Output directory of the pyramid.
+        nb_processes (int): Number of gdal2tiles processes for this file.
+        url (str): Public URL template of the output directory, with {volcano} and {map} fields.
+        staging_root (str, optional): Directory for staging pyramids, the system temp directory by default.
+        zoom (str, optional): Zoom levels to render, e.g. '5-12'. gdal2tiles chooses them if not set.
+        archive (bool): Publish the pyramid as a tile archive instead of a directory.
+        cog (bool): Convert the GeoTIFF to a COG rendered on demand instead of tiling it.
+
+    Returns:
+        dict: Wall time in 'seconds', the 'levels' rendered ('all' or a list of runs) and the manifest.
+    """
+    if cog:
+        return convert_one(job, destination)
+    start = time.perf_counter()
+    options = tiling_options(job['map'], job['volcano'], nb_processes,
+                             url.format(volcano=job['volcano'], map=job['map']), zoom)
+    if archive:
+        published = read_archive(archive_path(destination))
+        manifest = published.metadata.get('manifest') if published else None
+    else:
+        published, manifest = None, read_manifest(destination)
+    identity = source_identity(job['source'], manifest)
+    kept, runs = plan_levels(manifest, identity, options)
+    if (runs == [] and manifest.get('requested_zoom') == options.get('zoom')
+            and kept == list(range(manifest['zoom'][0], manifest['zoom'][1] + 1))):
+        return {'seconds': time.perf_counter() - start, 'levels': [], 'manifest': manifest}
+
+    if staging_root:
+        os.makedirs(staging_root, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=f"tiling-{job['volcano']}-{job['map']}-", dir=staging_root)
+    try:
+        if runs is None:
+            tif_to_kml(job['source'], staging_dir, job['map'], job['volcano'], options=options)
+        else:
+            # Start from the kept levels and render the whole final range in resume mode: gdal2tiles skips
+            # the tiles that exist, renders the missing levels and writes the root files (tilemapresource.xml,
+            # doc.kml, viewers) for the full range, so they are not copied from the published pyramid
+            if published is not None:
+                extract_archive(published, staging_dir, kept, files=False)
+            else:
+                for level in kept:
+                    shutil.copytree(os.path.join(destination, str(level)), os.path.join(staging_dir, str(level)),
+                                    copy_function=link_or_copy)
+            final = sorted(set(kept) | {level for first, last in runs for level in range(first, last + 1)})
+            tif_to_kml(job['source'], staging_dir, job['map'], job['volcano'],
+                       options=dict(options, zoom=f'{final[0]}-{final[-1]}', resume=True))
+
+        levels, tile_count = scan_pyramid(staging_dir)
+        manifest = dict(identity, source=os.path.basename(job['source']),
+                        options={key: value for key, value in options.items()
+                                 if key not in RUNTIME_OPTIONS + ('zoom',)},
+                        requested_zoom=options.get('zoom'), zoom=levels, tile_count=tile_count,
+                        created=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        if archive:
+            write_archive(staging_dir, archive_path(destination), manifest)
+            if os.path.isdir(destination):
+                # Superseded by the archive, which the tile endpoint reads first
+                shutil.rmtree(destination)
+        else:
+            with open(os.path.join(staging_dir, MANIFEST), 'w') as file:
+                json.dump(manifest, file, indent=2)
+            replace_dir(staging_dir, destination)
+            if os.path.isfile(archive_path(destination)):
+                # Would be served instead of the new directory
+                os.remove(archive_path(destination))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    levels_rendered = 'all' if runs is None else runs or 'pruned'
+    return {'seconds': time.perf_counter() - start, 'levels': levels_rendered, 'manifest': manifest}
+
+
+def tile_source(volcano, map_name, source, destination, nb_processes=1, url=DEFAULT_URL, staging_root=None,
+                zoom=None, archive=False, cog=False):
+    """
+    Tiles one GeoTIFF outside of a batch, e.g. while ingesting a bundle. See tile_one.
+
+    Args:
+        volcano (str): Name of the volcano.
+        map_name (str): Name of the map.
+        source (str): Path to the GeoTIFF.
+        destination (str): Output directory of the pyramid.
+
+    Returns:
+        dict: Result of tile_one.
+    """
+    job = {'volcano': volcano, 'map': map_name, 'source': source}
+    return tile_one(job, destination, nb_processes, url, staging_root, zoom, archive, cog)
+
+
+def tile_batch(jobs, volcanoes_path, max_cores, processes_per_file, url=DEFAULT_URL, staging_root=None, zoom=None,
+               archive=False, cog=False):
+    """
+    Tiles a batch of GeoTIFFs across a process pool, each file using gdal2tiles' own multi-process mode.
+    Files whose published pyramid is up to date are skipped, see tile_one.
+
+    Args:
+        jobs (list): Entries returned by find_sources.
+        volcanoes_path (str): Path to the 'volcanoes' directory.
+        max_cores (int): Maximum number of cores used by the whole batch.
+        processes_per_file (int): Number of gdal2tiles processes per file.
+        url (str): Public URL template of the output directories, with {volcano} and {map} fields.
+        staging_root (str, optional): Directory for staging pyramids, e.g. under the configured 'temp' path.
+        zoom (str, optional): Zoom levels to render, e.g. '5-12'. gdal2tiles chooses them if not set.
+        archive (bool): Publish each pyramid as a tile archive instead of a directory.
+        cog (bool): Convert each GeoTIFF to a COG rendered on demand instead of tiling it.
+
+    Returns:
+        list: The jobs, each updated with its 'output' directory and either its result or its 'error'.
+    """
+    if not jobs:
+        return []
+    concurrent_files, nb_processes = plan_processes(len(jobs), max_cores, processes_per_file)
+    log.info(f"Tiling {len(jobs)} GeoTIFFs, {concurrent_files} at a time with {nb_processes} processes each")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrent_files) as executor:
+        futures = {}
+        for job in jobs:
+            job['output'] = output_dir(volcanoes_path, job['volcano'], job['map'])
+            futures[executor.submit(tile_one, job, job['output'], nb_processes, url, staging_root, zoom,
+                                    archive, cog)] = job
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                job.update(future.result())
+                if job['levels']:
+                    log.info(f"Tiled {job['source']} (levels: {job['levels']}) in {job['seconds']:.1f} s")
+                else:
+                    log.info(f"Skipped {job['source']}, its pyramid is up to date")
+            except Exception as e:
+                job['error'] = str(e)
+                log.error(f"Error tiling {job['source']}: {e}")
+    log.info(f"Tiled {len(jobs)} GeoTIFFs in {time.perf_counter() - start:.1f} s")
+    return jobs
@@ -1,8 +1,24 @@
 import os
-from osgeo import osr
+import glob
+import logging
+import shutil
+import ctypes
+import ctypes.util
+from osgeo import osr, gdal
 osr.UseExceptions()
+gdal.UseExceptions()
 from osgeo_utils import gdal2tiles
 
+from api.shared.constants import statistics_path
+from api.shared.statistics import dataset_statistics, STATISTICS_BINS
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Published GeoTIFFs, relative to the volcanoes directory
+RASTER_PATTERNS = [
+    os.path.join('*', 'tifs', '*.tif'),
+    os.path.join('*', 'tifs', '*.tiff'),
+]
 
 
 def dir_files_list(directory):
@@ -23,31 +39,215 @@ def dir_files_list(directory):
     return files
 
 
-def tif_to_kml(input_tif, output_dir, map_name, volcano_name):
+def tiling_options(map_name, volcano_name, nb_processes=1, url=None, zoom=None):
     """
-    Convert a TIFF file to KML using gdal2tiles.
+    Build the gdal2tiles options used by tif_to_kml.
 
     Args:
-        input_tif (str): Input path of the TIFF file.
-        output_dir (str): Output directory to store the resulting tiles.
         map_name (str): Name of the map to be used in titles.
         volcano_name (str): Name of the volcano to be used in the URL.
-    """
-    print(f"Input TIFF: {input_tif}")
-    print(f"Output Directory: {output_dir}")
+        nb_processes (int): Number of processes gdal2tiles uses to render the tiles.
+        url (str, optional): Public URL of the output directory, the volcano 'kml' directory by default.
+        zoom (str, optional): Zoom levels to render, e.g. '5-12'. gdal2tiles chooses them if not set.
 
-    # Define options for gdal2tiles
+    Returns:
+        dict: Options for gdal2tiles.generate_tiles.
+    """
     options = {
         'verbose': False,
         'title': map_name,
         'profile': 'mercator',
-        'url': f'https://volcanboxws.obsea.es/volcanoes/{volcano_name}/kml/',
+        'url': url or f'https://volcanboxws.obsea.es/volcanoes/{volcano_name}/kml/',
         'resampling': 'average',
         # ... (other options)
         'googlekey': 'Your_Google_Key_Here',  # Replace with your actual key
         'bingkey': 'Your_Bing_Key_Here',  # Replace with your actual key
-        'nb_processes': 1
+        'nb_processes': nb_processes
     }
+    if zoom:
+        options['zoom'] = zoom
+    return options
+
+
+def tif_to_kml(input_tif, output_dir, map_name, volcano_name, nb_processes=1, url=None, options=None):
+    """
+    Convert a TIFF file to KML using gdal2tiles.
+
+    Args:
+        input_tif (str): Input path of the TIFF file.
+        output_dir (str): Output directory to store the resulting tiles.
+        map_name (str): Name of the map to be used in titles.
+        volcano_name (str): Name of the volcano to be used in the URL.
+        nb_processes (int): Number of processes gdal2tiles uses to render the tiles of this file.
+        url (str, optional): Public URL of output_dir, the volcano 'kml' directory by default.
+        options (dict, optional): gdal2tiles options, built by tiling_options if not given.
+    """
+    print(f"Input TIFF: {input_tif}")
+    print(f"Output Directory: {output_dir}")
+
+    # Define options for gdal2tiles
+    if options is None:
+        options = tiling_options(map_name, volcano_name, nb_processes, url)
 
     # Generate tiles
     gdal2tiles.generate_tiles(input_tif, output_dir, **options)
+
+
+def tif_to_cog(input_tif, output_path, metadata=None):
+    """
+    Convert a GeoTIFF to a Cloud-Optimized GeoTIFF reprojected and tiled on the web mercator grid, with
+    one overview per zoom level, so that api.shared.render reads each web map tile as aligned blocks.
+
+    Args:
+        input_tif (str): Input path of the TIFF file.
+        output_path (str): Path of the COG to write.
+        metadata (dict, optional): Metadata items stored in the COG, e.g. the tiling manifest.
+    """
+    source = gdal.Open(input_tif)
+    # Categories must not be averaged into colors that are not in the palette
+    paletted = source.GetRasterBand(1).GetColorTable() is not None
+    resampling = 'NEAREST' if paletted else 'AVERAGE'
+    options = gdal.TranslateOptions(
+        format='COG',
+        creationOptions=['TILING_SCHEME=GoogleMapsCompatible', 'COMPRESS=DEFLATE', 'PREDICTOR=YES',
+                         f'RESAMPLING={resampling}', f'WARP_RESAMPLING={resampling}', 'OVERVIEWS=IGNORE_EXISTING',
+                         'BIGTIFF=IF_SAFER'],
+        metadataOptions=[f'{key}={value}' for key, value in (metadata or {}).items()])
+    gdal.Translate(output_path, source, options=options)
+    source = None  # Close the dataset
+
+
+def read_cog_metadata(path):
+    """
+    Args:
+        path (str): Path to a COG written by tif_to_cog.
+
+    Returns:
+        dict: Metadata items of the COG, or None if it does not exist.
+    """
+    if not os.path.isfile(path):
+        return None
+    return gdal.Open(path).GetMetadata() or {}
+
+
+def raster_statistics(input_tif, bins=STATISTICS_BINS):
+    """
+    Compute the statistics of every band of a GeoTIFF, see dataset_statistics.
+
+    Args:
+        input_tif (str): Input path of the TIFF file.
+        bins (int): Number of bins of the histograms. Integer rasters with fewer values get one bin per value.
+
+    Returns:
+        dict: 'width' and 'height' of the raster and the statistics of its 'bands'.
+    """
+    dataset = gdal.Open(input_tif)
+    statistics = dataset_statistics(dataset, bins)
+    dataset = None  # Close the dataset
+    return statistics
+
+
+def write_raster_statistics(input_tif, force=False):
+    """
+    Compute the statistics of a GeoTIFF to its sidecar, unless the sidecar is already up to date.
+
+    Args:
+        input_tif (str): Input path of the TIFF file.
+        force (bool): Compute them even if the sidecar is newer than the GeoTIFF.
+
+    Returns:
+        bool: True if the sidecar was written.
+    """
+    path = statistics_path(input_tif)
+    if not force and os.path.isfile(path) and os.stat(path).st_mtime_ns >= os.stat(input_tif).st_mtime_ns:
+        return False
+    from api.shared.sidecars import write_json_atomic  # Not needed to tile or convert the GeoTIFFs
+
+    write_json_atomic(path, raster_statistics(input_tif))
+    return True
+
+
+def write_statistics(volcanoes_path, force=False):
+    """
+    Compute the statistics of every published GeoTIFF under the volcanoes directory.
+
+    Args:
+        volcanoes_path (str): Path to the 'volcanoes' directory.
+        force (bool): Compute even the statistics whose sidecar is up to date.
+
+    Returns:
+        dict: Number of sidecars 'written', 'skipped' as up to date and 'failed'.
+    """
+    summary = {'written': 0, 'skipped': 0, 'failed': 0}
+    for pattern in RASTER_PATTERNS:
+        for tif_path in sorted(glob.glob(os.path.join(volcanoes_path, pattern))):
+            try:
+                written = write_raster_statistics(tif_path, force)
+                summary['written' if written else 'skipped'] += 1
+            except Exception as e:
+                log.error(f"Error computing the statistics of {tif_path}: {e}")
+                summary['failed'] += 1
+    return summary
+
+
+def link_or_copy(source, destination):
+    """
+    Hard link a file, or copy it when both paths are on different filesystems.
+
+    Args:
+        source (str): Existing file.
+        destination (str): Path of the new file.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _rename_exchange(first, second):
+    """
+    Atomically exchange two paths with renameat2(RENAME_EXCHANGE), available on Linux only.
+
+    Returns:
+        bool: True if the paths were exchanged.
+    """
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return False
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'renameat2'):
+        return False
+    at_fdcwd, rename_exchange = -100, 2
+    return libc.renameat2(at_fdcwd, os.fsencode(first), at_fdcwd, os.fsencode(second), rename_exchange) == 0
+
+
+def replace_dir(staging_dir, destination, backup_dir=None):
+    """
+    Publish a fully written directory in place of another one, so readers never see a partial tree.
+
+    The staging directory is first moved next to the destination (copied if it lives on another
+    filesystem), then exchanged with it in a single atomic rename where the platform supports it.
+
+    Args:
+        staging_dir (str): Directory to publish.
+        destination (str): Directory to replace, created if it does not exist.
+        backup_dir (str, optional): Where the previous version is moved to. It is deleted if not given.
+    """
+    parent, name = os.path.split(os.path.normpath(destination))
+    os.makedirs(parent, exist_ok=True)
+    incoming = os.path.join(parent, f'.{name}.incoming-{os.getpid()}')
+    shutil.move(staging_dir, incoming)
+    if not os.path.exists(destination):
+        os.rename(incoming, destination)
+        return
+    if _rename_exchange(incoming, destination):
+        previous = incoming  # Holds the previous version after the exchange
+    else:
+        previous = os.path.join(parent, f'.{name}.previous-{os.getpid()}')
+        os.rename(destination, previous)
+        os.rename(incoming, destination)
+    if backup_dir:
+        os.makedirs(os.path.dirname(os.path.normpath(backup_dir)), exist_ok=True)
+        shutil.move(previous, backup_dir)
+    else:
+        shutil.rmtree(previous)
@@ -0,0 +1,330 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Names written while files are being replaced, never served
+IGNORED_SUFFIXES = ('.tmp', '.lock', '.swp', '~')
+
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_DEBOUNCE = 0.5
+
+
+class WatchError(OSError):
+    """
+    Raised when a directory cannot be watched, e.g. once the inotify watch limit is reached.
+    """
+
+
+class InotifyBackend:
+    """
+    Recursive inotify watch of a directory tree, Linux only.
+    """
+
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True) if libc_name else None
+        if self._libc is None or not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self.root = root
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._paths = {}
+        try:
+            self.add_tree(root)
+        except WatchError:
+            self.close()
+            raise
+
+    def add_tree(self, directory):
+        """
+        Watches a directory and all of its subdirectories.
+
+        Raises:
+            WatchError: If a directory that still exists cannot be watched, its changes would be missed.
+        """
+        for current, dirs, _ in os.walk(directory):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(current), WATCH_MASK | IN_ONLYDIR)
+            if wd >= 0:
+                self._paths[wd] = current
+                continue
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                continue  # Removed since the walk listed it
+            log.warning(f"Cannot watch {current}: {os.strerror(error)}")
+            raise WatchError(error, f'inotify_add_watch failed for {current}')
+
+    def read(self, timeout):
+        """
+        Waits for events.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            list: Changed paths, or None if the kernel queue overflowed and events were lost.
+
+        Raises:
+            WatchError: If a new directory cannot be watched.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name)) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)  # Watch directories published after the start
+            paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingBackend:
+    """
+    Detects changes of a directory tree by comparing mtime/size snapshots, for platforms without inotify.
+    """
+
+    def __init__(self, root, interval=DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._scanned_at = time.monotonic()
+
+    def _scan(self):
+        snapshot = {}
+        for current, dirs, files in os.walk(self.root):
+            for name in dirs + files:
+                path = os.path.join(current, name)
+                try:
+                    stat = os.lstat(path)
+                except FileNotFoundError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        return snapshot
+
+    def read(self, timeout):
+        """
+        Waits for the timeout, rescanning the tree if the poll interval elapsed since the previous scan.
+
+        Returns:
+            list: Paths created, changed or removed since the previous scan, empty if the tree was not scanned.
+        """
+        remaining = self.interval - (time.monotonic() - self._scanned_at)
+        if remaining > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(remaining, 0))
+        self._scanned_at = time.monotonic()
+        snapshot = self._scan()
+        previous, self._snapshot = self._snapshot, snapshot
+        return [path for path in set(previous) | set(snapshot) if previous.get(path) != snapshot.get(path)]
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """
+    Background watcher of the volcanoes directory that issues targeted cache invalidations.
+
+    File events are mapped to the narrowest invalidation (a volcano JSON, one metadata workbook, one
+    image/KML/tile file, or a whole volcano when its directory is replaced), collected until no new
+    event arrives for the debounce delay and then issued once each.
+    """
+
+    def __init__(self, invalidator, backend='auto', poll_interval=DEFAULT_POLL_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        """
+        Args:
+            invalidator (Invalidator): Caches to invalidate.
+            backend (str): 'inotify', 'polling' or 'auto' to use inotify when available.
+            poll_interval (float): Seconds between two scans of the polling backend.
+            debounce (float): Seconds without events before the pending invalidations are issued.
+        """
+        self.invalidator = invalidator
+        self.root = os.path.normpath(invalidator.catalog.root)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.backend = None
+        if backend in ('auto', 'inotify'):
+            try:
+                self.backend = InotifyBackend(self.root)
+            except WatchError as e:
+                log.warning(f"Cannot watch the whole tree with inotify ({e}), polling {self.root} instead")
+            except OSError as e:
+                if backend == 'inotify':
+                    raise
+                log.info(f"inotify not available ({e}), polling {self.root} instead")
+        if self.backend is None:
+            self.backend = PollingBackend(self.root, poll_interval)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.events_seen = 0
+        self.invalidations_issued = 0
+        self.full_rescans = 0
+
+    def start(self):
+        """
+        Starts watching in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self._run, name='volcano-watcher', daemon=True)
+        self._thread.start()
+        log.info(f"Watching {self.root} with {type(self.backend).__name__}")
+
+    def stop(self, timeout=5):
+        """
+        Stops the watching thread and releases the backend.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        pending = {}
+        last_event = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    paths = self.backend.read(self.debounce if pending else 1.0)
+                except WatchError as e:
+                    # Part of the tree is not watched any more, poll it and rescan what may have been missed
+                    log.warning(f"Switching to polling {self.root}: {e}")
+                    self.backend.close()
+                    self.backend = PollingBackend(self.root, self.poll_interval)
+                    paths = None
+                if paths is None:
+                    # Events were lost, only a full rescan is safe
+                    pending = {('rebuild',): None}
+                    last_event = time.monotonic()
+                elif paths:
+                    with self._lock:
+                        self.events_seen += len(paths)
+                    for path in paths:
+                        self._classify(path, pending)
+                    last_event = time.monotonic()
+                if pending and time.monotonic() - last_event >= self.debounce:
+                    self._issue(pending)
+                    pending = {}
+        except Exception as e:
+            log.error(f"Error watching {self.root}: {e}")
+        finally:
+            self.backend.close()
+
+    def _classify(self, path, pending):
+        relative = os.path.relpath(path, self.root)
+        parts = relative.split(os.sep)
+        if relative == '.' or parts[0] == '..' or any(part.startswith('.') for part in parts) \
+                or parts[-1].endswith(IGNORED_SUFFIXES):
+            return
+        if len(parts) == 1:
+            if relative.endswith('.json'):
+                pending[('volcano_files',)] = path
+            elif os.path.isdir(path) or not os.path.exists(path):
+                pending[('volcano', parts[0])] = None  # A volcano directory was published or removed
+            return
+
+        volcano = parts[0]
+        if ('volcano', volcano) in pending:
+            return  # Already covered by the invalidation of the whole volcano
+        if len(parts) == 2:
+            if os.path.isdir(path) or not os.path.exists(path):
+                pending[('volcano', volcano)] = None
+        elif parts[1] == 'metadata' or parts[1] == 'event_tree':
+            if os.path.splitext(path)[1] in ('.xlsx', '.json'):
+                pending[('metadata', volcano, os.path.splitext(path)[0])] = path
+        else:
+            pending[('file', volcano, path)] = path
+
+    def _issue(self, pending):
+        for key, path in pending.items():
+            kind = key[0]
+            try:
+                if kind == 'rebuild':
+                    self.invalidator.rebuild()
+                    self.full_rescans += 1
+                elif kind == 'volcano':
+                    self.invalidator.volcano(key[1])
+                elif kind == 'volcano_files':
+                    self.invalidator.volcano_files(path)
+                elif kind == 'metadata':
+                    if ('volcano', key[1]) not in pending:
+                        self.invalidator.metadata(key[1], path)
+                elif ('volcano', key[1]) not in pending:
+                    self.invalidator.file(key[1], path)
+                with self._lock:
+                    self.invalidations_issued += 1
+            except Exception as e:
+                log.error(f"Error invalidating {key}: {e}")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Backend in use and counters of events seen, invalidations issued and full rescans.
+        """
+        with self._lock:
+            return {'backend': type(self.backend).__name__, 'events_seen': self.events_seen,
+                    'invalidations_issued': self.invalidations_issued, 'full_rescans': self.full_rescans}
+
+
+def create_watcher(config, invalidator):
+    """
+    Builds a watcher from the [watcher] configuration section.
+
+    Args:
+        config (Mapping): The [watcher] options, either from the Flask config or a ConfigParser.
+        invalidator (Invalidator): Caches to invalidate.
+
+    Returns:
+        Watcher: A watcher that has not been started.
+    """
+    return Watcher(invalidator, backend=config.get('backend') or 'auto',
+                   poll_interval=float(config.get('poll_interval') or DEFAULT_POLL_INTERVAL),
+                   debounce=float(config.get('debounce') or DEFAULT_DEBOUNCE))
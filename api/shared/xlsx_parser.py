@@ -1,24 +1,90 @@
-from openpyxl import load_workbook
+import json
 import os
 
+from api.shared.metrics import span
+
+SIDECAR_EXTENSION = '.json'
+
+
+def sidecar_path(file_path):
+    """
+    Get the path of the precompiled JSON sidecar of an XLSX file.
+
+    Args:
+        file_path (str): Path to the XLSX file.
+
+    Returns:
+        str: Path to the sidecar, next to the XLSX file and with the same name.
+    """
+    return os.path.splitext(file_path)[0] + SIDECAR_EXTENSION
+
+
+def _mtime_size(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def metadata_signature(file_path):
+    """
+    Identify the current version of an XLSX file and its sidecar, to validate cached data.
+
+    Args:
+        file_path (str): Path to the XLSX file.
+
+    Returns:
+        tuple: Modification time and size of the XLSX file and of its sidecar (None if missing).
+
+    Raises:
+        FileNotFoundError: If neither the XLSX file nor its sidecar exist.
+    """
+    signature = (_mtime_size(file_path), _mtime_size(sidecar_path(file_path)))
+    if signature == (None, None):
+        raise FileNotFoundError(file_path)
+    return signature
+
 
 def parse_xlsx(file_path):
     """
     Parse an XLSX file and extract data into a dictionary.
 
+    The precompiled JSON sidecar is read instead whenever it is newer than the workbook, or when
+    only the sidecar is deployed, so openpyxl is only imported to parse outdated workbooks.
+
     Args:
         file_path (str): Path to the XLSX file.
 
     Returns:
         dict: Data extracted from the XLSX file.
     """
-    wb = load_workbook(filename=file_path, read_only=True)
-    ws = wb['Sheet1']
-    data = {}
-    for row in ws:
-        key = str(row[0].value).strip() if row[0].value else ""
-        value = str(row[1].value).strip() if row[1].value else ""
-        data[key] = value
+    workbook, sidecar = metadata_signature(file_path)
+    if sidecar is not None and (workbook is None or sidecar[0] >= workbook[0]):
+        with span('sidecar_load'), open(sidecar_path(file_path), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return read_xlsx(file_path)
+
+
+def read_xlsx(file_path):
+    """
+    Read the first two columns of an XLSX file with openpyxl and extract them into a dictionary.
+
+    Args:
+        file_path (str): Path to the XLSX file.
+
+    Returns:
+        dict: Data extracted from the XLSX file.
+    """
+    from openpyxl import load_workbook  # Heavy import, only needed when no sidecar is usable
+    with span('xlsx_parse'):
+        wb = load_workbook(filename=file_path, read_only=True)
+        ws = wb['Sheet1']
+        data = {}
+        for row in ws:
+            key = str(row[0].value).strip() if row[0].value else ""
+            value = str(row[1].value).strip() if row[1].value else ""
+            data[key] = value
     return data
 
 
@@ -107,6 +173,7 @@ def get_map_summary(files):
     Returns:
         list: List of map summaries.
     """
+    from openpyxl import load_workbook  # Heavy import, only needed when this summary is requested
     maps = []
     for file in files:
         map_meta = {}
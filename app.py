@@ -1,5 +1,6 @@
 import os
-from __init__ import create_app, create_log
+from __init__ import create_app
+from api.shared.logs import create_log
 
 
 def main():
@@ -0,0 +1,42 @@
+import os
+import configparser
+
+from __init__ import create_app
+from api.shared.logs import create_log
+from api.shared.asgi import AsgiAdapter, DEFAULT_THREADS, DEFAULT_MAX_BODY
+
+
+def create_asgi_app():
+    """
+    Builds the application served from an event loop, e.g. with `uvicorn --factory asgi:create_asgi_app`.
+    """
+    config_file_path = os.path.normpath(os.path.join(os.path.dirname(__file__), 'config.ini'))
+    log = create_log()
+    flask_app = create_app(log, config_file_path)
+    options = flask_app.config['asgi']
+    return AsgiAdapter(flask_app, threads=int(options.get('threads') or DEFAULT_THREADS),
+                       max_body=int(options.get('max_body') or DEFAULT_MAX_BODY))
+
+
+def main():
+    """
+    Starts the application under uvicorn, in a single process.
+    """
+    import uvicorn  # Only needed by the async mode
+
+    config_file_path = os.path.normpath(os.path.join(os.path.dirname(__file__), 'config.ini'))
+    config = configparser.ConfigParser()
+    config.read(config_file_path)
+    webserver, options = config['webserver'], config['asgi']
+
+    # TLS is terminated by the server when the certificates are configured
+    cert, key = config.get('paths', 'crt', fallback=''), config.get('paths', 'key', fallback='')
+    tls = {'ssl_certfile': cert, 'ssl_keyfile': key} if os.path.isfile(cert) and os.path.isfile(key) else {}
+
+    uvicorn.run(create_asgi_app, factory=True, host=webserver.get('host', '127.0.0.1'),
+                port=webserver.getint('port', 5000), timeout_keep_alive=options.getint('keepalive', 5),
+                limit_concurrency=options.getint('limit_concurrency', 0) or None, log_config=None, **tls)
+
+
+if __name__ == "__main__":
+    main()
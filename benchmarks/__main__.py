@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+from benchmarks.generator import generate_tree, DEFAULT_VOLCANOES, DEFAULT_MAP_TYPES, DEFAULT_PNG_KB, \
+    DEFAULT_KML_KB, DEFAULT_TILE_KB
+from benchmarks.scenarios import select_scenarios
+from benchmarks.drivers import ClientDriver, ServerDriver, write_config, ROOT_PATH
+from benchmarks.report import compare, format_comparisons, load_report, write_report, DEFAULT_THRESHOLD
+
+TREE_FILE = 'tree.json'
+VOLCANOES_DIR = 'volcanoes'
+
+
+def list_targets(volcanoes_path):
+    """
+    Args:
+        volcanoes_path (str): Path to a generated volcanoes directory.
+
+    Returns:
+        list: Sorted (volcano, map type) pairs of the tree.
+    """
+    targets = []
+    for volcano in sorted(os.listdir(volcanoes_path)):
+        metadata_path = os.path.join(volcanoes_path, volcano, 'metadata')
+        if os.path.isdir(metadata_path):
+            targets.extend((volcano, os.path.splitext(name)[0]) for name in sorted(os.listdir(metadata_path))
+                           if name.endswith('.xlsx'))
+    return targets
+
+
+def git_revision():
+    """
+    Returns:
+        str: The commit of the benchmarked tree, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate(args):
+    tree = generate_tree(os.path.join(args.directory, VOLCANOES_DIR), args.volcanoes, args.map_types, args.png_kb,
+                         args.kml_kb, args.sidecars, args.seed, args.tile_kb, args.rasters)
+    with open(os.path.join(args.directory, TREE_FILE), 'w') as file:
+        json.dump(tree, file, indent=2)
+    return 0
+
+
+def run(args):
+    directory = os.path.abspath(args.directory)
+    volcanoes_path = os.path.join(directory, VOLCANOES_DIR)
+    targets = list_targets(volcanoes_path)
+    if not targets:
+        print(f"No maps found in {volcanoes_path}, generate a tree first", file=sys.stderr)
+        return 2
+    try:
+        scenarios = select_scenarios(args.scenario)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    tree = {}
+    if os.path.isfile(os.path.join(directory, TREE_FILE)):
+        with open(os.path.join(directory, TREE_FILE)) as file:
+            tree = json.load(file)
+
+    config_path = write_config(os.path.join(directory, 'config.ini'), volcanoes_path, args.host, args.port,
+                               args.workers, args.threads)
+    report = {
+        'meta': {'revision': git_revision(), 'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count(), 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'tree': tree,
+                 'requests': args.requests, 'warmup': args.warmup, 'concurrency': args.concurrency,
+                 'workers': args.workers, 'threads': args.threads},
+        'results': {},
+    }
+    drivers = ['client', 'server'] if args.driver == 'both' else [args.driver]
+    for name in drivers:
+        driver = ClientDriver(config_path) if name == 'client' else ServerDriver(config_path, args.host, args.port)
+        try:
+            results = report['results'][name] = {}
+            for scenario in scenarios:
+                results[scenario.name] = driver.run(scenario, targets, args.requests, args.warmup, args.concurrency)
+                result = results[scenario.name]
+                print(f"{name:<8} {scenario.name:<28} p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms  "
+                      f"{result['throughput_rps']:>9} req/s  {result['errors']} errors")
+        finally:
+            driver.close()
+
+    if args.output:
+        write_report(args.output, report)
+    if args.baseline:
+        comparisons = compare(report, load_report(args.baseline), args.threshold)
+        print(format_comparisons(comparisons))
+        if any(item['regression'] for item in comparisons):
+            return 1
+    return 0
+
+
+def compare_reports(args):
+    comparisons = compare(load_report(args.report), load_report(args.baseline), args.threshold)
+    print(format_comparisons(comparisons))
+    return 1 if any(item['regression'] for item in comparisons) else 0
+
+
+def main():
+    """
+    Generates synthetic volcanoes trees, benchmarks every endpoint against them and compares the reports.
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=main.__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='Fabricate a volcanoes tree.')
+    generate_parser.add_argument('directory', help=f"Directory receiving the '{VOLCANOES_DIR}' tree.")
+    generate_parser.add_argument('--volcanoes', type=int, default=DEFAULT_VOLCANOES, help='Number of volcanoes.')
+    generate_parser.add_argument('--map-types', type=int, default=DEFAULT_MAP_TYPES, help='Map types per volcano.')
+    generate_parser.add_argument('--png-kb', type=int, default=DEFAULT_PNG_KB, help='Size of each PNG, in KiB.')
+    generate_parser.add_argument('--kml-kb', type=int, default=DEFAULT_KML_KB, help='Size of each KML, in KiB.')
+    generate_parser.add_argument('--tile-kb', type=int, default=DEFAULT_TILE_KB,
+                                 help='Size of each tile of the pyramids, in KiB.')
+    generate_parser.add_argument('--sidecars', action='store_true', help='Compile the metadata sidecars.')
+    generate_parser.add_argument('--rasters', action='store_true',
+                                 help='Write the GeoTIFFs read by the point values scenarios. Needs GDAL.')
+    generate_parser.add_argument('--seed', type=int, default=0, help='Seed of the generated content.')
+    generate_parser.set_defaults(handler=generate)
+
+    run_parser = commands.add_parser('run', help='Benchmark the endpoints against a generated tree.')
+    run_parser.add_argument('directory', help='Directory given to the generate command.')
+    run_parser.add_argument('--driver', choices=['client', 'server', 'both'], default='both',
+                            help='Flask test client, real server started with serve.py, or both.')
+    run_parser.add_argument('--scenario', action='append', help='Scenario to run, repeatable, all by default.')
+    run_parser.add_argument('--requests', type=int, default=500, help='Measured requests per scenario.')
+    run_parser.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring.')
+    run_parser.add_argument('--concurrency', type=int, default=16, help='Concurrent connections to the server.')
+    run_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Server processes.')
+    run_parser.add_argument('--threads', type=int, default=4, help='Threads per server process.')
+    run_parser.add_argument('--host', default='127.0.0.1', help='Address of the server.')
+    run_parser.add_argument('--port', type=int, default=5055, help='Port of the server.')
+    run_parser.add_argument('--output', help='Write the report to this JSON file.')
+    run_parser.add_argument('--baseline', help='Compare with this report, exiting with 1 on regressions.')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative change considered a regression.')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='Compare a report with a baseline report.')
+    compare_parser.add_argument('report', help='Report of the current run.')
+    compare_parser.add_argument('baseline', help='Report of the reference run.')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                                help='Relative change considered a regression.')
+    compare_parser.set_defaults(handler=compare_reports)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import socket
+import logging
+import resource
+import threading
+import subprocess
+import http.client
+import configparser
+
+from benchmarks.report import summarize
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RSS_SAMPLE_INTERVAL = 0.05
+SERVER_START_TIMEOUT = 60
+
+
+def write_config(path, volcanoes_path, host='127.0.0.1', port=5055, workers=4, threads=1):
+    """
+    Writes a copy of config.ini serving a generated tree, without background threads nor TLS.
+
+    Args:
+        path (str): Destination of the configuration file.
+        volcanoes_path (str): Absolute path to the generated volcanoes directory.
+        host (str): Address the server listens on.
+        port (int): Port the server listens on.
+        workers (int): Number of server processes.
+        threads (int): Number of threads per server process.
+
+    Returns:
+        str: The path of the configuration file.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(ROOT_PATH, 'config.ini'))
+    config['paths']['volcano'] = volcanoes_path
+    config['paths']['crt'] = ''
+    config['paths']['key'] = ''
+    config['webserver']['host'] = host
+    config['webserver']['port'] = str(port)
+    config['server']['workers'] = str(workers)
+    config['server']['threads'] = str(threads)
+    config['ingest']['enabled'] = 'false'
+    config['watcher']['enabled'] = 'false'
+    with open(path, 'w') as file:
+        config.write(file)
+    return path
+
+
+def _process_rss_kb(pid):
+    # Resident memory of one process, from /proc on Linux
+    try:
+        with open(f'/proc/{pid}/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb(pid):
+    """
+    Args:
+        pid (int): Process id of a server master.
+
+    Returns:
+        int: Resident memory of the process and its children, in KiB, or None where /proc is unavailable.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    total = _process_rss_kb(pid)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as file:
+                # The parent pid follows the command name, which is between parentheses
+                parent = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            total += _process_rss_kb(int(entry))
+    return total
+
+
+class ClientDriver:
+    """
+    Drives the application in-process through the Flask test client, one request at a time. It measures
+    the cost of the application code alone, without networking nor server.
+    """
+
+    name = 'client'
+
+    def __init__(self, config_path):
+        """
+        Args:
+            config_path (str): Configuration written by write_config.
+        """
+        from __init__ import create_app  # The application is only built by the in-process driver
+
+        self.app = create_app(logging.getLogger('benchmark'), config_path, background=False)
+        self.client = self.app.test_client()
+
+    def run(self, scenario, targets, requests, warmup, concurrency=1):
+        """
+        Args:
+            scenario (Scenario): Request to repeat.
+            targets (list): (volcano, map type) pairs the requests cycle through.
+            requests (int): Number of measured requests.
+            warmup (int): Number of requests sent before measuring.
+            concurrency (int): Ignored, requests are sent one at a time.
+
+        Returns:
+            dict: The summary of the measures, see benchmarks.report.summarize. The peak RSS is the one of the
+            whole benchmark process so far.
+        """
+        latencies = []
+        errors = 0
+        for index in range(warmup + requests):
+            method, path, body = scenario.request(*targets[index % len(targets)])
+            start = time.perf_counter()
+            response = self.client.open(path, method=method, data=body,
+                                        content_type='application/json' if body is not None else None)
+            response.get_data()
+            response.close()
+            if index >= warmup:
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code >= 400
+        elapsed = sum(latencies)
+        return summarize(latencies, elapsed, errors, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """
+    Drives a real multi-worker server started with serve.py, from concurrent keep-alive connections.
+    """
+
+    name = 'server'
+
+    def __init__(self, config_path, host='127.0.0.1', port=5055):
+        """
+        Args:
+            config_path (str): Configuration written by write_config, with the same host and port.
+            host (str): Address the server listens on.
+            port (int): Port the server listens on.
+        """
+        self.host = host
+        self.port = port
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT_PATH, 'serve.py'), '--config', config_path],
+                                        cwd=ROOT_PATH)
+        self._wait_ready()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                with socket.create_connection((self.host, self.port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f"Server not listening on {self.host}:{self.port} after {SERVER_START_TIMEOUT} s")
+
+    def run(self, scenario, targets, requests, warmup, concurrency=8):
+        """
+        Args:
+            scenario (Scenario): Request to repeat.
+            targets (list): (volcano, map type) pairs the requests cycle through.
+            requests (int): Number of measured requests, shared by the connections.
+            warmup (int): Number of requests sent before measuring.
+            concurrency (int): Number of concurrent connections.
+
+        Returns:
+            dict: The summary of the measures, see benchmarks.report.summarize. The peak RSS is the one of the
+            server processes during the run.
+        """
+        self._send(scenario, targets, 0, warmup, 1)
+        peak = [tree_rss_kb(self.process.pid)]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(RSS_SAMPLE_INTERVAL):
+                rss = tree_rss_kb(self.process.pid)
+                if rss is not None:
+                    peak[0] = max(peak[0] or 0, rss)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        latencies, errors = self._send(scenario, targets, warmup, requests, concurrency)
+        elapsed = time.perf_counter() - start
+        sampling.set()
+        sampler.join()
+        return summarize(latencies, elapsed, errors, peak[0])
+
+    def _send(self, scenario, targets, offset, requests, concurrency):
+        # Sends requests from concurrent connections and returns their latencies and the number of errors
+        latencies = []
+        errors = [0]
+        counter = iter(range(offset, offset + requests))
+        lock = threading.Lock()
+
+        def worker():
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                while True:
+                    with lock:
+                        index = next(counter, None)
+                    if index is None:
+                        return
+                    method, path, body = scenario.request(*targets[index % len(targets)])
+                    headers = {'Content-Type': 'application/json'} if body is not None else {}
+                    start = time.perf_counter()
+                    try:
+                        connection.request(method, path, body=body, headers=headers)
+                        response = connection.getresponse()
+                        response.read()
+                        failed = response.status >= 400
+                    except (OSError, http.client.HTTPException):
+                        connection.close()
+                        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                        failed = True
+                    latency = time.perf_counter() - start
+                    with lock:
+                        latencies.append(latency)
+                        errors[0] += failed
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(concurrency, 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors[0]
+
+    def close(self):
+        """
+        Stops the server and its workers.
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
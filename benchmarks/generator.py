@@ -0,0 +1,269 @@
+import os
+import json
+import math
+import zlib
+import struct
+import random
+import logging
+
+from api.shared.catalog import VOLCANO_FILES, METADATA_DIR, EVENT_TREE_METADATA, RASTER_DIR
+from api.shared.sidecars import compile_sidecars
+from api.shared.tiles import PYRAMID_DIR, MANIFEST
+from api.shared.tile_archive import archive_path, write_archive
+
+log = logging.getLogger(__name__)  # Setup logging for this module
+
+# Rows of the metadata workbooks, as in the published ones
+METADATA_ROWS = [
+    'Name', 'Functionality', 'Category', 'Item type', 'Authors', 'Product reference', 'Tag-keywords',
+    'Dependencies', 'Hazard type:', 'Hazard type- Data source', 'Hazard type- Model name',
+    'Hazard type-  Scenario definition', 'Hazard type-Product type', 'Hazard type- Parameter',
+    'Hazard type-Percentile', 'Hazard type- Threshold', 'Hazard type- Units', 'Geographical location-  Country',
+    'Geographical location- Volcano name', 'Volcano ID', 'Volcano Lat', 'Volcano Long',
+    'Grid-  Ll grid point (product reference system)', 'Grid- Ur grid point (product reference system)',
+    'Grid- Ll grid point (ll)', 'Grid- Ur grid point (ll)', 'Grid- Spatial resolution', 'Grid- Size',
+    'Time of creation', 'Time- Validity', 'Additional data', 'Access to map',
+]
+CATEGORIES = ['Hazard', 'Risk', 'Susceptibility', 'Exposure']
+HAZARDS = ['Lava flow', 'Tephra fallout', 'Pyroclastic density current', 'Lahar', 'Ballistics', 'Gas dispersion']
+MODELS = ['FALL3D', 'Tephra2', 'VORIS', 'Q-LavHA', 'LAHARZ', 'TITAN2D']
+COUNTRIES = ['Spain', 'Italy', 'Iceland', 'Chile', 'Ecuador', 'Indonesia', 'Japan', 'Mexico']
+WORDS = ['lava', 'ash', 'tephra', 'flow', 'eruption', 'vent', 'probability', 'scenario', 'deposit', 'plume',
+         'column', 'density', 'current', 'hazard', 'map', 'long', 'short', 'term', 'effusive', 'explosive']
+
+DEFAULT_VOLCANOES = 50
+DEFAULT_MAP_TYPES = 8
+DEFAULT_PNG_KB = 150
+DEFAULT_KML_KB = 256
+DEFAULT_TILE_KB = 20
+
+# Every pyramid and raster covers the same area, so that the scenarios address their tiles and pixels
+# without knowing where the volcano is: PYRAMID_SPAN x PYRAMID_SPAN tiles around (0, 0) at each zoom level,
+# and RASTER_SIZE pixels of RASTER_PIXEL degrees from RASTER_ORIGIN (west, north)
+PYRAMID_ZOOMS = (8, 9, 10)
+PYRAMID_SPAN = 4
+# Each pyramid is also packed into an archive, served as the map '<map type><PACKED_SUFFIX>'
+PACKED_SUFFIX = '-packed'
+RASTER_SIZE = 512
+RASTER_PIXEL = 0.004
+RASTER_ORIGIN = (-1.0, 1.0)
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def write_png(path, size_kb, rng):
+    """
+    Writes a valid RGB PNG of noise, which does not compress, so its size is close to the requested one.
+
+    Args:
+        path (str): Destination path.
+        size_kb (int): Approximate size of the file, in KiB.
+        rng (Random): Source of the noise.
+    """
+    side = max(int(math.sqrt(size_kb * 1024 / 3)), 1)
+    raw = b''.join(b'\x00' + rng.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as file:
+        file.write(b'\x89PNG\r\n\x1a\n')
+        file.write(chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)))
+        file.write(chunk(b'IDAT', zlib.compress(raw, 1)))
+        file.write(chunk(b'IEND', b''))
+
+
+def write_kml(path, size_kb, lat, lng, rng):
+    """
+    Writes a KML of polygons around a volcano, until it reaches about the requested size.
+
+    Args:
+        path (str): Destination path.
+        size_kb (int): Approximate size of the file, in KiB.
+        lat (float): Latitude of the volcano.
+        lng (float): Longitude of the volcano.
+        rng (Random): Source of the coordinates.
+    """
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n']
+    size = len(parts[0])
+    placemark = 0
+    while size < size_kb * 1024:
+        coordinates = ' '.join(f'{lng + rng.uniform(-0.5, 0.5):.6f},{lat + rng.uniform(-0.5, 0.5):.6f},0'
+                               for _ in range(64))
+        part = (f'<Placemark><name>Contour {placemark}</name><Polygon><outerBoundaryIs><LinearRing>'
+                f'<coordinates>{coordinates}</coordinates></LinearRing></outerBoundaryIs></Polygon></Placemark>\n')
+        parts.append(part)
+        size += len(part)
+        placemark += 1
+    parts.append('</Document></kml>\n')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(''.join(parts))
+
+
+def pyramid_tiles():
+    """
+    Returns:
+        list: (zoom, column, row) of the tiles of every generated pyramid, rows from the north (XYZ).
+    """
+    tiles = []
+    for z in PYRAMID_ZOOMS:
+        first = 2 ** (z - 1) - PYRAMID_SPAN // 2
+        tiles.extend((z, x, y) for x in range(first, first + PYRAMID_SPAN) for y in range(first, first + PYRAMID_SPAN))
+    return tiles
+
+
+def write_pyramid(directory, tile_kb, rng):
+    """
+    Writes a pyramid as gdal2tiles does (TMS rows, doc.kml, tilemapresource.xml) with its manifest, and
+    packs a copy of it into the archive of the '<directory><PACKED_SUFFIX>' map.
+
+    Args:
+        directory (str): Pyramid directory, <volcano>/kml/<map type>.
+        tile_kb (int): Approximate size of each tile, in KiB.
+        rng (Random): Source of the tiles.
+    """
+    for z, x, y in pyramid_tiles():
+        column_dir = os.path.join(directory, str(z), str(x))
+        os.makedirs(column_dir, exist_ok=True)
+        write_png(os.path.join(column_dir, f'{2 ** z - 1 - y}.png'), tile_kb, rng)
+    with open(os.path.join(directory, 'doc.kml'), 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2">'
+                   '<Document></Document></kml>\n')
+    with open(os.path.join(directory, 'tilemapresource.xml'), 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<TileMap version="1.0.0"></TileMap>\n')
+    manifest = {'zoom': [PYRAMID_ZOOMS[0], PYRAMID_ZOOMS[-1]], 'options': {'profile': 'mercator'}}
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    write_archive(directory, archive_path(directory + PACKED_SUFFIX), manifest)
+
+
+def write_raster(path, rng):
+    """
+    Writes a tiled single band Float32 GeoTIFF in WGS84 over the area shared by every raster.
+
+    Args:
+        path (str): Destination path.
+        rng (Random): Source of the values.
+    """
+    from osgeo import gdal, osr  # Only needed to generate trees with rasters
+    import numpy as np
+
+    gdal.UseExceptions()
+    dataset = gdal.GetDriverByName('GTiff').Create(path, RASTER_SIZE, RASTER_SIZE, 1, gdal.GDT_Float32,
+                                                   ['TILED=YES', 'COMPRESS=DEFLATE'])
+    dataset.SetGeoTransform((RASTER_ORIGIN[0], RASTER_PIXEL, 0.0, RASTER_ORIGIN[1], 0.0, -RASTER_PIXEL))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    dataset.SetProjection(srs.ExportToWkt())
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(-9999)
+    values = np.random.default_rng(rng.randrange(2 ** 32)).random((RASTER_SIZE, RASTER_SIZE), dtype=np.float32)
+    values[values < 0.05] = -9999
+    band.WriteArray(values)
+    dataset = None  # Flush and close the file
+
+
+def write_workbook(path, rows):
+    """
+    Writes a metadata workbook with a key and a value per row of 'Sheet1', as read by xlsx_parser.
+
+    Args:
+        path (str): Destination path.
+        rows (dict): Values by metadata row.
+    """
+    from openpyxl import Workbook  # Heavy import, only needed to generate trees
+
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet1'
+    for key, value in rows.items():
+        sheet.append([key, value])
+    workbook.save(path)
+
+
+def map_metadata(rng, volcano, name, map_type, lat, lng):
+    """
+    Returns:
+        dict: Plausible values of every metadata row of a map.
+    """
+    hazard = rng.choice(HAZARDS)
+    half = rng.uniform(0.1, 1.0)
+    rows = {row: _words(rng, rng.randint(2, 8)) for row in METADATA_ROWS}
+    rows.update({
+        'Name': f'{hazard} {map_type} of {name}',
+        'Category': rng.choice(CATEGORIES),
+        'Authors': ', '.join(f'Author {rng.randint(1, 40)}' for _ in range(rng.randint(1, 4))),
+        'Tag-keywords': ', '.join(rng.sample(WORDS, 4)),
+        'Hazard type:': hazard,
+        'Hazard type- Model name': rng.choice(MODELS),
+        'Geographical location-  Country': rng.choice(COUNTRIES),
+        'Geographical location- Volcano name': name,
+        'Volcano ID': volcano,
+        'Volcano Lat': f'{lat:.4f}',
+        'Volcano Long': f'{lng:.4f}',
+        'Grid- Ll grid point (ll)': f'{lat - half:.4f}, {lng - half:.4f}',
+        'Grid- Ur grid point (ll)': f'{lat + half:.4f}, {lng + half:.4f}',
+        'Access to map': f'https://example.org/maps/{volcano}/{map_type}',
+    })
+    return rows
+
+
+def generate_tree(root, volcanoes=DEFAULT_VOLCANOES, map_types=DEFAULT_MAP_TYPES, png_kb=DEFAULT_PNG_KB,
+                  kml_kb=DEFAULT_KML_KB, sidecars=False, seed=0, tile_kb=DEFAULT_TILE_KB, rasters=False):
+    """
+    Fabricates a volcanoes directory laid out like the published one, reproducibly for a given seed.
+
+    Every volcano gets its JSON summary, a metadata workbook, a tile pyramid and its archive per map type,
+    an event tree workbook, preview and event tree PNGs and a preview KML.
+
+    Args:
+        root (str): Directory to create, e.g. /tmp/bench/volcanoes.
+        volcanoes (int): Number of volcanoes.
+        map_types (int): Number of map types per volcano.
+        png_kb (int): Approximate size of each PNG, in KiB.
+        kml_kb (int): Approximate size of each KML, in KiB.
+        sidecars (bool): Also compile the JSON sidecars of the workbooks.
+        seed (int): Seed of the generated content.
+        tile_kb (int): Approximate size of each tile of the pyramids, in KiB.
+        rasters (bool): Also write a GeoTIFF per map type, for the point values. Needs GDAL.
+
+    Returns:
+        dict: Parameters of the tree, recorded with the benchmark results.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    types = [f'map{index:03d}' for index in range(map_types)]
+    for index in range(volcanoes):
+        volcano = f'volcano{index:04d}'
+        name = f'Volcano {index}'
+        lat, lng = rng.uniform(-60, 70), rng.uniform(-180, 180)
+        path = os.path.join(root, volcano)
+        os.makedirs(os.path.join(path, METADATA_DIR), exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.join(path, EVENT_TREE_METADATA)), exist_ok=True)
+        for relative_path in VOLCANO_FILES.values():
+            os.makedirs(os.path.dirname(os.path.join(path, relative_path)), exist_ok=True)
+
+        with open(os.path.join(root, f'{volcano}.json'), 'w', encoding='utf-8') as file:
+            json.dump({'name': name, 'nwsname': volcano, 'file': volcano, 'json_file': f'{volcano}.json',
+                       'desc': _words(rng, 40), 'lat': round(lat, 4), 'lng': round(lng, 4)}, file)
+        for map_type in types:
+            write_workbook(os.path.join(path, METADATA_DIR, f'{map_type}.xlsx'),
+                           map_metadata(rng, volcano, name, map_type, lat, lng))
+            write_pyramid(os.path.join(path, PYRAMID_DIR, map_type), tile_kb, rng)
+            if rasters:
+                os.makedirs(os.path.join(path, RASTER_DIR), exist_ok=True)
+                write_raster(os.path.join(path, RASTER_DIR, f'{map_type}.tif'), rng)
+        write_workbook(os.path.join(path, EVENT_TREE_METADATA),
+                       {row: _words(rng, rng.randint(2, 8)) for row in METADATA_ROWS})
+        write_png(os.path.join(path, VOLCANO_FILES['preview-img']), png_kb, rng)
+        write_png(os.path.join(path, VOLCANO_FILES['event-tree-img']), png_kb, rng)
+        write_kml(os.path.join(path, VOLCANO_FILES['kml']), kml_kb, lat, lng, rng)
+        log.debug(f"Generated {volcano}")
+
+    if sidecars:
+        compile_sidecars(root)
+    log.info(f"Generated {volcanoes} volcanoes with {map_types} maps each in {root}")
+    return {'volcanoes': volcanoes, 'map_types': map_types, 'png_kb': png_kb, 'kml_kb': kml_kb,
+            'sidecars': sidecars, 'seed': seed, 'tile_kb': tile_kb, 'rasters': rasters}
@@ -0,0 +1,125 @@
+import json
+import math
+
+# Metrics compared against a baseline, and whether a higher value is better
+COMPARED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput_rps': True,
+    'peak_rss_kb': False,
+}
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def percentile(values, fraction):
+    """
+    Args:
+        values (list): Sorted values.
+        fraction (float): Percentile between 0 and 1, e.g. 0.95.
+
+    Returns:
+        float: The percentile, linearly interpolated between the closest ranks, or None without values.
+    """
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(latencies, elapsed, errors, peak_rss_kb):
+    """
+    Summarizes the measures of one scenario.
+
+    Args:
+        latencies (list): Latency of each request, in seconds.
+        elapsed (float): Wall time of the run, in seconds.
+        errors (int): Number of failed requests, included in latencies.
+        peak_rss_kb (int): Peak resident memory of the server, in KiB, or None if unknown.
+
+    Returns:
+        dict: Request count, errors, latency percentiles in milliseconds, throughput and peak RSS.
+    """
+    latencies = sorted(latencies)
+
+    def milliseconds(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': milliseconds(percentile(latencies, 0.5)),
+        'p95_ms': milliseconds(percentile(latencies, 0.95)),
+        'p99_ms': milliseconds(percentile(latencies, 0.99)),
+        'mean_ms': milliseconds(sum(latencies) / len(latencies) if latencies else None),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        'peak_rss_kb': peak_rss_kb,
+    }
+
+
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compares the results of a report with those of a baseline report.
+
+    Args:
+        report (dict): Report of the current run.
+        baseline (dict): Report of the reference run.
+        threshold (float): Relative change beyond which a worse metric is a regression, e.g. 0.1 for 10%.
+
+    Returns:
+        list: One dict per driver, scenario and metric found in both reports, with the baseline and current
+        values, their relative 'change' and whether it is a 'regression'.
+    """
+    comparisons = []
+    for driver, scenarios in report['results'].items():
+        for scenario, result in scenarios.items():
+            reference = baseline.get('results', {}).get(driver, {}).get(scenario)
+            if reference is None:
+                continue
+            for metric, higher_is_better in COMPARED_METRICS.items():
+                current, previous = result.get(metric), reference.get(metric)
+                if not current or not previous:
+                    continue
+                change = (current - previous) / previous
+                worse = -change if higher_is_better else change
+                comparisons.append({'driver': driver, 'scenario': scenario, 'metric': metric,
+                                    'baseline': previous, 'current': current, 'change': round(change, 4),
+                                    'regression': worse > threshold})
+    return comparisons
+
+
+def format_comparisons(comparisons):
+    """
+    Returns:
+        str: The comparisons as a text table, regressions marked with '!'.
+    """
+    lines = [f"{'driver':<8} {'scenario':<28} {'metric':<15} {'baseline':>12} {'current':>12} {'change':>8}"]
+    for item in comparisons:
+        lines.append(f"{item['driver']:<8} {item['scenario']:<28} {item['metric']:<15} {item['baseline']:>12} "
+                     f"{item['current']:>12} {item['change']:>+8.1%}{' !' if item['regression'] else ''}")
+    return '\n'.join(lines)
+
+
+def load_report(path):
+    """
+    Args:
+        path (str): Path to a report written by write_report.
+
+    Returns:
+        dict: The report.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_report(path, report):
+    """
+    Args:
+        path (str): Destination path.
+        report (dict): Report to write, as indented JSON.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write('\n')
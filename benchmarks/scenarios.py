@@ -0,0 +1,123 @@
+import os
+import json
+import zlib
+import random
+
+from api.shared.catalog import VOLCANO_FILES
+from benchmarks.generator import pyramid_tiles, PACKED_SUFFIX, RASTER_SIZE, RASTER_PIXEL, RASTER_ORIGIN
+
+TILES = pyramid_tiles()
+
+
+def tile_of(volcano, map_type):
+    """
+    Returns:
+        tuple: Zoom, column and row (XYZ) of the generated tile requested for a map, the same at each request.
+    """
+    return TILES[zlib.crc32(f'{volcano}/{map_type}'.encode('utf-8')) % len(TILES)]
+
+
+def pyramid_tile_path(volcano, map_type):
+    # Tile of a packed pyramid as its KML links to it, in the TMS rows gdal2tiles writes
+    z, x, y = tile_of(volcano, map_type)
+    return f'/api/geo3bcn/pyramids/{volcano}/{map_type}{PACKED_SUFFIX}/{z}/{x}/{2 ** z - 1 - y}.png'
+
+
+def raster_points(count, seed=0):
+    """
+    Returns:
+        list: [longitude, latitude] points spread over the generated rasters.
+    """
+    rng = random.Random(seed)
+    extent = RASTER_SIZE * RASTER_PIXEL
+    return [[round(RASTER_ORIGIN[0] + rng.random() * extent, 6), round(RASTER_ORIGIN[1] - rng.random() * extent, 6)]
+            for _ in range(count)]
+
+
+POINTS_QUERY = '&'.join(f'lon={lon}&lat={lat}' for lon, lat in raster_points(10))
+POINTS_BODY = raster_points(1000)
+
+
+class Scenario:
+    """
+    A request repeated by the benchmark, varying the volcano and map type between iterations so that
+    per-item caches are exercised as in production.
+    """
+
+    def __init__(self, name, method, path, body=None):
+        """
+        Args:
+            name (str): Name of the scenario in the report.
+            method (str): HTTP method.
+            path (str or callable): URL path, or a function of (volcano, map_type) returning it.
+            body (dict or callable, optional): JSON body, or a function of (volcano, map_type) returning it.
+        """
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+
+    def request(self, volcano, map_type):
+        """
+        Returns:
+            tuple: Method, path and encoded JSON body (None without body) of one request.
+        """
+        path = self.path(volcano, map_type) if callable(self.path) else self.path
+        body = self.body(volcano, map_type) if callable(self.body) else self.body
+        return self.method, path, None if body is None else json.dumps(body).encode('utf-8')
+
+
+SCENARIOS = [
+    Scenario('epos-type-summary', 'GET', '/api/epos/type-summary'),
+    Scenario('epos-map-summary', 'GET', lambda volcano, map_type: f'/api/epos/map-summary/{map_type}'),
+    Scenario('epos-map-metadata', 'GET', lambda volcano, map_type: f'/api/epos/map-metadata/{map_type}/{volcano}'),
+    Scenario('epos-map-metadata-post', 'POST', '/api/epos/map-metadata',
+             lambda volcano, map_type: {'volcano': volcano, 'type': map_type}),
+    Scenario('epos-map-metadata-bulk', 'POST', '/api/epos/map-metadata/bulk',
+             lambda volcano, map_type: {'items': [{'volcano': '*', 'type': map_type}]}),
+    Scenario('epos-search', 'GET', '/api/epos/search?q=lava&category=Hazard'),
+    Scenario('epos-getfile', 'GET',
+             lambda volcano, map_type: f"/api/epos/getfile/{volcano}/{VOLCANO_FILES['kml'].replace(os.sep, '/')}"),
+    Scenario('epos-point-values', 'GET',
+             lambda volcano, map_type: f'/api/epos/point-values/{map_type}/{volcano}?{POINTS_QUERY}'),
+    Scenario('epos-point-values-post', 'POST', '/api/epos/point-values',
+             lambda volcano, map_type: {'volcano': volcano, 'type': map_type, 'points': POINTS_BODY}),
+    Scenario('geo3bcn-volcano-summary', 'GET', '/api/geo3bcn/volcano-summary'),
+    Scenario('geo3bcn-map-summary', 'POST', '/api/geo3bcn/map-summary',
+             lambda volcano, map_type: {'file_name': f'{volcano}.json'}),
+    Scenario('geo3bcn-map-metadata', 'GET',
+             lambda volcano, map_type: f'/api/geo3bcn/map-metadata/{volcano}/{map_type}'),
+    Scenario('geo3bcn-preview-img', 'GET', lambda volcano, map_type: f'/api/geo3bcn/preview-img/{volcano}'),
+    Scenario('geo3bcn-event-tree-img', 'GET', lambda volcano, map_type: f'/api/geo3bcn/event-tree-img/{volcano}'),
+    Scenario('geo3bcn-kml', 'GET', lambda volcano, map_type: f'/api/geo3bcn/kml/{volcano}'),
+    Scenario('geo3bcn-tile', 'GET', lambda volcano, map_type:
+             '/api/geo3bcn/tiles/{}/{}/{}/{}/{}.png'.format(volcano, map_type, *tile_of(volcano, map_type))),
+    Scenario('geo3bcn-tile-packed', 'GET', lambda volcano, map_type:
+             '/api/geo3bcn/tiles/{}/{}/{}/{}/{}.png'.format(volcano, map_type + PACKED_SUFFIX,
+                                                            *tile_of(volcano, map_type))),
+    Scenario('geo3bcn-pyramid-kml', 'GET',
+             lambda volcano, map_type: f'/api/geo3bcn/pyramids/{volcano}/{map_type}{PACKED_SUFFIX}/doc.kml'),
+    Scenario('geo3bcn-pyramid-tile', 'GET', lambda volcano, map_type: pyramid_tile_path(volcano, map_type)),
+    Scenario('geo3bcn-spatial-bbox', 'GET', '/api/geo3bcn/spatial/bbox?min_lat=30&min_lng=-20&max_lat=50&max_lng=20'),
+    Scenario('geo3bcn-spatial-nearest', 'GET', '/api/geo3bcn/spatial/nearest?lat=28.27&lng=-16.64&k=5'),
+    Scenario('geo3bcn-spatial-maps-at', 'GET', '/api/geo3bcn/spatial/maps-at?lat=37.75&lng=14.99'),
+]
+
+
+def select_scenarios(names=None):
+    """
+    Args:
+        names (list, optional): Names of the scenarios to run, every scenario by default.
+
+    Returns:
+        list: The selected scenarios, in the order of SCENARIOS.
+
+    Raises:
+        ValueError: If a name does not match any scenario.
+    """
+    if not names:
+        return list(SCENARIOS)
+    unknown = set(names) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return [scenario for scenario in SCENARIOS if scenario.name in names]
@@ -0,0 +1,38 @@
+import os
+import argparse
+import configparser
+
+from api.shared.logs import create_log
+from api.shared.sidecars import compile_sidecars
+
+
+def main():
+    """
+    Compiles the metadata workbooks of the volcanoes directory to JSON sidecars, and the statistics of its
+    GeoTIFFs.
+    """
+    parser = argparse.ArgumentParser(description='Compile metadata workbooks and raster statistics to JSON sidecars.')
+    parser.add_argument('--force', action='store_true', help='Recompile sidecars that are up to date.')
+    parser.add_argument('--no-statistics', dest='statistics', action='store_false',
+                        help='Skip the raster statistics, which read every GeoTIFF.')
+    args = parser.parse_args()
+
+    current_path = os.path.dirname(os.path.abspath(__file__))
+    config = configparser.ConfigParser()
+    config.read(os.path.join(current_path, 'config.ini'))
+    log = create_log()
+
+    volcanoes_path = os.path.join(current_path, config.get('paths', 'volcano'))
+    summary = compile_sidecars(volcanoes_path, force=args.force)
+    log.info(f"Metadata sidecars in {volcanoes_path}: {summary['compiled']} compiled, "
+             f"{summary['skipped']} up to date, {summary['failed']} failed")
+    if args.statistics:
+        from api.shared.tools import write_statistics  # Needs GDAL, only when the statistics are computed
+
+        summary = write_statistics(volcanoes_path, force=args.force)
+        log.info(f"Raster statistics in {volcanoes_path}: {summary['written']} written, "
+                 f"{summary['skipped']} up to date, {summary['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
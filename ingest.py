@@ -0,0 +1,40 @@
+import os
+import json
+import time
+import argparse
+import configparser
+
+from api.shared.logs import create_log
+from api.shared.ingest import create_worker
+
+
+def main():
+    """
+    Publishes the bundles uploaded to the incoming directory, once or continuously.
+    """
+    parser = argparse.ArgumentParser(description='Publish the volcano bundles of the incoming directory.')
+    parser.add_argument('--watch', action='store_true', help='Keep scanning the incoming directory.')
+    parser.add_argument('--settle-seconds', type=float,
+                        help='Seconds a bundle must stay unchanged before it is ingested.')
+    args = parser.parse_args()
+
+    current_path = os.path.dirname(os.path.abspath(__file__))
+    config = configparser.ConfigParser()
+    config.read(os.path.join(current_path, 'config.ini'))
+    log = create_log()
+
+    # Running servers are not signalled from this process, their [watcher] invalidates their caches
+    worker = create_worker(current_path, config)
+    if args.settle_seconds is not None:
+        worker.settle_seconds = args.settle_seconds
+    while True:
+        result = worker.run_once()
+        if result['published'] or result['rejected']:
+            log.info(f"Ingestion: {json.dumps(result)}")
+        if not args.watch:
+            break
+        time.sleep(worker.interval)
+
+
+if __name__ == "__main__":
+    main()
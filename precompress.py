@@ -0,0 +1,29 @@
+import os
+import argparse
+import configparser
+
+from api.shared.logs import create_log
+from api.shared.compression import precompress_files, available_encodings
+
+
+def main():
+    """
+    Writes the gzip and brotli siblings of the KML files served from the volcanoes directory.
+    """
+    parser = argparse.ArgumentParser(description='Precompress the KML files of the volcanoes directory.')
+    parser.add_argument('--force', action='store_true', help='Rewrite siblings that are up to date.')
+    args = parser.parse_args()
+
+    current_path = os.path.dirname(os.path.abspath(__file__))
+    config = configparser.ConfigParser()
+    config.read(os.path.join(current_path, 'config.ini'))
+    log = create_log()
+
+    volcanoes_path = os.path.join(current_path, config.get('paths', 'volcano'))
+    summary = precompress_files(volcanoes_path, force=args.force)
+    log.info(f"Precompressed files ({', '.join(available_encodings())}) in {volcanoes_path}: "
+             f"{summary['compressed']} compressed, {summary['skipped']} up to date, {summary['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
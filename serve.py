@@ -0,0 +1,77 @@
+import os
+import argparse
+import configparser
+
+from gunicorn.app.base import BaseApplication
+
+from __init__ import create_app, start_background
+from api.shared.logs import create_log
+
+
+class Server(BaseApplication):
+    """
+    Gunicorn pre-fork server running the application built by create_app.
+
+    The application is built without its background threads, which do not survive a fork. Each worker
+    rescans the volcanoes directory once it is forked, so that workers started by a reload (HUP) serve the
+    current files, and then starts its own ingestion and watcher threads.
+    """
+
+    def __init__(self, config_file_path, log):
+        self.config_file_path = config_file_path
+        self.log = log
+        self.config = configparser.ConfigParser()
+        self.config.read(config_file_path)
+        self.application = None
+        super().__init__()
+
+    def load_config(self):
+        webserver, server = self.config['webserver'], self.config['server']
+        self.cfg.set('bind', f"{webserver.get('host', '127.0.0.1')}:{webserver.get('port', '5000')}")
+        self.cfg.set('workers', server.getint('workers', 4))
+        self.cfg.set('threads', server.getint('threads', 1))
+        self.cfg.set('keepalive', server.getint('keepalive', 5))
+        self.cfg.set('timeout', server.getint('timeout', 60))
+        self.cfg.set('graceful_timeout', server.getint('graceful_timeout', 30))
+        self.cfg.set('max_requests', server.getint('max_requests', 0))
+        self.cfg.set('preload_app', server.getboolean('preload', True))
+        self.cfg.set('post_worker_init', self.post_worker_init)
+
+        # TLS is terminated by the server when the certificates are configured
+        cert, key = self.config.get('paths', 'crt', fallback=''), self.config.get('paths', 'key', fallback='')
+        if os.path.isfile(cert) and os.path.isfile(key):
+            self.cfg.set('certfile', cert)
+            self.cfg.set('keyfile', key)
+
+    def load(self):
+        if self.application is None:
+            self.application = create_app(self.log, self.config_file_path, background=False)
+        return self.application
+
+    def post_worker_init(self, worker):
+        """
+        Refreshes the catalog and every cache derived from it, then starts the background threads of a freshly
+        forked worker. With preload, workers forked after a reload inherit the state of the master at startup.
+        """
+        app = self.load()
+        app.extensions['invalidator'].rebuild()
+        start_background(app)
+        self.log.info(f"Worker {worker.pid} ready")
+
+
+def main():
+    """
+    Starts the application under the production server.
+    """
+    parser = argparse.ArgumentParser(description='Serve the application with gunicorn.')
+    parser.add_argument('--config', default=os.path.join(os.path.dirname(__file__), 'config.ini'),
+                        help='Configuration file, config.ini next to this script by default.')
+    args = parser.parse_args()
+
+    config_file_path = os.path.normpath(args.config)
+    log = create_log()
+    Server(config_file_path, log).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from api.shared.catalog import Catalog
+from api.shared.metadata_cache import metadata_cache
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+
+
+@pytest.fixture
+def volcanoes(tmp_path):
+    """
+    A volcanoes directory with two volcanoes, whose map metadata is published as precompiled sidecars.
+
+    Returns:
+        str: Path to the directory.
+    """
+    root = tmp_path / 'volcanoes'
+    write_json(str(root / 'etna.json'), {'name': 'Etna', 'lat': 37.75, 'lng': 14.99})
+    write_json(str(root / 'teide.json'), {'name': 'Teide', 'lat': 28.27, 'lng': -16.64})
+    write_json(str(root / 'etna' / 'metadata' / 'lava.json'), {
+        'Name': 'Lava flow invasion', 'Category': 'Hazard', 'Tag-keywords': 'lava; flow',
+        'Authors': 'Ana, Joan', 'Grid- Ll grid point (ll)': '37.5, 14.7', 'Grid- Ur grid point (ll)': '38.0, 15.3'})
+    write_json(str(root / 'etna' / 'metadata' / 'ash.json'), {
+        'Name': 'Ash fall', 'Category': 'Hazard', 'Tag-keywords': 'tephra', 'Authors': 'Joan',
+        'Grid- Ll grid point (ll)': '36.0, 13.0', 'Grid- Ur grid point (ll)': '39.0, 17.0'})
+    write_json(str(root / 'teide' / 'metadata' / 'lava.json'), {
+        'Name': 'Lava flow', 'Category': 'Susceptibility', 'Tag-keywords': 'lava', 'Authors': 'Ana',
+        'Grid- Ll grid point (ll)': '28.0, -17.0', 'Grid- Ur grid point (ll)': '28.5, -16.3'})
+    write_json(str(root / 'teide' / 'event_tree' / 'metadata.json'), {'Name': 'Event tree'})
+    os.makedirs(root / 'etna' / 'imgs')
+    (root / 'etna' / 'imgs' / 'preview.png').write_bytes(b'\x89PNG\r\n\x1a\n')
+    metadata_cache.clear()
+    yield str(root)
+    metadata_cache.clear()
+
+
+@pytest.fixture
+def catalog(volcanoes):
+    """
+    The Catalog of the volcanoes fixture.
+
+    Returns:
+        Catalog: The rebuilt catalog.
+    """
+    return Catalog(volcanoes).rebuild()
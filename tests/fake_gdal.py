@@ -0,0 +1,112 @@
+"""
+NumPy-backed stand-ins for the GDAL bands and datasets read by the raster code, so that it can be tested
+without GDAL. Only the methods the code under test calls are implemented.
+"""
+import numpy as np
+
+
+class FakeBand:
+    """
+    Band of a FakeDataset. Reads are recorded in the 'reads' list of the dataset.
+    """
+
+    def __init__(self, dataset, number):
+        self.dataset = dataset
+        self.number = number
+
+    @property
+    def XSize(self):
+        return self.dataset.RasterXSize
+
+    @property
+    def YSize(self):
+        return self.dataset.RasterYSize
+
+    def GetBand(self):
+        return self.number
+
+    def GetNoDataValue(self):
+        return self.dataset.nodata
+
+    def GetColorTable(self):
+        return self.dataset.color_table
+
+    def GetBlockSize(self):
+        return list(self.dataset.block)
+
+    def GetOverviewCount(self):
+        return self.dataset.overviews
+
+    def ComputeRasterMinMax(self, approximate=False):
+        values = self.dataset.array[self.number - 1]
+        if self.dataset.nodata is not None:
+            values = values[values != self.dataset.nodata]
+        if np.issubdtype(values.dtype, np.floating):
+            values = values[~np.isnan(values)]
+        if not values.size:
+            raise RuntimeError('Failed to compute min/max, no valid pixels found in sampling.')
+        return float(values.min()), float(values.max())
+
+    def ReadAsArray(self, x, y, width, height):
+        if x < 0 or y < 0 or x + width > self.XSize or y + height > self.YSize:
+            raise RuntimeError(f'Access window out of range: {x}, {y}, {width}, {height}')
+        self.dataset.reads.append((x, y, width, height))
+        return self.dataset.array[self.number - 1, y:y + height, x:x + width].copy()
+
+
+class FakeDataset:
+    """
+    Raster of (bands, rows, columns) values.
+    """
+
+    def __init__(self, array, geotransform=(0.0, 1.0, 0.0, 0.0, 0.0, -1.0), nodata=None, block=(256, 256),
+                 color_table=None, overviews=0):
+        array = np.asarray(array)
+        self.array = array[np.newaxis] if array.ndim == 2 else array
+        self.geotransform = tuple(geotransform)
+        self.nodata = nodata
+        self.block = tuple(block)
+        self.color_table = color_table
+        self.overviews = overviews
+        self.reads = []
+
+    @property
+    def RasterXSize(self):
+        return self.array.shape[2]
+
+    @property
+    def RasterYSize(self):
+        return self.array.shape[1]
+
+    @property
+    def RasterCount(self):
+        return self.array.shape[0]
+
+    def GetRasterBand(self, number):
+        return FakeBand(self, number)
+
+    def GetGeoTransform(self):
+        return self.geotransform
+
+    def GetSpatialRef(self):
+        return None
+
+
+def inverse_geotransform(geotransform):
+    """
+    Returns:
+        tuple: The inverse of an affine geotransform, as gdal.InvGeoTransform computes it.
+    """
+    x0, a, b, y0, c, d = geotransform
+    det = a * d - b * c
+    return (b * y0 - d * x0) / det, d / det, -b / det, (c * x0 - a * y0) / det, -c / det, a / det
+
+
+def raster_handle(dataset):
+    """
+    Returns:
+        dict: A handle of a WGS84 dataset, as checked out from a RasterPool.
+    """
+    return {'signature': None, 'dataset': dataset, 'transform': None,
+            'inverse': inverse_geotransform(dataset.GetGeoTransform()), 'width': dataset.RasterXSize,
+            'height': dataset.RasterYSize, 'bands': dataset.RasterCount}
@@ -0,0 +1,44 @@
+import os
+
+from api.shared.catalog import Catalog
+
+
+def test_catalog_indexes_volcanoes_maps_and_files(volcanoes):
+    catalog = Catalog(volcanoes).rebuild()
+
+    assert catalog.volcano_names() == ['etna', 'teide']
+    assert catalog.type_names() == ['ash', 'lava']
+    assert catalog.volcanoes_for_type('lava') == ['etna', 'teide']
+    assert catalog.maps_for_volcano('etna') == ['ash', 'lava']
+    assert [os.path.basename(path) for path in catalog.volcano_files()] == ['etna.json', 'teide.json']
+    assert catalog.metadata_path('etna', 'lava') == os.path.join(volcanoes, 'etna', 'metadata', 'lava.xlsx')
+    assert catalog.file_path('etna', 'preview-img') == os.path.join(volcanoes, 'etna', 'imgs', 'preview.png')
+    assert catalog.file_path('teide', 'preview-img') is None
+
+def test_catalog_refreshes_one_volcano(volcanoes):
+    catalog = Catalog(volcanoes).rebuild()
+    version = catalog.version
+    os.remove(os.path.join(volcanoes, 'etna', 'metadata', 'ash.json'))
+
+    catalog.refresh_volcano('etna')
+
+    assert catalog.maps_for_volcano('etna') == ['lava']
+    assert catalog.type_names() == ['lava']
+    assert catalog.version == version + 1
+
+
+def test_catalog_raster_paths_stay_inside_the_volcanoes_directory(volcanoes):
+    catalog = Catalog(volcanoes).rebuild()
+    os.makedirs(os.path.join(volcanoes, 'etna', 'tifs'))
+    open(os.path.join(volcanoes, 'etna', 'tifs', 'lava.tiff'), 'wb').close()
+
+    assert catalog.raster_path('etna', 'lava') == os.path.join(volcanoes, 'etna', 'tifs', 'lava.tiff')
+    assert catalog.raster_path('etna', 'ash') is None
+    assert catalog.raster_path('..', 'lava') is None
+
+
+def test_catalog_statistics_paths(volcanoes):
+    catalog = Catalog(volcanoes).rebuild()
+
+    assert catalog.statistics_path('etna', 'lava') == os.path.join(volcanoes, 'etna', 'tifs', 'lava.stats.json')
+    assert catalog.statistics_path('..', 'lava') is None
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+from flask import Flask
+
+from api.shared.http_cache import metadata_validators, is_not_modified
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_metadata_validators_of_missing_files(tmp_path):
+    assert metadata_validators([str(tmp_path / 'missing.xlsx'), None]) == (None, None)
+
+
+def test_metadata_validators_change_with_any_file(tmp_path):
+    first, second = tmp_path / 'event_tree.json', tmp_path / 'lava.json'
+    first.write_text('{}')
+    paths = [str(first), str(second)]
+    etag, _ = metadata_validators(paths)
+
+    second.write_text('{}')
+    changed, last_modified = metadata_validators(paths)
+
+    assert changed != etag
+    assert last_modified.timestamp() == os.stat(second).st_mtime_ns // 10 ** 9
+
+
+def test_is_not_modified_on_matching_etags(app):
+    with app.test_request_context('/', headers={'If-None-Match': '"abc-gzip"'}):
+        assert is_not_modified('abc', None)
+        assert not is_not_modified('abd', None)
+        assert not is_not_modified(None, None)
+    with app.test_request_context('/', method='POST', headers={'If-None-Match': '"abc"'}):
+        assert not is_not_modified('abc', None)
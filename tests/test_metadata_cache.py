@@ -0,0 +1,49 @@
+import os
+
+from api.shared.metadata_cache import MetadataCache
+
+
+def test_metadata_cache_reparses_changed_files_only(tmp_path):
+    path = tmp_path / 'map.json'
+    path.write_text('1')
+    loads = []
+    cache = MetadataCache(loader=lambda name: loads.append(name) or {'value': open(name).read()},
+                          signature=lambda name: (os.stat(name).st_mtime_ns, os.stat(name).st_size))
+
+    assert cache.get(str(path)) == {'value': '1'}
+    assert cache.get(str(path)) == {'value': '1'}
+    path.write_text('22')
+    assert cache.get(str(path)) == {'value': '22'}
+    assert len(loads) == 2
+    assert cache.stats() == {'entries': 1, 'max_entries': 512, 'hits': 1, 'misses': 2, 'evictions': 0}
+
+
+def test_metadata_cache_returns_copies():
+    cache = MetadataCache(loader=lambda name: {'name': name}, signature=lambda name: 1)
+
+    cache.get('a')['name'] = 'changed'
+
+    assert cache.get('a') == {'name': 'a'}
+
+
+def test_metadata_cache_evicts_least_recently_used():
+    cache = MetadataCache(max_entries=2, loader=lambda name: {}, signature=lambda name: 1)
+    for name in ('a', 'b', 'a', 'c'):
+        cache.get(name)
+
+    cache.get('a')
+    cache.get('b')
+
+    assert cache.stats()['evictions'] == 2
+    assert cache.stats()['hits'] == 2  # 'a' twice, 'b' was evicted by 'c'
+
+
+def test_metadata_cache_invalidates_by_prefix():
+    cache = MetadataCache(loader=lambda name: {}, signature=lambda name: 1)
+    for name in ('/v/etna/a', '/v/etna/b', '/v/teide/a'):
+        cache.get(name)
+
+    cache.invalidate_prefix('/v/etna/')
+    cache.invalidate('/v/teide/a')
+
+    assert cache.stats()['entries'] == 0
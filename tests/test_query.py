@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+
+from api.shared.query import encode_cursor, decode_cursor, paginate
+
+NAMES = ['ash', 'gas', 'lahar', 'lava', 'tephra']
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.mark.parametrize('key', ['lava', 'Montaña Blanca', '/volcanoes/etna.json', ''])
+def test_cursors_round_trip(key):
+    cursor = encode_cursor(key)
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == key
+
+
+@pytest.mark.parametrize('cursor', ['!!', 'a', '////'])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_paginate_links_to_the_next_page(app):
+    with app.test_request_context('/maps?limit=2&fields=name'):
+        page, headers = paginate(NAMES, limit=2)
+        assert page == ['ash', 'gas']
+        link = headers['Link']
+        assert link.startswith('</maps?') and link.endswith('>; rel="next"')
+        assert 'fields=name' in link and f'cursor={encode_cursor("gas")}' in link
+
+        page, headers = paginate(NAMES, after='gas', limit=2)
+        assert page == ['lahar', 'lava']
+        page, headers = paginate(NAMES, after='lava', limit=2)
+        assert page == ['tephra'] and headers == {}
+
+
+def test_paginate_does_not_shift_when_items_change(app):
+    with app.test_request_context('/maps'):
+        # 'gas' was removed and 'dome' added since the first page ended at 'gas'
+        page, _ = paginate(['ash', 'dome', 'lahar', 'lava'], after='gas', limit=2)
+
+    assert page == ['lahar', 'lava']
+
+
+def test_paginate_without_limit_returns_every_remaining_item(app):
+    with app.test_request_context('/maps'):
+        assert paginate(NAMES, after='gas') == (['lahar', 'lava', 'tephra'], {})
+
+
+def test_paginate_links_do_not_depend_on_the_host(app):
+    with app.test_request_context('/api/maps?limit=1', base_url='https://b.example/proxy'):
+        _, headers = paginate(NAMES, limit=1)
+
+    assert headers['Link'] == f'</proxy/api/maps?limit=1&cursor={encode_cursor("ash")}>; rel="next"'
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+import pytest
+
+from api.shared.raster import RasterPool, sample_points
+from .fake_gdal import FakeDataset, raster_handle
+
+
+@pytest.fixture
+def dataset():
+    # 1000 x 600 pixels of 0.01 degrees from (10, 46), each worth row * 1000 + column, blocks of 256 x 256
+    rows, columns = np.mgrid[0:600, 0:1000]
+    values = (rows * 1000 + columns).astype(np.float64)
+    values[0, 0] = -9999
+    return FakeDataset(values, (10.0, 0.01, 0.0, 46.0, 0.0, -0.01), nodata=-9999)
+
+
+def pixel_center(row, column):
+    return 10.0 + (column + 0.5) * 0.01, 46.0 - (row + 0.5) * 0.01
+
+
+def sample(dataset, pixels):
+    lons, lats = zip(*(pixel_center(row, column) for row, column in pixels))
+    return sample_points(raster_handle(dataset), lons, lats)
+
+
+def test_points_read_the_value_of_their_pixel(dataset):
+    values = sample(dataset, [(150, 234), (599, 999), (0, 1)])
+
+    assert values.tolist() == [150234, 599999, 1]
+
+
+def test_points_without_value_are_nan(dataset):
+    lons = [10.005, 9.99, 20.01, float('nan'), 200.0, 12.0]
+    lats = [45.995, 45.0, 45.0, 45.0, 45.0, 95.0]
+
+    values = sample_points(raster_handle(dataset), lons, lats)
+
+    # Nodata, west and east of the raster, not a number, invalid longitude and latitude
+    assert np.isnan(values).all()
+
+
+def test_close_points_are_read_in_one_window(dataset):
+    values = sample(dataset, [(10, 10), (12, 40), (30, 20)])
+
+    assert dataset.reads == [(10, 10, 31, 21)]
+    assert values.tolist() == [10010, 12040, 30020]
+
+
+def test_scattered_points_are_read_by_block(dataset):
+    pixels = [(5, 5), (6, 7), (300, 900), (599, 0)]
+
+    values = sample(dataset, pixels)
+
+    assert sorted(dataset.reads) == [(0, 0, 256, 256), (0, 512, 256, 88), (768, 256, 232, 256)]
+    assert values.tolist() == [row * 1000 + column for row, column in pixels]
+
+
+def test_points_outside_of_the_raster_read_nothing(dataset):
+    values = sample_points(raster_handle(dataset), [0.0], [0.0])
+
+    assert np.isnan(values).all() and dataset.reads == []
+
+
+def test_missing_band_is_rejected(dataset):
+    with pytest.raises(ValueError):
+        sample_points(raster_handle(dataset), [12.0], [45.0], band_number=2)
+
+
+def test_pool_reuses_handles_and_closes_the_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(RasterPool, '_open', staticmethod(lambda path, signature: {'signature': signature}))
+    pool = RasterPool(max_handles=2)
+    paths = []
+    for name in ('a', 'b', 'c'):
+        path = tmp_path / f'{name}.tiff'
+        path.write_bytes(b'tiff')
+        paths.append(str(path))
+
+    for path in paths + paths[2:]:
+        with pool.dataset(path):
+            pass
+
+    assert pool.stats() == {'idle': 2, 'rasters': 2, 'max_handles': 2, 'opened': 3, 'reused': 1}
+    os.utime(paths[2], ns=(1, 1))  # Replaced file
+    with pool.dataset(paths[2]) as handle:
+        assert pool.stats()['idle'] == 1
+    assert handle['signature'][1] == 1
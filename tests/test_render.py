@@ -0,0 +1,51 @@
+import sys
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from api.shared.render import Renderer
+from .fake_gdal import FakeDataset
+
+
+@pytest.fixture
+def renderer(monkeypatch):
+    # Renderer._open imports GDAL, which is replaced by a module opening NumPy stand-ins
+    opened = []
+
+    def open_ex(path, flags):
+        opened.append(path)
+        return FakeDataset(np.zeros((4, 4)), (-20037508.34, 39135.76, 0.0, 20037508.34, 0.0, -39135.76))
+
+    gdal = SimpleNamespace(OpenEx=open_ex, OF_RASTER=1, OF_READONLY=2)
+    monkeypatch.setitem(sys.modules, 'osgeo', SimpleNamespace(gdal=gdal))
+    renderer = Renderer(max_datasets=2)
+    renderer.opened_paths = opened
+    return renderer
+
+
+def test_renderer_keeps_the_most_recently_rendered_datasets_of_each_thread(renderer):
+    for path in ('a', 'b', 'a', 'c', 'a', 'b'):
+        renderer._open(path, 1)
+
+    # 'b' was closed by 'c', and 'c' by 'b'
+    assert renderer.opened_paths == ['a', 'b', 'c', 'b']
+    assert renderer.stats() == {'max_datasets': 2, 'opened': 4, 'closed': 2}
+
+
+def test_renderer_reopens_replaced_cogs(renderer):
+    renderer._open('a', 1)
+    renderer._open('a', 2)
+
+    assert renderer.opened_paths == ['a', 'a']
+    assert renderer.stats()['closed'] == 1
+
+
+def test_renderer_datasets_are_not_shared_between_threads(renderer):
+    renderer._open('a', 1)
+    thread = threading.Thread(target=renderer._open, args=('a', 1))
+    thread.start()
+    thread.join()
+
+    assert renderer.opened_paths == ['a', 'a']
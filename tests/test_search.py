@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from api.shared.search import SearchIndex
+
+
+def test_search_combines_facets_and_keywords(catalog):
+    index = SearchIndex(catalog).rebuild()
+
+    result = index.search({'category': ['hazard']}, query='Lava')
+
+    assert result['total'] == 1
+    assert result['results'] == [{'volcano': 'etna', 'type': 'lava', 'name': 'Lava flow invasion'}]
+
+
+def test_search_values_of_one_facet_are_alternatives(catalog):
+    index = SearchIndex(catalog).rebuild()
+
+    result = index.search({'category': ['Hazard', 'Susceptibility']})
+
+    assert [(item['volcano'], item['type']) for item in result['results']] == [
+        ('etna', 'ash'), ('etna', 'lava'), ('teide', 'lava')]
+
+
+def test_search_counts_facets_over_the_other_filters(catalog):
+    index = SearchIndex(catalog).rebuild()
+
+    facets = index.search({'category': ['Hazard']})['facets']
+
+    # The filtered facet still lists its alternatives, the other facets only count the matches
+    assert facets['category'] == [{'value': 'Hazard', 'count': 2}, {'value': 'Susceptibility', 'count': 1}]
+    assert facets['volcano'] == [{'value': 'etna', 'count': 2}]
+    assert facets['authors'] == [{'value': 'Joan', 'count': 2}, {'value': 'Ana', 'count': 1}]
+    assert index.search({'category': ['Hazard'], 'volcano': ['teide']})['facets']['category'] == [
+        {'value': 'Susceptibility', 'count': 1}]
+
+
+def test_search_pages_and_rejects_unknown_facets(catalog):
+    index = SearchIndex(catalog).rebuild()
+
+    result = index.search(offset=1, limit=1)
+
+    assert result['total'] == 3 and len(result['results']) == 1
+    assert index.search(query='unknown words')['total'] == 0
+    with pytest.raises(KeyError):
+        index.search({'colour': ['red']})
+
+
+def test_search_drops_removed_maps(catalog, volcanoes):
+    index = SearchIndex(catalog).rebuild()
+    os.remove(os.path.join(volcanoes, 'etna', 'metadata', 'ash.json'))
+    catalog.refresh_volcano('etna')
+
+    index.index_volcano('etna')
+
+    assert index.search(query='tephra')['total'] == 0
+    assert index.stats()['maps'] == 2
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+from flask import Flask
+from flask_restx import Model, fields, marshal
+
+from api.shared.serialization import COMPACT_JSON, compile_model, dumps, parse_fields, select_fields
+
+location = Model('Location', {'lat': fields.Float, 'lng': fields.Float})
+volcano = Model('Volcano', {
+    'name': fields.String,
+    'elevation': fields.Integer,
+    'active': fields.Boolean,
+    'label': fields.String(attribute='name'),
+    'location': fields.Nested(location, allow_null=True),
+    'maps': fields.List(fields.Nested(Model('Map', {'type': fields.String, 'title': fields.String}))),
+})
+DOCUMENTS = [
+    {'name': 'Etna', 'elevation': '3357', 'active': 1, 'location': {'lat': 37.75, 'lng': 14.99},
+     'maps': [{'type': 'lava', 'title': 'Lava flow'}], 'extra': 'dropped'},
+    {'name': 'Teide', 'elevation': None, 'location': None, 'maps': []},
+]
+
+
+def test_compile_model_matches_marshal():
+    project = compile_model(volcano)
+
+    assert project(DOCUMENTS) == marshal(DOCUMENTS, volcano)
+    assert project(DOCUMENTS[0]) == marshal(DOCUMENTS[0], volcano)
+
+
+@pytest.mark.parametrize('settings', [{}, COMPACT_JSON])
+def test_dumps_matches_the_restx_representation(settings):
+    app = Flask(__name__)
+    app.config['RESTX_JSON'] = settings
+    data = {'name': 'Ñuñoa', 'values': [1.5, 1e16, 2e-5, None, True], 'nested': {'a': []}}
+
+    with app.app_context():
+        assert dumps(data) == (json.dumps(data, **settings) + '\n').encode('utf-8')
+
+
+def test_parse_fields_nests_braces():
+    assert parse_fields('name, maps{type},location{lat}') == {
+        'name': True, 'maps': {'type': True}, 'location': {'lat': True}}
+
+
+def test_parse_fields_keeps_spaces_inside_names():
+    assert parse_fields('map_metadata{Hazard type- Model name,Name}') == {
+        'map_metadata': {'Hazard type- Model name': True, 'Name': True}}
+
+
+@pytest.mark.parametrize('text', [None, '', '  '])
+def test_parse_fields_without_projection(text):
+    assert parse_fields(text) is None
+
+
+@pytest.mark.parametrize('text', ['{name}', 'maps{type', 'maps{}', 'name}'])
+def test_parse_fields_rejects_unbalanced_braces(text):
+    with pytest.raises(ValueError):
+        parse_fields(text)
+
+
+def test_compile_model_projects_on_a_mask():
+    project = compile_model(volcano, parse_fields('name,maps{type}'))
+
+    assert project(DOCUMENTS) == [{'name': 'Etna', 'maps': [{'type': 'lava'}]}, {'name': 'Teide', 'maps': []}]
+
+
+@pytest.mark.parametrize('text', ['unknown', 'name{first}', 'maps{unknown}'])
+def test_compile_model_rejects_invalid_masks(text):
+    with pytest.raises(ValueError):
+        compile_model(volcano, parse_fields(text))
+
+
+def test_select_fields_leaves_missing_fields_out():
+    assert select_fields([{'Name': 'Lava', 'Category': 'Hazard'}], {'Name': True, 'Authors': True}) == [
+        {'Name': 'Lava'}]
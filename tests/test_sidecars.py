@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from api.shared.sidecars import compile_sidecar, compile_sidecars
+from api.shared.xlsx_parser import metadata_signature, parse_xlsx, sidecar_path
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def write_workbook(path, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet1'
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def set_mtime(path, seconds):
+    os.utime(path, ns=(seconds * 10 ** 9, seconds * 10 ** 9))
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / 'etna' / 'metadata' / 'lava.xlsx')
+    write_workbook(path, [('Name', ' Lava flow '), ('Category', 'Hazard'), (None, None)])
+    return path
+
+
+def test_compile_sidecar_writes_the_workbook_once(workbook):
+    assert compile_sidecar(workbook)
+    with open(sidecar_path(workbook), encoding='utf-8') as file:
+        assert json.load(file) == {'Name': 'Lava flow', 'Category': 'Hazard', '': ''}
+
+    assert not compile_sidecar(workbook)
+    assert compile_sidecar(workbook, force=True)
+
+
+def test_parse_xlsx_reads_the_sidecar_unless_the_workbook_is_newer(workbook):
+    compile_sidecar(workbook)
+    with open(sidecar_path(workbook), 'w', encoding='utf-8') as file:
+        json.dump({'Name': 'From sidecar'}, file)
+    set_mtime(workbook, 1000)
+    set_mtime(sidecar_path(workbook), 2000)
+
+    assert parse_xlsx(workbook) == {'Name': 'From sidecar'}
+
+    set_mtime(workbook, 3000)
+    assert parse_xlsx(workbook)['Name'] == 'Lava flow'
+
+
+def test_parse_xlsx_of_a_sidecar_published_alone(workbook):
+    compile_sidecar(workbook)
+    os.remove(workbook)
+
+    assert parse_xlsx(workbook)['Category'] == 'Hazard'
+    assert metadata_signature(workbook)[0] is None
+
+
+def test_metadata_signature_of_missing_files(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        metadata_signature(str(tmp_path / 'missing.xlsx'))
+
+
+def test_compile_sidecars_summarizes_every_workbook(workbook, tmp_path):
+    write_workbook(str(tmp_path / 'etna' / 'event_tree' / 'metadata.xlsx'), [('Name', 'Event tree')])
+    broken = tmp_path / 'teide' / 'metadata' / 'ash.xlsx'
+    os.makedirs(broken.parent)
+    broken.write_bytes(b'not a workbook')
+    compile_sidecar(workbook)
+
+    assert compile_sidecars(str(tmp_path)) == {'compiled': 1, 'skipped': 1, 'failed': 1}
@@ -0,0 +1,40 @@
+import pytest
+
+from api.shared.spatial import SpatialIndex, distance_km, map_extent, parse_point
+
+
+def test_spatial_bbox_finds_volcanoes_and_overlapping_maps(catalog):
+    index = SpatialIndex(catalog).rebuild()
+
+    result = index.bbox(37, 14, 38, 15)
+
+    assert [volcano['volcano'] for volcano in result['volcanoes']] == ['etna']
+    assert [(item['volcano'], item['type']) for item in result['maps']] == [('etna', 'ash'), ('etna', 'lava')]
+    assert index.bbox(0, 0, 1, 1) == {'volcanoes': [], 'maps': []}
+
+
+def test_spatial_bbox_crossing_the_antimeridian(catalog):
+    index = SpatialIndex(catalog).rebuild()
+
+    result = index.bbox(20, 170, 40, -10)
+
+    assert [volcano['volcano'] for volcano in result['volcanoes']] == ['teide']
+
+
+def test_spatial_nearest_and_maps_at(catalog):
+    index = SpatialIndex(catalog).rebuild()
+
+    nearest = index.nearest(37.0, 15.0, k=2)
+
+    assert [volcano['volcano'] for volcano in nearest] == ['etna', 'teide']
+    assert nearest[0]['distance_km'] == pytest.approx(distance_km(37.0, 15.0, 37.75, 14.99), abs=1e-3)
+    assert [(item['volcano'], item['type']) for item in index.maps_at(37.6, 14.8)] == [
+        ('etna', 'ash'), ('etna', 'lava')]
+    assert [item['type'] for item in index.maps_at(36.5, 16.5)] == ['ash']
+
+
+def test_map_extent_needs_both_valid_corners():
+    assert parse_point('37.5, 14.7') == (37.5, 14.7)
+    assert parse_point('95, 10') is None
+    assert map_extent({'Grid- Ll grid point (ll)': '38, 15', 'Grid- Ur grid point (ll)': '37, 14'}) == (37, 14, 38, 15)
+    assert map_extent({'Grid- Ll grid point (ll)': '38, 15'}) is None
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from api.shared.statistics import _Moments, _halve, _percentiles, _band_statistics, dataset_statistics
+from .fake_gdal import FakeDataset
+
+
+def test_moments_merged_by_chunks_match_numpy():
+    values = np.random.default_rng(1).normal(50, 10, 10000)
+    moments = _Moments()
+    for chunk in np.array_split(values, [7, 1000, 1001, 6000]):
+        moments.update(chunk)
+    moments.update(np.array([]))
+
+    result = moments.result()
+
+    assert result['count'] == values.size
+    assert result['mean'] == pytest.approx(values.mean())
+    assert result['std'] == pytest.approx(values.std())
+    assert (result['min'], result['max']) == (values.min(), values.max())
+
+
+def test_moments_without_values():
+    assert _Moments().result() == {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+
+
+def test_halve_averages_the_valid_pixels_of_each_square():
+    values = np.array([[1, 3, 5], [np.nan, 5, 7], [2, 2, np.nan]])
+
+    halved = _halve(values, categorical=False)
+
+    # Odd sizes are padded with missing pixels, a square without valid pixel stays missing
+    np.testing.assert_array_equal(halved, [[3, 6], [2, np.nan]])
+    np.testing.assert_array_equal(_halve(values, categorical=True), [[1, 5], [2, np.nan]])
+
+
+def test_percentiles_of_one_bin_per_value():
+    # Values 10 to 14, 20 pixels each
+    percentiles = _percentiles(9.5, 14.5, np.full(5, 20), exact=True)
+
+    assert percentiles == {'p1': 10.0, 'p5': 10.0, 'p25': 11.0, 'p50': 12.0, 'p75': 13.0, 'p95': 14.0, 'p99': 14.0}
+
+
+def test_percentiles_interpolated_within_bins():
+    percentiles = _percentiles(0.0, 100.0, np.full(100, 10), exact=False)
+
+    assert percentiles['p25'] == pytest.approx(25.0) and percentiles['p99'] == pytest.approx(99.0)
+
+
+def test_band_statistics_read_in_strips():
+    values = np.random.default_rng(2).integers(0, 5, (300, 200)).astype(np.int16)
+    values[:10, :10] = -1
+    dataset = FakeDataset(values, nodata=-1, block=(200, 6))
+
+    statistics = _band_statistics(dataset.GetRasterBand(1), levels=2, bins=256)
+
+    valid = values[values != -1]
+    assert statistics['count'] == valid.size and statistics['nodata_count'] == 100
+    assert statistics['mean'] == pytest.approx(valid.mean()) and statistics['std'] == pytest.approx(valid.std())
+    assert statistics['histogram'] == {'min': -0.5, 'max': 4.5, 'counts': np.bincount(valid).tolist()}
+    assert statistics['percentiles']['p50'] == float(np.percentile(valid, 50, method='inverted_cdf'))
+    assert [(level['width'], level['height']) for level in statistics['levels']] == [(200, 300), (100, 150), (50, 75)]
+    assert statistics['levels'][2]['mean'] == pytest.approx(valid.mean(), abs=0.1)
+    # Strips of whole blocks, and a multiple of the 4 x 4 squares of the last level
+    assert {height for _, _, _, height in dataset.reads[:-1]} == {8}
+    assert sum(height for _, _, _, height in dataset.reads) == 300
+
+
+def test_band_statistics_without_valid_pixels():
+    dataset = FakeDataset(np.full((20, 20), -1.0), nodata=-1.0)
+
+    statistics = _band_statistics(dataset.GetRasterBand(1), levels=0, bins=256)
+
+    assert statistics['count'] == 0 and statistics['nodata_count'] == 400
+    assert statistics['histogram'] is None and statistics['percentiles'] is None
+
+
+def test_dataset_statistics_of_every_band_and_level():
+    values = np.stack([np.arange(600.0).reshape(20, 30), np.ones((20, 30))])
+
+    statistics = dataset_statistics(FakeDataset(values, block=(30, 4)))
+
+    assert (statistics['width'], statistics['height']) == (30, 20)
+    assert [band['band'] for band in statistics['bands']] == [1, 2]
+    assert statistics['bands'][0]['mean'] == pytest.approx(299.5)
+    assert statistics['bands'][1]['histogram'] == {'min': 0.5, 'max': 1.5, 'counts': [600]}
+    # Smaller than a tile, without a spatial reference to place it on a zoom level
+    assert statistics['bands'][0]['levels'] == [dict(level=0, width=30, height=20, zoom=None,
+                                                     **{key: statistics['bands'][0][key]
+                                                        for key in ('count', 'min', 'max', 'mean', 'std')})]
@@ -0,0 +1,108 @@
+import os
+import json
+import struct
+
+import pytest
+
+from api.shared.tile_archive import write_archive, read_archive, extract_archive, TileArchive, HEADER, LEVEL, RECORD
+
+
+@pytest.fixture
+def pyramid(tmp_path):
+    """
+    A pyramid as gdal2tiles writes it, where two tiles are identical.
+    """
+    directory = tmp_path / 'lava'
+    tiles = {(5, 16, 20): b'tile-a', (5, 17, 20): b'tile-b', (6, 33, 41): b'tile-a', (6, 34, 40): b'tile-c'}
+    for (z, x, y), data in tiles.items():
+        os.makedirs(directory / str(z) / str(x), exist_ok=True)
+        (directory / str(z) / str(x) / f'{y}.png').write_bytes(data)
+    (directory / 'doc.kml').write_text('<kml/>')
+    (directory / '5' / '16' / '20.kml').write_text('<kml>20</kml>')
+    return str(directory), tiles
+
+
+def test_archive_serves_every_tile_and_file(pyramid, tmp_path):
+    directory, tiles = pyramid
+    path = str(tmp_path / 'lava.tiles')
+
+    written = write_archive(directory, path, {'zoom': [5, 6]})
+    archive = TileArchive(path)
+
+    assert written['tiles'] == 4 and written['unique'] == 3
+    assert archive.levels() == [5, 6]
+    for (z, x, y), data in tiles.items():
+        tile, digest = archive.get(z, x, y)
+        assert bytes(tile) == data and len(digest) == 16
+    assert archive.get(5, 16, 21) is None and archive.get(7, 0, 0) is None and archive.get(6, 99, 40) is None
+    assert archive.get(5, 16, 20)[1] == archive.get(6, 33, 41)[1]
+    assert archive.files() == ['5/16/20.kml', 'doc.kml']
+    assert archive.read_file('doc.kml') == b'<kml/>'
+    assert archive.manifest == {'zoom': [5, 6]}
+    with pytest.raises(KeyError):
+        archive.read_file('missing.kml')
+
+
+def test_archive_extracts_back_to_a_pyramid(pyramid, tmp_path):
+    directory, tiles = pyramid
+    path = str(tmp_path / 'lava.tiles')
+    write_archive(directory, path)
+    target = tmp_path / 'extracted'
+
+    extract_archive(read_archive(path), str(target), levels=[6], files=False)
+
+    assert sorted(os.listdir(target)) == ['6']
+    assert (target / '6' / '34' / '40.png').read_bytes() == tiles[(6, 34, 40)]
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:60],  # Truncated inside the level table
+    lambda data: data[:-5] + b'zzzzz',  # Metadata that is no longer JSON
+    lambda data: b'NOTTILES' + data[8:],
+    lambda data: b'',
+])
+def test_read_archive_rejects_damaged_files(pyramid, tmp_path, damage):
+    path = tmp_path / 'lava.tiles'
+    write_archive(pyramid[0], str(path))
+    path.write_bytes(damage(path.read_bytes()))
+
+    assert read_archive(str(path)) is None
+
+
+def test_read_archive_of_a_missing_file(tmp_path):
+    assert read_archive(str(tmp_path / 'missing.tiles')) is None
+
+
+def test_records_outside_of_the_archive_are_not_served(pyramid, tmp_path):
+    path = tmp_path / 'lava.tiles'
+    write_archive(pyramid[0], str(path))
+    data = bytearray(path.read_bytes())
+    _, _, _, table_offset, metadata_offset, metadata_length = HEADER.unpack_from(data, 0)
+    _, min_x, min_y, _, height, index_offset = LEVEL.unpack_from(data, table_offset)  # Zoom level 5
+    record = index_offset + RECORD.size * ((16 - min_x) * height + 20 - min_y)
+    offset, _, digest = RECORD.unpack_from(data, record)
+    RECORD.pack_into(data, record, offset, len(data), digest)
+    metadata = json.loads(bytes(data[metadata_offset:metadata_offset + metadata_length]))
+    metadata['files']['doc.kml'][0] = len(data)
+    encoded = json.dumps(metadata).encode()
+    data[metadata_offset:] = encoded
+    struct.pack_into('<Q', data, HEADER.size - 8, len(encoded))
+    path.write_bytes(bytes(data))
+
+    archive = TileArchive(str(path))
+
+    assert archive.get(5, 16, 20) is None and archive.get(5, 17, 20) is not None
+    assert archive.read_file('doc.kml') is None
+    assert [(x, y) for x, y, _ in archive.tiles(5)] == [(17, 20)]
+
+
+def test_read_archive_rejects_indexes_beyond_the_end_of_the_file(pyramid, tmp_path):
+    path = tmp_path / 'lava.tiles'
+    write_archive(pyramid[0], str(path))
+    data = bytearray(path.read_bytes())
+    table_offset = HEADER.unpack_from(data, 0)[3]
+    z, min_x, min_y, width, height, _ = LEVEL.unpack_from(data, table_offset)
+    LEVEL.pack_into(data, table_offset, z, min_x, min_y, width, height, len(data))
+    path.write_bytes(bytes(data))
+
+    assert read_archive(str(path)) is None
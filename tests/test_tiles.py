@@ -0,0 +1,64 @@
+import os
+import time
+
+from api.shared.tiles import DiskTileCache, DISK_BLOCK_SIZE
+
+
+
+def test_disk_cache_round_trips_tiles_and_empty_markers(tmp_path):
+    cache = DiskTileCache(str(tmp_path / 'cache'), trim_interval=3600)
+
+    cache.put('etna/lava/1-2/5/16/20.png', b'png')
+    cache.put('etna/lava/1-2/5/16/21.png', b'')
+
+    assert cache.get('etna/lava/1-2/5/16/20.png') == b'png'
+    assert cache.get('etna/lava/1-2/5/16/21.png') == b''
+    assert cache.get('etna/lava/1-2/5/16/22.png') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 1)
+
+
+def test_disk_cache_trims_the_least_recently_used_tiles(tmp_path):
+    root = tmp_path / 'cache'
+    cache = DiskTileCache(str(root), max_bytes=32 * DISK_BLOCK_SIZE, trim_interval=3600)
+    cache._trimming = True  # Trimmed explicitly below
+    for number in range(40):
+        cache.put(f'a/{number}.png', b'x' * 100)
+        os.utime(root / 'a' / f'{number}.png', ns=(number * 10 ** 9, number * 10 ** 9))
+    cache.get('a/0.png')  # Most recently used now
+
+    assert cache.trim()
+
+    names = set(os.listdir(root / 'a'))
+    # Down to 15/16 of the budget, oldest first
+    assert len(names) == 30 and cache.stats()['evictions'] == 10
+    assert '0.png' in names and '1.png' not in names and '10.png' not in names and '11.png' in names
+    assert cache.stats()['bytes'] == 30 * DISK_BLOCK_SIZE
+
+
+def test_disk_cache_counts_the_files_of_every_process(tmp_path):
+    root = tmp_path / 'cache'
+    other = DiskTileCache(str(root), max_bytes=8 * DISK_BLOCK_SIZE, trim_interval=3600)
+    cache = DiskTileCache(str(root), max_bytes=8 * DISK_BLOCK_SIZE, trim_interval=3600)
+    other._trimming = cache._trimming = True
+    for number in range(6):
+        other.put(f'other/{number}.png', b'x')
+        cache.put(f'mine/{number}.png', b'x')
+
+    cache.trim()
+
+    assert cache.stats()['entries'] == 7 and other.stats()['entries'] == 0
+
+
+def test_disk_cache_trims_in_the_background_after_writing_a_share_of_its_budget(tmp_path):
+    cache = DiskTileCache(str(tmp_path / 'cache'), max_bytes=16 * DISK_BLOCK_SIZE, trim_interval=3600)
+    for number in range(40):
+        cache.put(f'a/{number}.png', b'x')
+    deadline = time.monotonic() + 5
+    while cache.stats()['trims'] == 0 or cache._trimming:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    cache.trim()
+
+    assert len(os.listdir(tmp_path / 'cache' / 'a')) <= 16
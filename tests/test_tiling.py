@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip('osgeo')  # api.shared.tiling imports GDAL through api.shared.tools
+
+from api.shared.tiling import plan_levels
+
+IDENTITY = {'source_size': 10, 'source_mtime_ns': 1, 'source_sha256': 'abc'}
+OPTIONS = {'profile': 'mercator', 'resampling': 'average', 'nb_processes': 4, 'verbose': False}
+STABLE_OPTIONS = {'profile': 'mercator', 'resampling': 'average'}
+
+
+def manifest(first, last, requested=None, **changes):
+    return dict(IDENTITY, options=STABLE_OPTIONS, zoom=[first, last], requested_zoom=requested, **changes)
+
+
+def test_everything_is_rendered_without_a_matching_manifest():
+    assert plan_levels(None, IDENTITY, OPTIONS) == ([], None)
+    assert plan_levels(manifest(5, 10, source_sha256='old'), IDENTITY, OPTIONS) == ([], None)
+    assert plan_levels(dict(manifest(5, 10), options={'profile': 'geodetic'}), IDENTITY, OPTIONS) == ([], None)
+
+
+def test_runtime_options_do_not_invalidate_the_pyramid():
+    options = dict(OPTIONS, nb_processes=1, verbose=True)
+
+    assert plan_levels(manifest(5, 10), IDENTITY, options) == ([5, 6, 7, 8, 9, 10], [])
+
+
+def test_levels_chosen_by_gdal2tiles_are_rendered_again_once_a_range_was_requested():
+    assert plan_levels(manifest(5, 10, requested='5-10'), IDENTITY, OPTIONS)[1] is None
+
+
+def test_deeper_levels_also_render_the_previous_last_level():
+    kept, runs = plan_levels(manifest(5, 10, requested='5-10'), IDENTITY, dict(OPTIONS, zoom='5-12'))
+
+    assert kept == [5, 6, 7, 8, 9] and runs == [(10, 12)]
+
+
+def test_shallower_levels_are_rendered_alone():
+    kept, runs = plan_levels(manifest(5, 10, requested='5-10'), IDENTITY, dict(OPTIONS, zoom='3-10'))
+
+    assert kept == [5, 6, 7, 8, 9, 10] and runs == [(3, 4)]
+
+
+def test_levels_out_of_the_new_range_are_dropped():
+    kept, runs = plan_levels(manifest(5, 12, requested='5-12'), IDENTITY, dict(OPTIONS, zoom='7-10'))
+
+    assert kept == [7, 8, 9, 10] and runs == []
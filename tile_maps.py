@@ -0,0 +1,54 @@
+import os
+import json
+import argparse
+import configparser
+
+from api.shared.logs import create_log
+from api.shared.tiling import find_sources, tile_batch
+
+
+def main():
+    """
+    Tiles the GeoTIFFs of a bundle directory into the 'kml' directory of each volcano.
+    """
+    current_path = os.path.dirname(os.path.abspath(__file__))
+    config = configparser.ConfigParser()
+    config.read(os.path.join(current_path, 'config.ini'))
+
+    parser = argparse.ArgumentParser(description='Tile <volcano>/tifs/<map>.tif GeoTIFFs with gdal2tiles.')
+    parser.add_argument('source', nargs='?', default=os.path.join(current_path, config.get('paths', 'incoming')),
+                        help='Directory with the GeoTIFFs to tile, the configured incoming path by default.')
+    parser.add_argument('--volcano', action='append', help='Only tile this volcano (repeatable).')
+    parser.add_argument('--max-cores', type=int, default=config.getint('tiling', 'max_cores', fallback=1),
+                        help='Maximum number of cores used by the whole batch.')
+    parser.add_argument('--processes-per-file', type=int,
+                        default=config.getint('tiling', 'processes_per_file', fallback=1),
+                        help='Number of gdal2tiles processes per GeoTIFF.')
+    parser.add_argument('--archive', action=argparse.BooleanOptionalAction,
+                        default=config.getboolean('tiling', 'archive', fallback=False),
+                        help='Pack each pyramid into a single <map>.tiles archive.')
+    parser.add_argument('--cog', action=argparse.BooleanOptionalAction,
+                        default=config.getboolean('tiling', 'cog', fallback=False),
+                        help='Convert each GeoTIFF to a <map>.cog.tif rendered on demand instead of tiling it.')
+    args = parser.parse_args()
+    log = create_log()
+
+    volcanoes_path = os.path.join(current_path, config.get('paths', 'volcano'))
+    staging_root = os.path.join(current_path, config.get('paths', 'temp'), 'tiling')
+    zoom = config.get('tiling', 'zoom', fallback=None) or None
+    url = config.get('tiling', 'url', fallback=None) or None
+    jobs = find_sources(args.source, args.volcano)
+    if not jobs:
+        log.info(f"No GeoTIFFs found in {args.source}")
+        return
+    kwargs = {'url': url} if url else {}
+    results = tile_batch(jobs, volcanoes_path, args.max_cores, args.processes_per_file, staging_root=staging_root,
+                         zoom=zoom, archive=args.archive, cog=args.cog, **kwargs)
+
+    # Per-file wall time report
+    report_keys = ('volcano', 'map', 'source', 'output', 'seconds', 'levels', 'error')
+    print(json.dumps([{key: job.get(key) for key in report_keys} for job in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()